@@ -0,0 +1,64 @@
+"""
+False positive rates and lookup throughput of ScalableBloomFilter, and the
+cost of `has()` for blocks that are not stored with and without a
+FilteredBlockstore in front of a PackBlockstore.
+
+Usage (with the package installed): python bench/bloom_filter.py [keys]
+"""
+
+import sys
+import tempfile
+from time import perf_counter
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb.bloom import FilteredBlockstore, ScalableBloomFilter
+from ipld_dag_pb.pack import PackBlockstore
+
+
+def cids(start: int, stop: int) -> list[CID]:
+    return [
+        CID("base32", 1, "raw", multihash.digest(i.to_bytes(8, "big"), "sha2-256"))
+        for i in range(start, stop)
+    ]
+
+
+def per_second(n: int, seconds: float) -> str:
+    return f"{n / seconds:>12,.0f}"
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    present = cids(0, n)
+    absent = cids(n, 2 * n)
+
+    print(f"{n:,} keys")
+    print(f"{'error rate':<12} {'filters':>8} {'KiB':>8} {'expected fp':>12} {'measured fp':>12} {'lookups/s':>12}")
+    for error_rate in (0.01, 0.001, 0.0001):
+        bloom = ScalableBloomFilter(initial_capacity=n // 16, error_rate=error_rate)
+        bloom.update(cid.digest for cid in present)
+        digests = [cid.digest for cid in absent]
+        start = perf_counter()
+        false_positives = sum(digest in bloom for digest in digests)
+        elapsed = perf_counter() - start
+        print(
+            f"{error_rate:<12} {len(bloom.filters):>8} {bloom.size / 1024:>8.0f} "
+            f"{bloom.false_positive_rate:>12.5f} {false_positives / n:>12.5f} {per_second(n, elapsed)}"
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pack = PackBlockstore(tmp)
+        pack.put_many((cid, cid.digest) for cid in present)
+        pack.flush()
+        filtered = FilteredBlockstore.rebuild(pack)
+        print(f"\n{'has() for absent blocks':<28} {'lookups/s':>12}")
+        for label, store in (("PackBlockstore", pack), ("FilteredBlockstore", filtered)):
+            start = perf_counter()
+            for cid in absent:
+                store.has(cid)
+            print(f"{label:<28} {per_second(n, perf_counter() - start)}")
+        pack.close()
+
+
+if __name__ == "__main__":
+    main()
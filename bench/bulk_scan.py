@@ -0,0 +1,64 @@
+"""
+Throughput of collecting link columns (fanout, t_size) from many blocks with
+the vectorized and pure-Python bulk scanners, compared with decode_node() per
+block with and without the compiled accelerator.
+
+Usage (with the package installed): python bench/bulk_scan.py [BLOCKS]
+"""
+
+import random
+import sys
+from time import perf_counter
+
+from ipld_dag_pb import backend
+from ipld_dag_pb.arena import BlockArena
+from ipld_dag_pb.bulk import scan_links
+from ipld_dag_pb.decode import decode_node
+from ipld_dag_pb.util import create_link, create_node, cid_class
+
+
+def build(blocks: int) -> BlockArena:
+    rnd = random.Random(0)
+    cid = cid_class().decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+    links = [create_link(cid, "", rnd.randrange(2**18)) for _ in range(174)]
+    arena = BlockArena()
+    for i in range(blocks):
+        fanout = rnd.choice([0, 0, 0, 2, 10, 174])  # mostly leaves
+        arena.append(create_node(bytes(rnd.randrange(64)), links[:fanout] if i % 7 else []))
+    return arena
+
+
+def main() -> None:
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    arena = build(blocks)
+    buf = bytes(arena.view())
+    offsets = [offset for offset, _ in arena.index]
+    lengths = [length for _, length in arena.index]
+    print(f"{blocks} blocks, {len(buf) / 2**20:.1f} MiB")
+
+    speedups = backend.speedups
+    for name in ("native", "python"):
+        if name == "native" and speedups is None:
+            continue
+        backend.speedups = speedups if name == "native" else None
+        start = perf_counter()
+        total = 0
+        for offset, length in arena.index:
+            total += sum(l.t_size for l in decode_node(buf[offset : offset + length]).links)
+        report("decode_node " + name, perf_counter() - start, len(buf))
+    backend.speedups = speedups
+
+    for vectorized in (False, True):
+        start = perf_counter()
+        cols = scan_links(buf, offsets, lengths, vectorized=vectorized)
+        elapsed = perf_counter() - start
+        assert int(sum(cols.t_size)) == total
+        report("scan_links " + ("numpy" if vectorized else "python"), elapsed, len(buf))
+
+
+def report(name: str, elapsed: float, size: int) -> None:
+    print(f"{name:<24} {elapsed:>8.3f}s {size / elapsed / 2**20:>8.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
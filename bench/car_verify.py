@@ -0,0 +1,68 @@
+"""
+Throughput of verify_car over a generated CAR file of UnixFS-like chunks
+(256 KiB leaves under parents of 174 links), with worker processes and
+threads, in GB/s of blocks verified.
+
+Usage (with the package installed): python bench/car_verify.py [MiB]
+"""
+
+import os
+import sys
+import tempfile
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb import code, encode, prepare
+from ipld_dag_pb.car import encode_header
+from ipld_dag_pb.encode import encode_varint, sov
+from ipld_dag_pb.verify import verify_car
+
+chunk = 256 * 1024
+fanout = 174
+
+
+def section(cid: CID, block: bytes) -> bytes:
+    body = bytes(cid) + block
+    prefix = memoryview(bytearray(sov(len(body))))
+    encode_varint(prefix, len(prefix), len(body))
+    return bytes(prefix) + body
+
+
+def write_car(path: str, mib: int) -> None:
+    leaf = os.urandom(chunk)
+    with open(path, "wb") as f:
+        f.write(encode_header([]))
+        level: list[CID] = []
+        for i in range(mib * 1024 * 1024 // chunk):
+            block = i.to_bytes(8, "big") + leaf[8:]
+            cid = CID("base32", 1, "raw", multihash.digest(block, "sha2-256"))
+            f.write(section(cid, block))
+            level.append(cid)
+        while len(level) > 1:
+            parents = []
+            for start in range(0, len(level), fanout):
+                links = [{"hash": cid, "name": "", "t_size": chunk} for cid in level[start : start + fanout]]
+                block = bytes(encode(prepare({"data": b"\x08\x02", "links": links})))
+                cid = CID("base32", 1, code, multihash.digest(block, "sha2-256"))
+                f.write(section(cid, block))
+                parents.append(cid)
+            level = parents
+
+
+def main() -> None:
+    mib = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.car")
+        write_car(path, mib)
+        print(f"{mib} MiB CAR, {os.cpu_count()} CPUs")
+        print(f"{'workers':<20} {'seconds':>8} {'GB/s':>8}")
+        for jobs in (1, 2, 4, 8):
+            for threads in (False, True) if jobs > 1 else (False,):
+                report = verify_car(path, jobs=jobs, threads=threads)
+                assert report.ok
+                label = f"{jobs} {'threads' if threads else 'processes'}" if jobs > 1 else "1 (in process)"
+                print(f"{label:<20} {report.seconds:>8.2f} {report.size / report.seconds / 1e9:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Time taken to reject oversized and link-heavy blocks with and without
+DecodeLimits. With limits an oversized block is rejected in constant time, and
+a link-heavy one after at most `max_links` links, whatever its size.
+
+Usage (with the package installed): python bench/decode_limits.py [--pure-python]
+"""
+
+import sys
+from timeit import timeit
+from typing import Optional
+
+from ipld_dag_pb import backend
+from ipld_dag_pb.decode import DecodeLimits, decode_node
+from ipld_dag_pb.encode import encode_node
+from ipld_dag_pb.node import RawPBNode
+
+limits = DecodeLimits(max_block_size=2 * 2**20, max_links=1000, max_name_length=255)
+
+
+def attempt(buf: bytes, limits_: Optional[DecodeLimits]) -> None:
+    try:
+        decode_node(buf, limits=limits_)
+    except ValueError:
+        pass
+
+
+def per_call_us(buf: bytes, limits_: Optional[DecodeLimits], number: int) -> float:
+    return timeit(lambda: attempt(buf, limits_), number=number) / number * 1e6
+
+
+def main() -> None:
+    if "--pure-python" in sys.argv:
+        backend.speedups = None
+    print("backend:", backend.name() if backend.speedups else "python")
+    print(f"{'input':<26} {'unbounded us':>14} {'limited us':>12}")
+    for mib in (1, 4, 16, 64):
+        node = RawPBNode()
+        node.data = bytes(mib * 2**20)
+        inputs = {
+            f"{mib} MiB Data": bytes(encode_node(node)),
+            f"{mib} MiB of empty links": b"\x12\x00" * (mib * 2**19),
+        }
+        for name, buf in inputs.items():
+            number = 3 if mib >= 16 else 10
+            print(
+                f"{name:<26} {per_call_us(buf, None, number):>14.1f} "
+                f"{per_call_us(buf, limits, number):>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
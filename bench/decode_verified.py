@@ -0,0 +1,52 @@
+"""
+Time taken to hash and decode blocks of various sizes, separately (hashing
+with multiformats, then decoding) and with decode_verified, and a batch of
+blocks with decode_verified_many.
+
+Usage (with the package installed): python bench/decode_verified.py [--pure-python]
+"""
+
+import sys
+from timeit import timeit
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb import backend, code, decode, encode, prepare
+from ipld_dag_pb.verify import decode_verified, decode_verified_many
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+
+def block(size: int, links: int) -> tuple[bytes, CID]:
+    node = {"data": bytes(range(256)) * (size // 256), "links": [{"hash": a_cid, "name": f"{i:08}"} for i in range(links)]}
+    buf = bytes(encode(prepare(node)))
+    return buf, CID("base32", 1, code, multihash.digest(buf, "sha2-256"))
+
+
+def separately(buf: bytes, cid: CID) -> None:
+    if multihash.digest(buf, "sha2-256") != cid.digest:
+        raise ValueError("mismatch")
+    decode(buf)
+
+
+def main() -> None:
+    if "--pure-python" in sys.argv:
+        backend.speedups = None
+    print("backend:", backend.name() if backend.speedups else "python")
+    print(f"{'block':<22} {'separate us':>12} {'verified us':>12}")
+    for kib, links in ((4, 0), (256, 0), (1024, 16), (4096, 64)):
+        buf, cid = block(kib * 1024, links)
+        number = max(10, 20000 // kib)
+        before = timeit(lambda: separately(buf, cid), number=number) / number * 1e6
+        after = timeit(lambda: decode_verified(buf, cid), number=number) / number * 1e6
+        print(f"{f'{kib} KiB, {links} links':<22} {before:>12.1f} {after:>12.1f}")
+
+    blocks = [block(1024 * 1024, 16) for _ in range(64)]
+    print(f"\n{'64 x 1 MiB blocks':<22} {'ms':>12}")
+    for workers in (1, 2, 4, 8):
+        ms = timeit(lambda: decode_verified_many(blocks, workers=workers), number=5) / 5 * 1e3
+        print(f"{f'{workers} workers':<22} {ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Cost of re-encoding and hashing a directory node each time it is needed,
+against a FrozenPBNode that does both once, and of comparing nodes.
+
+Usage (with the package installed): python bench/frozen_node.py [links]
+"""
+
+import sys
+from timeit import timeit
+from typing import Callable
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb import code, encode, prepare
+from ipld_dag_pb.frozen import FrozenPBNode
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+
+def per_call_us(fn: Callable[[], object], number: int = 2000) -> float:
+    return timeit(fn, number=number) / number * 1e6
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    links = [{"hash": a_cid, "name": f"file-{i:06}", "t_size": i} for i in range(n)]
+    node = prepare({"data": b"\x08\x01", "links": links})
+    other = prepare({"data": b"\x08\x01", "links": links})
+    frozen = FrozenPBNode.from_node(node)
+    frozen_other = FrozenPBNode.from_node(other)
+    frozen.cid, frozen_other.cid  # pylint: disable=pointless-statement
+
+    print(f"{n} links")
+    cases: list[tuple[str, Callable[[], object]]] = [
+        ("encode(node)", lambda: encode(node)),
+        ("frozen.encoded", lambda: frozen.encoded),
+        ("CID of encode(node)", lambda: CID("base32", 1, code, multihash.digest(encode(node), "sha2-256"))),
+        ("frozen.cid", lambda: frozen.cid),
+        ("node == other", lambda: node == other),
+        ("frozen == frozen_other", lambda: frozen == frozen_other),
+    ]
+    print(f"{'':<24} {'us':>10}")
+    for label, fn in cases:
+        print(f"{label:<24} {per_call_us(fn):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
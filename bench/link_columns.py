@@ -0,0 +1,53 @@
+"""
+Time taken to build the links of a directory from (name, cid, size) rows
+through prepare() with a dict per link, and with links_from_columns(), with
+the CIDs given as CID objects and as binary CIDs.
+
+Usage (with the package installed): python bench/link_columns.py [links]
+"""
+
+import gc
+import random
+import sys
+from time import perf_counter
+from typing import Callable
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb import prepare
+from ipld_dag_pb.util import links_from_columns
+
+
+def timed(fn: Callable[[], object]) -> float:
+    # like timeit, without collections over the previous runs' garbage
+    gc.collect()
+    gc.disable()
+    try:
+        start = perf_counter()
+        fn()
+        return perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    names = [f"file-{i:08}" for i in range(n)]
+    random.Random(0).shuffle(names)
+    cids = [CID("base32", 1, "raw", multihash.digest(name.encode(), "sha2-256")) for name in names]
+    binary = [bytes(cid) for cid in cids]
+    sizes = list(range(n))
+
+    print(f"{n:,} links")
+    print(f"{'':<36} {'CID objects s':>14} {'binary CIDs s':>14}")
+    prepared = [
+        timed(lambda: prepare({"links": [{"hash": c, "name": m, "t_size": s} for c, m, s in zip(hashes, names, sizes)]}))
+        for hashes in (cids, binary)
+    ]
+    print(f"{'prepare() with link dicts':<36} {prepared[0]:>14.2f} {prepared[1]:>14.2f}")
+    columns = [timed(lambda: links_from_columns(names, hashes, sizes)) for hashes in (cids, binary)]
+    print(f"{'links_from_columns()':<36} {columns[0]:>14.2f} {columns[1]:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
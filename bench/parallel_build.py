@@ -0,0 +1,54 @@
+"""
+Time taken to import a large synthetic file into the balanced UnixFS layout
+(256 KiB raw leaves, 174 links per node) with the sequential build_file and
+with build_file_parallel on worker processes and threads, checking that every
+run produces the same root. Only the root is computed (no blockstore), so the
+times are those of hashing, building and encoding.
+
+Usage (with the package installed): python bench/parallel_build.py [GiB]
+"""
+
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from ipld_dag_pb.unixfs import build_file, build_file_parallel
+
+
+def write_input(path: str, gib: float) -> int:
+    block = os.urandom(64 * 2**20)
+    size = int(gib * 2**30)
+    with open(path, "wb") as f:
+        for offset in range(0, size, len(block)):
+            # vary each block so that leaves do not repeat
+            f.write(offset.to_bytes(8, "big") + block[8 : min(len(block), size - offset)])
+    return size
+
+
+def main() -> None:
+    gib = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "input")
+        size = write_input(path, gib)
+        print(f"{gib:g} GiB input, {os.cpu_count()} CPUs")
+        print(f"{'builder':<24} {'seconds':>8} {'GB/s':>8}")
+
+        start = perf_counter()
+        with open(path, "rb") as f:
+            root = build_file(f)
+        elapsed = perf_counter() - start
+        print(f"{'sequential':<24} {elapsed:>8.2f} {size / elapsed / 1e9:>8.2f}")
+
+        for jobs in (2, 4, 8):
+            for threads in (False, True):
+                start = perf_counter()
+                assert build_file_parallel(path, jobs=jobs, threads=threads) == root
+                elapsed = perf_counter() - start
+                label = f"{jobs} {'threads' if threads else 'processes'}"
+                print(f"{label:<24} {elapsed:>8.2f} {size / elapsed / 1e9:>8.2f}")
+        print("root:", root)
+
+
+if __name__ == "__main__":
+    main()
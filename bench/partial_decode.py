@@ -0,0 +1,44 @@
+"""
+Time taken to list one page of links, or to read only the Data, of a
+directory node with many links, with a full decode and with partial decodes.
+
+Usage (with the package installed): python bench/partial_decode.py [links] [--pure-python]
+"""
+
+import sys
+from timeit import timeit
+from typing import Callable
+
+from multiformats import CID
+
+from ipld_dag_pb import backend, decode, encode, prepare
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+
+def per_call_ms(fn: Callable[[], object], number: int) -> float:
+    return timeit(fn, number=number) / number * 1e3
+
+
+def main() -> None:
+    if "--pure-python" in sys.argv:
+        backend.speedups = None
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    n = int(args[0]) if args else 100_000
+    links = [{"hash": a_cid, "name": f"file-{i:08}", "t_size": i} for i in range(n)]
+    buf = bytes(encode(prepare({"data": b"\x08\x01", "links": links})))
+    page = slice(n // 2, n // 2 + 100)
+
+    print("backend:", backend.name() if backend.speedups else "python")
+    print(f"{n:,} links, {len(buf) / 2**20:.1f} MiB")
+    print(f"{'':<32} {'ms':>10}")
+    cases: list[tuple[str, Callable[[], object], int]] = [
+        ("decode(buf).links[page]", lambda: decode(buf).links[page], 1),
+        ("decode(buf, link_slice=page)", lambda: decode(buf, link_slice=page), 20),
+        ("decode(buf, fields='data')", lambda: decode(buf, fields="data"), 20),
+    ]
+    for label, fn, number in cases:
+        print(f"{label:<32} {per_call_ms(fn, number):>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Time taken to fan the decoding of a batch of directory blocks out to worker
+processes and collect each block's links, passing decoded nodes back from
+the workers (pickling every CID) and with map_nodes, which passes the
+blocks through shared memory and returns only the binary link CIDs.
+
+Usage (with the package installed): python bench/shared_memory.py [blocks] [processes]
+"""
+
+import multiprocessing
+import sys
+from time import perf_counter
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb import PBNode, decode, encode, prepare
+from ipld_dag_pb.shared import map_nodes
+
+
+def directory(i: int) -> bytes:
+    links = [
+        {"hash": CID("base32", 1, "raw", multihash.digest(f"{i}/{j}".encode(), "sha2-256")), "name": f"{j:04}"}
+        for j in range(64)
+    ]
+    return bytes(encode(prepare({"data": b"\x08\x01", "links": links})))
+
+
+def binary_links(node: PBNode) -> list[bytes]:
+    return [bytes(link.hash) for link in node.links]
+
+
+def decode_copy(block: bytes) -> PBNode:
+    return decode(block, copy=True)
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    blocks = [directory(i) for i in range(n)]
+    print(f"{n:,} blocks of 64 links, {processes} processes")
+    print(f"{'':<34} {'s':>8}")
+
+    start = perf_counter()
+    expected = [binary_links(decode(block)) for block in blocks]
+    print(f"{'in process':<34} {perf_counter() - start:>8.2f}")
+
+    start = perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        nodes = pool.map(decode_copy, blocks, chunksize=max(1, n // (processes * 4)))
+    assert [binary_links(node) for node in nodes] == expected
+    print(f"{'Pool.map(decode), pickled nodes':<34} {perf_counter() - start:>8.2f}")
+
+    start = perf_counter()
+    assert map_nodes(binary_links, blocks, processes) == expected
+    print(f"{'map_nodes(), shared memory':<34} {perf_counter() - start:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
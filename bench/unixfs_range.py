@@ -0,0 +1,101 @@
+"""
+Random aligned 4 KiB reads from a 10 GiB UnixFS file, seeking with UnixFSFile's
+prefix-sum index versus walking each node's links from the start.
+
+The file is synthetic: 256 KiB raw leaves under nodes of 174 links (the
+go-ipfs defaults), with every leaf the same block so that the whole DAG fits
+in a few hundred blocks of memory.
+
+Usage (with the package installed): python bench/unixfs_range.py [--pure-python]
+"""
+
+import random
+import sys
+from time import perf_counter
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb import PBLink, PBNode, backend, code, decode, encode
+from ipld_dag_pb.blockstore import MemoryBlockstore
+from ipld_dag_pb.unixfs import UnixFSFile, decode_data, encode_data, type_file
+
+file_size = 10 * 2**30
+chunk = 256 * 1024
+fanout = 174
+read_size = 4096
+
+
+def put(store: MemoryBlockstore, block: bytes, codec: object = code) -> CID:
+    cid = CID("base32", 1, codec, multihash.digest(block, "sha2-256"))
+    store.put(cid, block)
+    return cid
+
+
+def build(store: MemoryBlockstore) -> tuple[CID, int]:
+    leaf = bytes(random.Random(0).randbytes(chunk))
+    level = [(put(store, leaf, "raw"), chunk)] * (file_size // chunk)
+    depth = 1
+    while len(level) > 1:
+        parents = []
+        for i in range(0, len(level), fanout):
+            children = level[i : i + fanout]
+            sizes = [size for _, size in children]
+            data = encode_data(type_file, None, sum(sizes), sizes)
+            node = PBNode(data, [PBLink(cid, "", size) for cid, size in children])
+            parents.append((put(store, bytes(encode(node))), sum(sizes)))
+        level = parents
+        depth += 1
+    return level[0][0], depth
+
+
+def linear_read(store: MemoryBlockstore, cid: CID, offset: int, length: int) -> bytes:
+    """
+    The baseline: decode every node and sum child sizes from the first link.
+    Only reads within one leaf, which aligned reads always are.
+    """
+    while cid.codec.code == code:
+        node = decode(store.get(cid))
+        sizes = decode_data(node.data).blocksizes
+        for link, size in zip(node.links, sizes):
+            if offset < size:
+                break
+            offset -= size
+        cid = link.hash
+    return bytes(store.get(cid)[offset : offset + length])
+
+
+def main() -> None:
+    if "--pure-python" in sys.argv:
+        backend.speedups = None
+    print("backend:", backend.name() if backend.speedups else "python")
+    store = MemoryBlockstore()
+    root, depth = build(store)
+    print(f"{file_size / 2**30:.0f} GiB file, depth {depth}, {len(store)} distinct blocks")
+
+    rng = random.Random(1)
+    offsets = [rng.randrange(0, file_size // read_size) * read_size for _ in range(20000)]
+    cached = UnixFSFile(store.get, root)
+    uncached = UnixFSFile(store.get, root, cache_size=0)
+    for f in (cached, uncached):
+        assert f.size == file_size
+        for offset in offsets[:20]:
+            assert f.read(offset, read_size) == linear_read(store, root, offset, read_size)
+
+    print(f"{'method':<28} {'reads/s':>10} {'decodes/read':>13}")
+    for label, read, counter, count in (
+        # the baseline decodes every link's CID, so time fewer reads
+        ("linear scan", lambda o: linear_read(store, root, o, read_size), None, 100),
+        ("index, no cache", lambda o: uncached.read(o, read_size), uncached, 2000),
+        ("index, cached", lambda o: cached.read(o, read_size), cached, 20000),
+    ):
+        before = counter.decoded if counter else 0
+        start = perf_counter()
+        for offset in offsets[:count]:
+            read(offset)
+        elapsed = perf_counter() - start
+        decodes = (counter.decoded - before) / count if counter else depth - 1
+        print(f"{label:<28} {count / elapsed:>10.0f} {decodes:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
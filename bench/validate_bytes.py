@@ -0,0 +1,46 @@
+"""
+Throughput of checking that blocks are canonical with validate_bytes() versus
+decoding, re-encoding and comparing them.
+
+Usage (with the package installed): python bench/validate_bytes.py [--pure-python]
+"""
+
+import sys
+from timeit import timeit
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb import backend, code, decode, encode, prepare, validate_bytes
+
+
+def directory(entries: int) -> bytes:
+    cid = CID("base32", 1, code, multihash.digest(b"leaf", "sha2-256"))
+    links = [
+        {"hash": cid, "name": f"file-{i:06d}", "t_size": 1024 * i} for i in range(entries)
+    ]
+    return bytes(encode(prepare({"data": b"\x08\x01", "links": links})))
+
+
+def reencode(buf: bytes) -> None:
+    assert bytes(encode(decode(buf, copy=True))) == buf
+
+
+def main() -> None:
+    if "--pure-python" in sys.argv:
+        backend.speedups = None
+    print("backend:", backend.name() if backend.speedups else "python")
+    print(f"{'block':<22} {'re-encode MB/s':>15} {'validate_bytes MB/s':>20}")
+    for entries in (10, 100, 1000, 10000):
+        buf = directory(entries)
+        number = max(1, 200000 // entries)
+        slow_number = max(1, number // 10)
+        slow = timeit(lambda: reencode(buf), number=slow_number) / slow_number
+        fast = timeit(lambda: validate_bytes(buf), number=number) / number
+        print(
+            f"{entries:>5} links, {len(buf):>7} B "
+            f"{len(buf) / slow / 1e6:>15.1f} {len(buf) / fast / 1e6:>20.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
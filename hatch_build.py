@@ -0,0 +1,55 @@
+"""
+Builds the optional `ipld_dag_pb._speedups` C extension into wheels. The build
+is best-effort: without a working compiler the wheel stays pure-Python, which
+is fully functional. Set IPLD_DAG_PB_PURE_PYTHON=1 to skip it.
+
+Run `python hatch_build.py` to build the extension in place for development.
+"""
+
+import os
+import sys
+import tempfile
+from typing import Any
+
+EXTENSION = "ipld_dag_pb._speedups"
+SOURCES = ["ipld_dag_pb/_speedups.c"]
+
+
+def build_extension(build_lib: str, inplace: bool = False) -> str:
+    from setuptools import Distribution, Extension
+    from setuptools.command.build_ext import build_ext
+
+    dist = Distribution({"name": "ipld_dag_pb", "ext_modules": [Extension(EXTENSION, SOURCES)]})
+    cmd = build_ext(dist)
+    cmd.build_lib = build_lib
+    cmd.build_temp = os.path.join(build_lib, "temp")
+    cmd.inplace = inplace
+    cmd.ensure_finalized()
+    cmd.run()
+    return str(cmd.get_ext_fullpath(EXTENSION))
+
+
+try:
+    from hatchling.builders.hooks.plugin.interface import BuildHookInterface
+except ImportError:  # only needed when building wheels
+    BuildHookInterface = object  # type: ignore[assignment,misc]
+
+
+class SpeedupsBuildHook(BuildHookInterface):  # type: ignore[misc]
+    def initialize(self, version: str, build_data: dict[str, Any]) -> None:
+        if self.target_name != "wheel" or os.environ.get("IPLD_DAG_PB_PURE_PYTHON"):
+            return
+        build_lib = tempfile.mkdtemp(prefix="ipld_dag_pb_build_")
+        try:
+            path = build_extension(build_lib)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"ipld_dag_pb: not building C accelerator ({e})", file=sys.stderr)
+            return
+        build_data["force_include"][path] = "ipld_dag_pb/" + os.path.basename(path)
+        build_data["pure_python"] = False
+        build_data["infer_tag"] = True
+
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    print(build_extension("build", inplace=True))
@@ -1,56 +1,123 @@
-from typing import Final
-from multiformats import CID
+from time import perf_counter_ns
+from typing import Any, Final, Optional
+from . import metrics
 from .node import BytesLike, PBLink, PBNode, RawPBLink, RawPBNode
-from .encode import encode_node
-from .decode import decode_node
-from .util import validate, prepare
+from .encode import encode_into as _encode_into, encode_node
+from .decode import DecodeLimits, decode_node, validate_bytes
+from .util import cid_class, validate, prepare
+from ._convert import from_raw as _from_raw, to_raw as _to_raw
 
 name: Final = "dag-pb"
 code: Final = 0x70
 
 
 def encode(node: PBNode) -> memoryview:
-    validate(node)
-    pbn = RawPBNode()
-
-    links: list[RawPBLink] = []
-    for l in node.links:
-        link = RawPBLink()
-        link.hash = bytes(l.hash)
-        if l.name is not None:
-            link.name = l.name
-        if l.t_size is not None:
-            link.t_size = l.t_size
-        links.append(link)
-    if len(links) > 0:
-        pbn.links = links
-
-    if node.data is not None:
-        pbn.data = node.data
-
-    return encode_node(pbn)
-
-
-def decode(buf: BytesLike) -> PBNode:
-    pbn = decode_node(buf)
-    data = None
-    if hasattr(pbn, "data"):
-        data = pbn.data
-    node = PBNode(data)
-
-    if hasattr(pbn, "links"):
-        links: list[PBLink] = []
-        for l in pbn.links:
-            if not hasattr(l, "hash"):
-                raise TypeError("Invalid Hash field found in link, expected CID")
-            link = PBLink(CID.decode(l.hash))
-
-            if hasattr(l, "name"):
-                link.name = l.name
-            if hasattr(l, "t_size"):
-                link.t_size = l.t_size
-
-            links.append(link)
-        node.links = links
+    if not metrics.enabled:
+        return _encode(node)
 
+    start = perf_counter_ns()
+    try:
+        buf = _encode(node)
+    except Exception:
+        metrics.record_error("encode")
+        raise
+    duration = perf_counter_ns() - start
+    data_size, links_size = metrics.section_sizes(len(buf), node.data)
+    metrics.record(
+        metrics.CodecEvent(
+            "encode", len(buf), data_size, links_size, len(node.links), duration
+        )
+    )
+    return buf
+
+
+def decode(
+    buf: BytesLike,
+    copy: bool = False,
+    limits: Optional[DecodeLimits] = None,
+    fields: Optional[str] = None,
+    link_slice: Optional[slice] = None,
+) -> PBNode:
+    """
+    Decodes a DAG-PB block. The returned node's `data` is a memoryview into
+    `buf` rather than a copy, so `buf` must not be modified while the node is in
+    use. Pass `copy=True` to get `data` as independent bytes instead, and
+    `limits` to bound the work done on untrusted blocks.
+
+    Pass `fields="data"` or `fields="links"` to decode only that part of the
+    node, and `link_slice` (e.g. `slice(100, 200)`) to decode only some of the
+    links; the rest of the block is still checked but no objects are created
+    for it. The node is then `partial` and encoding it raises TypeError.
+    """
+    if not metrics.enabled:
+        return _decode(buf, copy, limits, fields, link_slice)
+
+    start = perf_counter_ns()
+    try:
+        # with fields="links" the data is still sliced out (a view, unless
+        # copying) so that its section can be measured
+        node = _decode(buf, copy, limits, None if fields == "links" else fields, link_slice)
+    except Exception:
+        metrics.record_error("decode")
+        raise
+    duration = perf_counter_ns() - start
+    data_size, links_size = metrics.section_sizes(len(buf), node.data)
+    if fields == "links":
+        node.data = None
+        node.partial = True
+    metrics.record(
+        metrics.CodecEvent(
+            "decode", len(buf), data_size, links_size, len(node.links), duration
+        )
+    )
+    return node
+
+
+def encode_into(node: PBNode, buf: Any, offset: int = 0) -> int:
+    """
+    Encodes a PBNode into the writable buffer `buf` (e.g. a `bytearray`, `mmap`
+    or pooled buffer from :mod:`ipld_dag_pb.buffers`) starting at `offset`, and
+    returns the number of bytes written. Raises ValueError if it does not fit.
+    """
+    if not metrics.enabled:
+        return _encode_into(_to_raw(node), buf, offset)
+
+    start = perf_counter_ns()
+    try:
+        size = _encode_into(_to_raw(node), buf, offset)
+    except Exception:
+        metrics.record_error("encode")
+        raise
+    duration = perf_counter_ns() - start
+    data_size, links_size = metrics.section_sizes(size, node.data)
+    metrics.record(
+        metrics.CodecEvent("encode", size, data_size, links_size, len(node.links), duration)
+    )
+    return size
+
+
+def _encode(node: PBNode) -> memoryview:
+    return encode_node(_to_raw(node))
+
+
+def _decode(
+    buf: BytesLike,
+    copy: bool = False,
+    limits: Optional[DecodeLimits] = None,
+    fields: Optional[str] = None,
+    link_slice: Optional[slice] = None,
+) -> PBNode:
+    if limits is not None:
+        limits.check_block_size(len(buf))  # before copying
+    # slices of a memoryview share its memory, slices of bytes are copies
+    pbn = decode_node(
+        bytes(buf) if copy else memoryview(buf),
+        keep_records=True,
+        limits=limits,
+        fields=fields,
+        link_slice=link_slice,
+    )
+    node = _from_raw(pbn)
+    if fields is not None or link_slice is not None:
+        node.partial = True
     return node
@@ -0,0 +1,66 @@
+"""
+Conversion between the PBNode and RawPBNode layers, shared by the encode and
+decode entry points and the modules that encode or decode nodes themselves.
+"""
+
+from .node import PBLink, PBNode, RawPBLink, RawPBNode
+from .util import decode_binary_cid, validate
+
+
+def to_raw(node: PBNode) -> RawPBNode:
+    validate(node)
+    pbn = RawPBNode()
+
+    links: list[RawPBLink] = []
+    for l in node.links:
+        link = RawPBLink()
+        record = getattr(l, "_record", None)
+        if (
+            record is not None
+            and record[0] is l.hash
+            and record[1] == l.name
+            and record[2] == l.t_size
+        ):
+            # unchanged since it was decoded, reuse the original encoding
+            link.record = record[3]
+            links.append(link)
+            continue
+        link.hash = bytes(l.hash)
+        if l.name is not None:
+            link.name = l.name
+        if l.t_size is not None:
+            link.t_size = l.t_size
+        links.append(link)
+    if len(links) > 0:
+        pbn.links = links
+
+    if node.data is not None:
+        pbn.data = node.data
+
+    return pbn
+
+
+def from_raw(pbn: RawPBNode) -> PBNode:
+    data = None
+    if hasattr(pbn, "data"):
+        data = pbn.data
+    node = PBNode(data)
+
+    if hasattr(pbn, "links"):
+        links: list[PBLink] = []
+        for l in pbn.links:
+            if not hasattr(l, "hash"):
+                raise TypeError("Invalid Hash field found in link, expected CID")
+            link = PBLink(decode_binary_cid(bytes(l.hash)))
+
+            if hasattr(l, "name"):
+                link.name = l.name
+            if hasattr(l, "t_size"):
+                link.t_size = l.t_size
+            if hasattr(l, "record"):
+                link._record = (link.hash, link.name, link.t_size, l.record)
+
+            links.append(link)
+        node.links = links
+
+    return node
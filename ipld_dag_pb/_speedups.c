@@ -0,0 +1,1595 @@
+/*
+ * Optional compiled versions of the DAG-PB codec hot paths.
+ *
+ * Each function mirrors its pure-Python counterpart in decode.py, encode.py
+ * and util.py: the same checks in the same order, the same exception types and
+ * messages, and byte-identical output. Inputs that the Python implementation
+ * handles in an unusual way (non-byte buffers, exotic integers, encoding
+ * errors) are not handled here: the function returns NotImplemented and the
+ * caller falls back to the Python implementation.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+#if PY_VERSION_HEX < 0x030A0000
+static inline PyObject *
+Py_NewRef(PyObject *obj)
+{
+    Py_INCREF(obj);
+    return obj;
+}
+#endif
+
+static PyObject *RawPBLink_type;
+static PyObject *RawPBNode_type;
+
+static PyObject *str_hash;
+static PyObject *str_name;
+static PyObject *str_t_size;
+static PyObject *str_record;
+static PyObject *str_data;
+static PyObject *str_links;
+
+/* t_size values at or above this are left to the Python encoder. */
+#define MAX_NATIVE_TSIZE ((uint64_t)1 << 53)
+
+/*
+ * Returns 1 and fills `view` if `obj` is a flat byte buffer that can be handled
+ * natively, 0 if the caller should fall back to Python, -1 on error.
+ */
+static int
+get_flat_buffer(PyObject *obj, Py_buffer *view)
+{
+    if (PyMemoryView_Check(obj)) {
+        Py_buffer *b = PyMemoryView_GET_BUFFER(obj);
+        if (b->buf == NULL && b->obj == NULL) {
+            return 0; /* released, let Python raise */
+        }
+        if (b->itemsize != 1 || b->ndim != 1 ||
+            (b->format != NULL && strcmp(b->format, "B") != 0) ||
+            !PyBuffer_IsContiguous(b, 'C')) {
+            return 0;
+        }
+    }
+    else if (!PyBytes_Check(obj) && !PyByteArray_Check(obj)) {
+        return 0;
+    }
+    if (PyObject_GetBuffer(obj, view, PyBUF_SIMPLE) < 0) {
+        return -1;
+    }
+    return 1;
+}
+
+static int
+is_byteslike(PyObject *obj)
+{
+    return PyBytes_Check(obj) || PyByteArray_Check(obj) ||
+           PyMemoryView_Check(obj);
+}
+
+/* Like hasattr(): returns a new reference, or NULL with no error set. */
+static PyObject *
+get_optional_attr(PyObject *obj, PyObject *name, int *err)
+{
+    PyObject *value = PyObject_GetAttr(obj, name);
+    if (value == NULL) {
+        if (PyErr_ExceptionMatches(PyExc_AttributeError)) {
+            PyErr_Clear();
+        }
+        else {
+            *err = 1;
+        }
+    }
+    return value;
+}
+
+/* ---------------------------------------------------------------- decode */
+
+/* Mirrors decode.decode_varint(). `hi` receives bits 64 and above. */
+static int
+read_varint(const unsigned char *buf, Py_ssize_t len, Py_ssize_t *offset,
+            uint64_t *lo, unsigned int *hi)
+{
+    uint64_t v = 0;
+    unsigned int h = 0;
+    unsigned int shift = 0;
+    Py_ssize_t i = *offset;
+
+    for (;;) {
+        uint64_t bits;
+        unsigned char b;
+
+        if (shift >= 64) {
+            PyErr_SetString(PyExc_OverflowError, "protobuf: varint overflow");
+            return -1;
+        }
+        if (i >= len) {
+            PyErr_SetString(PyExc_EOFError, "protobuf: unexpected end of data");
+            return -1;
+        }
+
+        b = buf[i++];
+        bits = b & 0x7F;
+        v |= bits << shift;
+        if (shift == 63) {
+            h = (unsigned int)(bits >> 1);
+        }
+
+        if (b < 0x80) {
+            break;
+        }
+        shift += 7;
+    }
+
+    *offset = i;
+    *lo = v;
+    *hi = h;
+    return 0;
+}
+
+static PyObject *
+varint_to_long(uint64_t lo, unsigned int hi)
+{
+    PyObject *high, *shift, *shifted, *low, *result;
+
+    if (hi == 0) {
+        return PyLong_FromUnsignedLongLong(lo);
+    }
+
+    high = PyLong_FromUnsignedLong(hi);
+    shift = PyLong_FromLong(64);
+    low = PyLong_FromUnsignedLongLong(lo);
+    shifted = (high && shift) ? PyNumber_Lshift(high, shift) : NULL;
+    result = (shifted && low) ? PyNumber_Or(shifted, low) : NULL;
+    Py_XDECREF(high);
+    Py_XDECREF(shift);
+    Py_XDECREF(low);
+    Py_XDECREF(shifted);
+    return result;
+}
+
+/* str(field_num) for error messages, where field_num = varint >> 3. */
+static PyObject *
+field_num_to_long(uint64_t lo, unsigned int hi)
+{
+    PyObject *value, *three, *result;
+
+    if (hi == 0) {
+        return PyLong_FromUnsignedLongLong(lo >> 3);
+    }
+
+    value = varint_to_long(lo, hi);
+    three = PyLong_FromLong(3);
+    result = (value && three) ? PyNumber_Rshift(value, three) : NULL;
+    Py_XDECREF(value);
+    Py_XDECREF(three);
+    return result;
+}
+
+static void
+raise_field_num(PyObject *exc, const char *msg, uint64_t lo, unsigned int hi)
+{
+    PyObject *field_num = field_num_to_long(lo, hi);
+    if (field_num != NULL) {
+        PyErr_Format(exc, "%s%S", msg, field_num);
+        Py_DECREF(field_num);
+    }
+}
+
+/* Mirrors decode.decode_bytes() but returns the bounds instead of a slice. */
+static int
+read_bytes(const unsigned char *buf, Py_ssize_t len, Py_ssize_t *offset,
+           Py_ssize_t *start, Py_ssize_t *end)
+{
+    uint64_t n;
+    unsigned int hi;
+
+    if (read_varint(buf, len, offset, &n, &hi) < 0) {
+        return -1;
+    }
+    if (hi != 0 || n > (uint64_t)(len - *offset)) {
+        PyErr_SetString(PyExc_EOFError, "protobuf: unexpected end of data");
+        return -1;
+    }
+
+    *start = *offset;
+    *end = *offset + (Py_ssize_t)n;
+    *offset = *end;
+    return 0;
+}
+
+/*
+ * Mirrors decode._check_length(): raises if the length prefix at `offset`
+ * exceeds `limit` (-1 for no limit), without consuming it.
+ */
+static int
+check_length(const unsigned char *buf, Py_ssize_t len, Py_ssize_t offset,
+             Py_ssize_t limit, const char *what)
+{
+    uint64_t n;
+    unsigned int hi;
+
+    if (limit < 0) {
+        return 0;
+    }
+    if (read_varint(buf, len, &offset, &n, &hi) < 0) {
+        return -1;
+    }
+    if (hi != 0 || n > (uint64_t)limit) {
+        PyObject *value = varint_to_long(n, hi);
+        if (value != NULL) {
+            PyErr_Format(PyExc_ValueError,
+                         "protobuf: (PBLink) %s length %S exceeds limit of %zd bytes",
+                         what, value, limit);
+            Py_DECREF(value);
+        }
+        return -1;
+    }
+    return 0;
+}
+
+/* buf[start:end] with the same type as slicing `src` in Python. */
+static PyObject *
+slice(PyObject *src, const char *base, Py_ssize_t start, Py_ssize_t end)
+{
+    if (PyBytes_Check(src)) {
+        return PyBytes_FromStringAndSize(base + start, end - start);
+    }
+    if (PyByteArray_Check(src)) {
+        return PyByteArray_FromStringAndSize(base + start, end - start);
+    }
+    return PySequence_GetSlice(src, start, end);
+}
+
+static int
+set_attr_steal(PyObject *obj, PyObject *name, PyObject *value)
+{
+    int r;
+    if (value == NULL) {
+        return -1;
+    }
+    r = PyObject_SetAttr(obj, name, value);
+    Py_DECREF(value);
+    return r;
+}
+
+/* Whether the varint at buf[start:end] has no redundant trailing groups. */
+#define VARINT_MINIMAL(buf, start, end) \
+    ((end) - (start) <= 1 || (buf)[(end) - 1] != 0)
+
+/*
+ * Mirrors decode.decode_link() for the link occupying base[start:end] of the
+ * buffer object `src`. If `canonical` is not NULL it is set to whether the
+ * link is in its canonical encoding, i.e. all of its varints are minimal
+ * (field order is already enforced), so that encoding the decoded link
+ * reproduces these bytes.
+ */
+static PyObject *
+decode_link_at(PyObject *src, const char *base, Py_ssize_t start,
+               Py_ssize_t end, Py_ssize_t max_name, Py_ssize_t max_hash,
+               int *canonical)
+{
+    const unsigned char *buf = (const unsigned char *)base + start;
+    Py_ssize_t l = end - start;
+    Py_ssize_t index = 0;
+    int minimal = 1;
+    int has_hash = 0, has_name = 0, has_t_size = 0;
+    PyObject *link = PyObject_CallNoArgs(RawPBLink_type);
+
+    if (link == NULL) {
+        return NULL;
+    }
+
+    while (index < l) {
+        uint64_t key, value;
+        unsigned int key_hi, value_hi;
+        unsigned int wire_type;
+        Py_ssize_t s, e, at = index;
+
+        if (read_varint(buf, l, &index, &key, &key_hi) < 0) {
+            goto error;
+        }
+        minimal &= VARINT_MINIMAL(buf, at, index);
+        wire_type = (unsigned int)(key & 0x7);
+        at = index;
+
+        if (key_hi == 0 && (key >> 3) == 1) {
+            if (has_hash) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBLink) duplicate Hash section");
+                goto error;
+            }
+            if (wire_type != 2) {
+                PyErr_Format(PyExc_ValueError,
+                             "protobuf: (PBLink) wrong wire type (%u) for Hash",
+                             wire_type);
+                goto error;
+            }
+            if (has_name) {
+                PyErr_SetString(
+                    PyExc_Exception,
+                    "protobuf: (PBLink) invalid order, found Name before Hash");
+                goto error;
+            }
+            if (has_t_size) {
+                PyErr_SetString(
+                    PyExc_Exception,
+                    "protobuf: (PBLink) invalid order, found Tsize before Hash");
+                goto error;
+            }
+
+            if (check_length(buf, l, index, max_hash, "Hash") < 0 ||
+                read_bytes(buf, l, &index, &s, &e) < 0 ||
+                set_attr_steal(link, str_hash,
+                               slice(src, base, start + s, start + e)) < 0) {
+                goto error;
+            }
+            minimal &= VARINT_MINIMAL(buf, at, s);
+            has_hash = 1;
+        }
+        else if (key_hi == 0 && (key >> 3) == 2) {
+            if (has_name) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBLink) duplicate Name section");
+                goto error;
+            }
+            if (wire_type != 2) {
+                PyErr_Format(PyExc_ValueError,
+                             "protobuf: (PBLink) wrong wire type (%u) for Name",
+                             wire_type);
+                goto error;
+            }
+            if (has_t_size) {
+                PyErr_SetString(
+                    PyExc_Exception,
+                    "protobuf: (PBLink) invalid order, found Tsize before Name");
+                goto error;
+            }
+
+            if (check_length(buf, l, index, max_name, "Name") < 0 ||
+                read_bytes(buf, l, &index, &s, &e) < 0 ||
+                set_attr_steal(link, str_name,
+                               PyUnicode_DecodeUTF8((const char *)buf + s,
+                                                    e - s, NULL)) < 0) {
+                goto error;
+            }
+            minimal &= VARINT_MINIMAL(buf, at, s);
+            has_name = 1;
+        }
+        else if (key_hi == 0 && (key >> 3) == 3) {
+            if (has_t_size) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBLink) duplicate Tsize section");
+                goto error;
+            }
+            if (wire_type != 0) {
+                PyErr_Format(PyExc_ValueError,
+                             "protobuf: (PBLink) wrong wire type (%u) for Tsize",
+                             wire_type);
+                goto error;
+            }
+
+            if (read_varint(buf, l, &index, &value, &value_hi) < 0 ||
+                set_attr_steal(link, str_t_size,
+                               varint_to_long(value, value_hi)) < 0) {
+                goto error;
+            }
+            minimal &= VARINT_MINIMAL(buf, at, index);
+            has_t_size = 1;
+        }
+        else {
+            raise_field_num(PyExc_Exception,
+                            "protobuf: (PBLink) invalid field number, "
+                            "expected 1, 2 or 3, got ",
+                            key, key_hi);
+            goto error;
+        }
+    }
+
+    if (canonical != NULL) {
+        *canonical = minimal;
+    }
+    return link;
+
+error:
+    Py_DECREF(link);
+    return NULL;
+}
+
+static PyObject *
+speedups_decode_link(PyObject *module, PyObject *buf)
+{
+    Py_buffer view;
+    PyObject *link;
+    int flat = get_flat_buffer(buf, &view);
+
+    if (flat <= 0) {
+        return flat < 0 ? NULL : Py_NewRef(Py_NotImplemented);
+    }
+    link = decode_link_at(buf, view.buf, 0, view.len, -1, -1, NULL);
+    PyBuffer_Release(&view);
+    return link;
+}
+
+static PyObject *decode_node_partial(PyObject *buf, int keep_records,
+                                     const Py_ssize_t *bounds, int want_data,
+                                     PyObject *link_slice);
+
+static PyObject *
+speedups_decode_node(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    PyObject *buf, *data = NULL, *links = NULL, *node = NULL;
+    const unsigned char *p;
+    Py_buffer view;
+    Py_ssize_t l, index = 0, n_links = 0;
+    Py_ssize_t bounds[3] = {-1, -1, -1}; /* max links, name and hash lengths */
+    int keep_records = 0, links_before_data = 0, flat, i;
+
+    if (nargs < 1 || nargs > 7 || nargs == 6) {
+        PyErr_SetString(PyExc_TypeError,
+                        "decode_node() takes 1 to 5 or 7 positional arguments");
+        return NULL;
+    }
+    buf = args[0];
+    if (nargs >= 2 && (keep_records = PyObject_IsTrue(args[1])) < 0) {
+        return NULL;
+    }
+    for (i = 2; i < nargs && i < 5; i++) {
+        bounds[i - 2] = PyLong_AsSsize_t(args[i]);
+        if (bounds[i - 2] == -1 && PyErr_Occurred()) {
+            return NULL;
+        }
+    }
+    if (nargs == 7) {
+        int want_data = PyObject_IsTrue(args[5]);
+        if (want_data < 0) {
+            return NULL;
+        }
+        return decode_node_partial(buf, keep_records, bounds, want_data, args[6]);
+    }
+
+    flat = get_flat_buffer(buf, &view);
+    if (flat <= 0) {
+        return flat < 0 ? NULL : Py_NewRef(Py_NotImplemented);
+    }
+    p = view.buf;
+    l = view.len;
+
+    while (index < l) {
+        uint64_t key;
+        unsigned int key_hi, wire_type;
+        Py_ssize_t s, e;
+
+        if (read_varint(p, l, &index, &key, &key_hi) < 0) {
+            goto error;
+        }
+        wire_type = (unsigned int)(key & 0x7);
+
+        if (wire_type != 2) {
+            PyErr_Format(PyExc_Exception,
+                         "protobuf: (PBNode) invalid wire type, expected 2, got %u",
+                         wire_type);
+            goto error;
+        }
+
+        if (key_hi == 0 && (key >> 3) == 1) {
+            if (data != NULL) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBNode) duplicate Data section");
+                goto error;
+            }
+
+            if (read_bytes(p, l, &index, &s, &e) < 0 ||
+                (data = slice(buf, view.buf, s, e)) == NULL) {
+                goto error;
+            }
+            if (links != NULL) {
+                links_before_data = 1;
+            }
+        }
+        else if (key_hi == 0 && (key >> 3) == 2) {
+            PyObject *link;
+            int r, canonical;
+
+            if (links_before_data) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBNode) duplicate Links section");
+                goto error;
+            }
+            else if (links == NULL && (links = PyList_New(0)) == NULL) {
+                goto error;
+            }
+            if (bounds[0] >= 0 && n_links++ >= bounds[0]) {
+                PyErr_Format(PyExc_ValueError,
+                             "protobuf: (PBNode) more than %zd links", bounds[0]);
+                goto error;
+            }
+
+            if (read_bytes(p, l, &index, &s, &e) < 0 ||
+                (link = decode_link_at(buf, view.buf, s, e, bounds[1],
+                                       bounds[2], &canonical)) == NULL) {
+                goto error;
+            }
+            if (keep_records && canonical &&
+                set_attr_steal(link, str_record, slice(buf, view.buf, s, e)) < 0) {
+                Py_DECREF(link);
+                goto error;
+            }
+            r = PyList_Append(links, link);
+            Py_DECREF(link);
+            if (r < 0) {
+                goto error;
+            }
+        }
+        else {
+            raise_field_num(PyExc_Exception,
+                            "protobuf: (PBNode) invalid fieldNumber, "
+                            "expected 1 or 2, got ",
+                            key, key_hi);
+            goto error;
+        }
+    }
+
+    PyBuffer_Release(&view);
+
+    if ((node = PyObject_CallNoArgs(RawPBNode_type)) == NULL) {
+        goto done;
+    }
+    if (data != NULL && PyObject_SetAttr(node, str_data, data) < 0) {
+        Py_CLEAR(node);
+        goto done;
+    }
+    if (links == NULL && (links = PyList_New(0)) == NULL) {
+        Py_CLEAR(node);
+        goto done;
+    }
+    if (PyObject_SetAttr(node, str_links, links) < 0) {
+        Py_CLEAR(node);
+    }
+
+done:
+    Py_XDECREF(data);
+    Py_XDECREF(links);
+    return node;
+
+error:
+    PyBuffer_Release(&view);
+    Py_XDECREF(data);
+    Py_XDECREF(links);
+    return NULL;
+}
+
+/* -------------------------------------------------------------- validate */
+
+/* Mirrors decode._check_minimal(). */
+static int
+check_minimal(const unsigned char *buf, Py_ssize_t start, Py_ssize_t end)
+{
+    if (end - start > 1 && buf[end - 1] == 0) {
+        PyErr_SetString(PyExc_ValueError, "protobuf: non-minimal varint");
+        return -1;
+    }
+    return 0;
+}
+
+/* Reads a varint that must be minimal when `canonical` is set. */
+static int
+read_varint_checked(const unsigned char *buf, Py_ssize_t len, Py_ssize_t *offset,
+                    uint64_t *lo, unsigned int *hi, int canonical)
+{
+    Py_ssize_t start = *offset;
+    if (read_varint(buf, len, offset, lo, hi) < 0) {
+        return -1;
+    }
+    return canonical ? check_minimal(buf, start, *offset) : 0;
+}
+
+/* Mirrors decode._bytes_bounds(). */
+static int
+bytes_bounds(const unsigned char *buf, Py_ssize_t len, Py_ssize_t *offset,
+             Py_ssize_t *start, Py_ssize_t *end, int canonical)
+{
+    uint64_t n;
+    unsigned int hi;
+
+    if (read_varint_checked(buf, len, offset, &n, &hi, canonical) < 0) {
+        return -1;
+    }
+    if (hi != 0 || n > (uint64_t)(len - *offset)) {
+        PyErr_SetString(PyExc_EOFError, "protobuf: unexpected end of data");
+        return -1;
+    }
+    *start = *offset;
+    *end = *offset + (Py_ssize_t)n;
+    return 0;
+}
+
+/* Mirrors decode._is_binary_cid() for buf[0:len]. Never raises. */
+static int
+is_binary_cid(const unsigned char *buf, Py_ssize_t len)
+{
+    uint64_t values[4];
+    unsigned int hi;
+    Py_ssize_t index = 0;
+    int i;
+
+    if (len == 34 && buf[0] == 0x12 && buf[1] == 0x20) {
+        return 1;
+    }
+    for (i = 0; i < 4; i++) {
+        Py_ssize_t start = index;
+        if (read_varint(buf, len, &index, &values[i], &hi) < 0) {
+            PyErr_Clear();
+            return 0;
+        }
+        if (hi != 0 || (index - start > 1 && buf[index - 1] == 0)) {
+            return 0;
+        }
+    }
+    return values[0] == 1 && values[3] == (uint64_t)(len - index);
+}
+
+/* Strict UTF-8 validation, accepting exactly what bytes.decode() accepts. */
+static int
+is_utf8(const unsigned char *s, Py_ssize_t len)
+{
+    Py_ssize_t i = 0;
+
+    while (i < len) {
+        unsigned char c = s[i];
+        Py_ssize_t n, k;
+        unsigned char lo = 0x80, hi = 0xBF;
+
+        if (c < 0x80) {
+            i++;
+            continue;
+        }
+        if (c >= 0xC2 && c <= 0xDF) {
+            n = 1;
+        }
+        else if (c >= 0xE0 && c <= 0xEF) {
+            n = 2;
+            if (c == 0xE0) {
+                lo = 0xA0; /* overlong */
+            }
+            else if (c == 0xED) {
+                hi = 0x9F; /* surrogates */
+            }
+        }
+        else if (c >= 0xF0 && c <= 0xF4) {
+            n = 3;
+            if (c == 0xF0) {
+                lo = 0x90; /* overlong */
+            }
+            else if (c == 0xF4) {
+                hi = 0x8F; /* above U+10FFFF */
+            }
+        }
+        else {
+            return 0;
+        }
+        if (n > len - i - 1) {
+            return 0;
+        }
+        if (s[i + 1] < lo || s[i + 1] > hi) {
+            return 0;
+        }
+        for (k = 2; k <= n; k++) {
+            if (s[i + k] < 0x80 || s[i + k] > 0xBF) {
+                return 0;
+            }
+        }
+        i += n + 1;
+    }
+    return 1;
+}
+
+/* Compares name bytes like link_comparator(). */
+static int
+compare_names(const unsigned char *a, Py_ssize_t a_len,
+              const unsigned char *b, Py_ssize_t b_len)
+{
+    int c = memcmp(a, b, (size_t)(a_len < b_len ? a_len : b_len));
+    if (c != 0) {
+        return c < 0 ? -1 : 1;
+    }
+    return a_len < b_len ? -1 : a_len > b_len ? 1 : 0;
+}
+
+/*
+ * Mirrors decode._validate_link() for buf[0:l], with -1 for no length limit.
+ * Sets the name bounds and whether there is a Hash that is a binary CID.
+ */
+static int
+validate_link(const unsigned char *buf, Py_ssize_t l, int canonical,
+              Py_ssize_t max_name, Py_ssize_t max_hash, Py_ssize_t *name_start, Py_ssize_t *name_end, int *has_hash,
+              int *is_cid)
+{
+    Py_ssize_t index = 0;
+    int has_name = 0, has_t_size = 0;
+
+    *name_start = *name_end = 0;
+    *has_hash = *is_cid = 0;
+
+    while (index < l) {
+        uint64_t key, value;
+        unsigned int key_hi, value_hi, wire_type;
+        Py_ssize_t s, e;
+
+        if (read_varint_checked(buf, l, &index, &key, &key_hi, canonical) < 0) {
+            return -1;
+        }
+        wire_type = (unsigned int)(key & 0x7);
+
+        if (key_hi == 0 && (key >> 3) == 1) {
+            if (*has_hash) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBLink) duplicate Hash section");
+                return -1;
+            }
+            if (wire_type != 2) {
+                PyErr_Format(PyExc_ValueError,
+                             "protobuf: (PBLink) wrong wire type (%u) for Hash",
+                             wire_type);
+                return -1;
+            }
+            if (has_name) {
+                PyErr_SetString(
+                    PyExc_Exception,
+                    "protobuf: (PBLink) invalid order, found Name before Hash");
+                return -1;
+            }
+            if (has_t_size) {
+                PyErr_SetString(
+                    PyExc_Exception,
+                    "protobuf: (PBLink) invalid order, found Tsize before Hash");
+                return -1;
+            }
+            if (check_length(buf, l, index, max_hash, "Hash") < 0 ||
+                bytes_bounds(buf, l, &index, &s, &e, canonical) < 0) {
+                return -1;
+            }
+            index = e;
+            *is_cid = is_binary_cid(buf + s, e - s);
+            *has_hash = 1;
+        }
+        else if (key_hi == 0 && (key >> 3) == 2) {
+            if (has_name) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBLink) duplicate Name section");
+                return -1;
+            }
+            if (wire_type != 2) {
+                PyErr_Format(PyExc_ValueError,
+                             "protobuf: (PBLink) wrong wire type (%u) for Name",
+                             wire_type);
+                return -1;
+            }
+            if (has_t_size) {
+                PyErr_SetString(
+                    PyExc_Exception,
+                    "protobuf: (PBLink) invalid order, found Tsize before Name");
+                return -1;
+            }
+            if (check_length(buf, l, index, max_name, "Name") < 0 ||
+                bytes_bounds(buf, l, &index, &s, &e, canonical) < 0) {
+                return -1;
+            }
+            index = e;
+            if (!is_utf8(buf + s, e - s)) {
+                /* let the codec raise its exact error */
+                PyObject *name = PyUnicode_DecodeUTF8((const char *)buf + s, e - s, NULL);
+                if (name != NULL) {
+                    Py_DECREF(name);
+                    PyErr_SetString(PyExc_SystemError, "UTF-8 validation mismatch");
+                }
+                return -1;
+            }
+            *name_start = s;
+            *name_end = e;
+            has_name = 1;
+        }
+        else if (key_hi == 0 && (key >> 3) == 3) {
+            if (has_t_size) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBLink) duplicate Tsize section");
+                return -1;
+            }
+            if (wire_type != 0) {
+                PyErr_Format(PyExc_ValueError,
+                             "protobuf: (PBLink) wrong wire type (%u) for Tsize",
+                             wire_type);
+                return -1;
+            }
+            if (read_varint_checked(buf, l, &index, &value, &value_hi, canonical) < 0) {
+                return -1;
+            }
+            has_t_size = 1;
+        }
+        else {
+            raise_field_num(PyExc_Exception,
+                            "protobuf: (PBLink) invalid field number, "
+                            "expected 1, 2 or 3, got ",
+                            key, key_hi);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+/*
+ * Compiled decode.validate_bytes(). Returns None, or NotImplemented for
+ * buffers it does not handle.
+ */
+static PyObject *
+speedups_validate_bytes(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    PyObject *hash_error = NULL;
+    const char *hash_message = NULL;
+    const unsigned char *p;
+    Py_buffer view;
+    Py_ssize_t l, index = 0, prev_start = 0, prev_end = 0;
+    int canonical = 1, has_data = 0, has_links = 0, links_before_data = 0, flat;
+
+    if (nargs < 1 || nargs > 2) {
+        PyErr_SetString(PyExc_TypeError,
+                        "validate_bytes() takes 1 or 2 positional arguments");
+        return NULL;
+    }
+    if (nargs == 2 && (canonical = PyObject_IsTrue(args[1])) < 0) {
+        return NULL;
+    }
+
+    flat = get_flat_buffer(args[0], &view);
+    if (flat <= 0) {
+        return flat < 0 ? NULL : Py_NewRef(Py_NotImplemented);
+    }
+    p = view.buf;
+    l = view.len;
+
+    while (index < l) {
+        uint64_t key;
+        unsigned int key_hi, wire_type;
+        Py_ssize_t s, e;
+
+        if (read_varint_checked(p, l, &index, &key, &key_hi, canonical) < 0) {
+            goto error;
+        }
+        wire_type = (unsigned int)(key & 0x7);
+
+        if (wire_type != 2) {
+            PyErr_Format(PyExc_Exception,
+                         "protobuf: (PBNode) invalid wire type, expected 2, got %u",
+                         wire_type);
+            goto error;
+        }
+
+        if (key_hi == 0 && (key >> 3) == 1) {
+            if (has_data) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBNode) duplicate Data section");
+                goto error;
+            }
+            if (bytes_bounds(p, l, &index, &s, &e, canonical) < 0) {
+                goto error;
+            }
+            index = e;
+            has_data = 1;
+            if (has_links) {
+                links_before_data = 1;
+            }
+        }
+        else if (key_hi == 0 && (key >> 3) == 2) {
+            Py_ssize_t name_start, name_end;
+            int has_hash, is_cid;
+
+            if (links_before_data) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBNode) duplicate Links section");
+                goto error;
+            }
+            if (canonical && has_data) {
+                PyErr_SetString(PyExc_ValueError,
+                                "protobuf: (PBNode) data appears before links");
+                goto error;
+            }
+            if (bytes_bounds(p, l, &index, &s, &e, canonical) < 0 ||
+                validate_link(p + s, e - s, canonical, -1, -1, &name_start,
+                              &name_end, &has_hash, &is_cid) < 0) {
+                goto error;
+            }
+            index = e;
+            if (hash_error == NULL && !has_hash) {
+                hash_error = PyExc_TypeError;
+                hash_message = "Invalid Hash field found in link, expected CID";
+            }
+            else if (hash_error == NULL && !is_cid) {
+                hash_error = PyExc_ValueError;
+                hash_message = "protobuf: (PBLink) Hash is not a binary CID";
+            }
+            name_start += s;
+            name_end += s;
+            if (canonical && has_links &&
+                compare_names(p + name_start, name_end - name_start,
+                              p + prev_start, prev_end - prev_start) < 0) {
+                PyErr_SetString(PyExc_ValueError,
+                                "protobuf: (PBNode) links are not sorted by name bytes");
+                goto error;
+            }
+            prev_start = name_start;
+            prev_end = name_end;
+            has_links = 1;
+        }
+        else {
+            raise_field_num(PyExc_Exception,
+                            "protobuf: (PBNode) invalid fieldNumber, "
+                            "expected 1 or 2, got ",
+                            key, key_hi);
+            goto error;
+        }
+    }
+
+    PyBuffer_Release(&view);
+    if (hash_error != NULL) {
+        PyErr_SetString(hash_error, hash_message);
+        return NULL;
+    }
+    Py_RETURN_NONE;
+
+error:
+    PyBuffer_Release(&view);
+    return NULL;
+}
+
+/* ------------------------------------------------------- partial decode */
+
+typedef struct {
+    Py_ssize_t start, end;
+    int has_hash, is_cid;
+} link_span;
+
+/* Whether index `k` is among the `count` indices selected by start and step. */
+static int
+in_slice(Py_ssize_t k, Py_ssize_t start, Py_ssize_t step, Py_ssize_t count)
+{
+    Py_ssize_t offset = step > 0 ? k - start : start - k;
+    Py_ssize_t stride = step > 0 ? step : -step;
+
+    return offset >= 0 && offset % stride == 0 && offset / stride < count;
+}
+
+/*
+ * Mirrors decode._decode_node_partial(): decode_node() with Data only if
+ * `want_data` and only the links selected by `link_slice` created. The other
+ * links are checked with validate_link(), under the same limits, and only
+ * their bounds are kept.
+ */
+static PyObject *
+decode_node_partial(PyObject *buf, int keep_records, const Py_ssize_t *bounds,
+                    int want_data, PyObject *link_slice)
+{
+    PyObject *data = NULL, *links = NULL, *node = NULL;
+    link_span *spans = NULL;
+    const unsigned char *p;
+    Py_buffer view;
+    Py_ssize_t l, index = 0, n_spans = 0, capacity = 0;
+    Py_ssize_t start, stop, step, count, i;
+    int has_data = 0, links_before_data = 0, flat;
+
+    if (!PySlice_Check(link_slice)) {
+        PyErr_SetString(PyExc_TypeError, "decode_node() link_slice must be a slice");
+        return NULL;
+    }
+    flat = get_flat_buffer(buf, &view);
+    if (flat <= 0) {
+        return flat < 0 ? NULL : Py_NewRef(Py_NotImplemented);
+    }
+    p = view.buf;
+    l = view.len;
+
+    while (index < l) {
+        uint64_t key;
+        unsigned int key_hi, wire_type;
+        Py_ssize_t s, e;
+
+        if (read_varint(p, l, &index, &key, &key_hi) < 0) {
+            goto error;
+        }
+        wire_type = (unsigned int)(key & 0x7);
+
+        if (wire_type != 2) {
+            PyErr_Format(PyExc_Exception,
+                         "protobuf: (PBNode) invalid wire type, expected 2, got %u",
+                         wire_type);
+            goto error;
+        }
+
+        if (key_hi == 0 && (key >> 3) == 1) {
+            if (has_data) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBNode) duplicate Data section");
+                goto error;
+            }
+
+            if (read_bytes(p, l, &index, &s, &e) < 0 ||
+                (want_data && (data = slice(buf, view.buf, s, e)) == NULL)) {
+                goto error;
+            }
+            has_data = 1;
+            if (n_spans > 0) {
+                links_before_data = 1;
+            }
+        }
+        else if (key_hi == 0 && (key >> 3) == 2) {
+            Py_ssize_t name_start, name_end;
+            int has_hash, is_cid;
+
+            if (links_before_data) {
+                PyErr_SetString(PyExc_Exception,
+                                "protobuf: (PBNode) duplicate Links section");
+                goto error;
+            }
+            if (bounds[0] >= 0 && n_spans >= bounds[0]) {
+                PyErr_Format(PyExc_ValueError,
+                             "protobuf: (PBNode) more than %zd links", bounds[0]);
+                goto error;
+            }
+
+            if (read_bytes(p, l, &index, &s, &e) < 0 ||
+                validate_link(p + s, e - s, 0, bounds[1], bounds[2], &name_start,
+                              &name_end, &has_hash, &is_cid) < 0) {
+                goto error;
+            }
+            if (n_spans == capacity) {
+                link_span *grown;
+
+                capacity = capacity > 0 ? capacity * 2 : 64;
+                grown = PyMem_Realloc(spans, (size_t)capacity * sizeof(link_span));
+                if (grown == NULL) {
+                    PyErr_NoMemory();
+                    goto error;
+                }
+                spans = grown;
+            }
+            spans[n_spans].start = s;
+            spans[n_spans].end = e;
+            spans[n_spans].has_hash = has_hash;
+            spans[n_spans].is_cid = is_cid;
+            n_spans++;
+        }
+        else {
+            raise_field_num(PyExc_Exception,
+                            "protobuf: (PBNode) invalid fieldNumber, "
+                            "expected 1 or 2, got ",
+                            key, key_hi);
+            goto error;
+        }
+    }
+
+    if (PySlice_Unpack(link_slice, &start, &stop, &step) < 0) {
+        goto error;
+    }
+    count = PySlice_AdjustIndices(n_spans, &start, &stop, step);
+    /* decode() would fail on these after decode_node() */
+    for (i = 0; i < n_spans; i++) {
+        if (in_slice(i, start, step, count)) {
+            continue;
+        }
+        if (!spans[i].has_hash) {
+            PyErr_SetString(PyExc_TypeError,
+                            "Invalid Hash field found in link, expected CID");
+            goto error;
+        }
+        if (!spans[i].is_cid) {
+            PyErr_SetString(PyExc_ValueError,
+                            "protobuf: (PBLink) Hash is not a binary CID");
+            goto error;
+        }
+    }
+
+    if ((links = PyList_New(count)) == NULL) {
+        goto error;
+    }
+    for (i = 0; i < count; i++) {
+        const link_span *span = &spans[start + i * step];
+        int canonical;
+        PyObject *link = decode_link_at(buf, view.buf, span->start, span->end,
+                                        bounds[1], bounds[2], &canonical);
+
+        if (link == NULL) {
+            goto error;
+        }
+        PyList_SET_ITEM(links, i, link);
+        if (keep_records && canonical &&
+            set_attr_steal(link, str_record,
+                           slice(buf, view.buf, span->start, span->end)) < 0) {
+            goto error;
+        }
+    }
+
+    PyBuffer_Release(&view);
+    PyMem_Free(spans);
+
+    if ((node = PyObject_CallNoArgs(RawPBNode_type)) == NULL ||
+        (data != NULL && PyObject_SetAttr(node, str_data, data) < 0) ||
+        PyObject_SetAttr(node, str_links, links) < 0) {
+        Py_CLEAR(node);
+    }
+    Py_XDECREF(data);
+    Py_DECREF(links);
+    return node;
+
+error:
+    PyBuffer_Release(&view);
+    PyMem_Free(spans);
+    Py_XDECREF(data);
+    Py_XDECREF(links);
+    return NULL;
+}
+
+/* ---------------------------------------------------------------- encode */
+
+typedef struct {
+    Py_buffer record;
+    Py_buffer hash;
+    PyObject *name;
+    const char *name_bytes;
+    Py_ssize_t name_len;
+    uint64_t t_size;
+    int has_record, has_hash, has_name, has_t_size;
+    Py_ssize_t size;
+} link_parts;
+
+static Py_ssize_t
+sov(uint64_t x)
+{
+    Py_ssize_t n = 1;
+    while (x >= 0x80) {
+        x >>= 7;
+        n++;
+    }
+    return n;
+}
+
+static char *
+write_varint(char *p, uint64_t v)
+{
+    while (v >= 0x80) {
+        *p++ = (char)((v & 0x7F) | 0x80);
+        v >>= 7;
+    }
+    *p++ = (char)v;
+    return p;
+}
+
+/*
+ * Mirrors encode.size_link(), collecting what encode_link() needs. Returns 1 on
+ * success, 0 to fall back to Python, -1 on error.
+ */
+static int
+collect_link(PyObject *link, link_parts *parts)
+{
+    PyObject *value;
+    int err = 0, flat;
+
+    value = get_optional_attr(link, str_record, &err);
+    if (err) {
+        return -1;
+    }
+    if (value != NULL && is_byteslike(value)) {
+        flat = get_flat_buffer(value, &parts->record);
+        Py_DECREF(value);
+        if (flat <= 0) {
+            return flat;
+        }
+        parts->has_record = 1;
+        parts->size = parts->record.len;
+        return 1;
+    }
+    Py_XDECREF(value);
+
+    parts->size = 0;
+
+    value = get_optional_attr(link, str_hash, &err);
+    if (err) {
+        return -1;
+    }
+    if (value != NULL && is_byteslike(value)) {
+        flat = get_flat_buffer(value, &parts->hash);
+        Py_DECREF(value);
+        if (flat <= 0) {
+            return flat;
+        }
+        parts->has_hash = 1;
+        parts->size += 1 + parts->hash.len + sov((uint64_t)parts->hash.len);
+    }
+    else {
+        Py_XDECREF(value);
+    }
+
+    value = get_optional_attr(link, str_name, &err);
+    if (err) {
+        return -1;
+    }
+    if (value != NULL && PyUnicode_Check(value)) {
+        if (!PyUnicode_CheckExact(value)) {
+            Py_DECREF(value);
+            return 0;
+        }
+        parts->name = value;
+        parts->has_name = 1;
+        parts->name_bytes = PyUnicode_AsUTF8AndSize(value, &parts->name_len);
+        if (parts->name_bytes == NULL) {
+            /* let Python raise the same encoding error */
+            PyErr_Clear();
+            return 0;
+        }
+        parts->size += 1 + parts->name_len + sov((uint64_t)parts->name_len);
+    }
+    else {
+        Py_XDECREF(value);
+    }
+
+    value = get_optional_attr(link, str_t_size, &err);
+    if (err) {
+        return -1;
+    }
+    if (value != NULL && PyLong_Check(value)) {
+        int overflow;
+        long long t_size = PyLong_AsLongLongAndOverflow(value, &overflow);
+        Py_DECREF(value);
+        if (t_size == -1 && PyErr_Occurred()) {
+            return -1;
+        }
+        if (overflow != 0 || t_size < 0 || (uint64_t)t_size >= MAX_NATIVE_TSIZE) {
+            return 0;
+        }
+        parts->t_size = (uint64_t)t_size;
+        parts->has_t_size = 1;
+        parts->size += 1 + sov(parts->t_size);
+    }
+    else {
+        Py_XDECREF(value);
+    }
+
+    return 1;
+}
+
+static void
+release_link_parts(link_parts *parts, Py_ssize_t n)
+{
+    Py_ssize_t i;
+    for (i = 0; i < n; i++) {
+        if (parts[i].has_record) {
+            PyBuffer_Release(&parts[i].record);
+        }
+        if (parts[i].has_hash) {
+            PyBuffer_Release(&parts[i].hash);
+        }
+        Py_XDECREF(parts[i].name);
+    }
+    PyMem_Free(parts);
+}
+
+typedef struct {
+    Py_buffer data;
+    int has_data;
+    PyObject *links;
+    link_parts *parts;
+    Py_ssize_t n_parts;
+    Py_ssize_t size;
+} node_parts;
+
+/*
+ * Mirrors encode.size_node(), collecting what the encoder needs. Returns 1 on
+ * success, 0 to fall back to Python, -1 on error. release_node_parts() must be
+ * called afterwards in every case.
+ */
+static int
+collect_node(PyObject *node, node_parts *np)
+{
+    PyObject *data;
+    Py_ssize_t n_links;
+    int err = 0, flat;
+
+    memset(np, 0, sizeof(*np));
+
+    data = get_optional_attr(node, str_data, &err);
+    if (err) {
+        return -1;
+    }
+    if (data != NULL && is_byteslike(data)) {
+        flat = get_flat_buffer(data, &np->data);
+        Py_DECREF(data);
+        if (flat <= 0) {
+            return flat;
+        }
+        np->has_data = 1;
+        np->size += 1 + np->data.len + sov((uint64_t)np->data.len);
+    }
+    else {
+        Py_XDECREF(data);
+    }
+
+    np->links = get_optional_attr(node, str_links, &err);
+    if (err) {
+        return -1;
+    }
+    if (np->links == NULL || !PyList_Check(np->links)) {
+        return 1;
+    }
+    if (!PyList_CheckExact(np->links)) {
+        return 0;
+    }
+
+    n_links = PyList_GET_SIZE(np->links);
+    np->parts = PyMem_Calloc(n_links > 0 ? (size_t)n_links : 1, sizeof(link_parts));
+    if (np->parts == NULL) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    while (np->n_parts < n_links && np->n_parts < PyList_GET_SIZE(np->links)) {
+        PyObject *link = PyList_GET_ITEM(np->links, np->n_parts);
+        link_parts *lp = &np->parts[np->n_parts++];
+        int r;
+
+        Py_INCREF(link);
+        r = collect_link(link, lp);
+        Py_DECREF(link);
+        if (r <= 0) {
+            return r;
+        }
+        np->size += 1 + lp->size + sov((uint64_t)lp->size);
+    }
+
+    /* fall back if the list changed under us */
+    return np->n_parts == PyList_GET_SIZE(np->links);
+}
+
+static void
+release_node_parts(node_parts *np)
+{
+    if (np->has_data) {
+        PyBuffer_Release(&np->data);
+    }
+    if (np->parts != NULL) {
+        release_link_parts(np->parts, np->n_parts);
+    }
+    Py_XDECREF(np->links);
+}
+
+/* Writes the np->size bytes of the encoded node to p. */
+static void
+write_node(const node_parts *np, char *p)
+{
+    Py_ssize_t i;
+
+    for (i = 0; i < np->n_parts; i++) {
+        const link_parts *lp = &np->parts[i];
+
+        *p++ = 0x12;
+        p = write_varint(p, (uint64_t)lp->size);
+        if (lp->has_record) {
+            memcpy(p, lp->record.buf, lp->record.len);
+            p += lp->record.len;
+            continue;
+        }
+        if (lp->has_hash) {
+            *p++ = 0xA;
+            p = write_varint(p, (uint64_t)lp->hash.len);
+            memcpy(p, lp->hash.buf, lp->hash.len);
+            p += lp->hash.len;
+        }
+        if (lp->has_name) {
+            *p++ = 0x12;
+            p = write_varint(p, (uint64_t)lp->name_len);
+            memcpy(p, lp->name_bytes, lp->name_len);
+            p += lp->name_len;
+        }
+        if (lp->has_t_size) {
+            *p++ = 0x18;
+            p = write_varint(p, lp->t_size);
+        }
+    }
+
+    if (np->has_data) {
+        *p++ = 0xA;
+        p = write_varint(p, (uint64_t)np->data.len);
+        memcpy(p, np->data.buf, np->data.len);
+    }
+}
+
+static PyObject *
+speedups_encode_node(PyObject *module, PyObject *node)
+{
+    node_parts np;
+    PyObject *out, *result = NULL;
+    int r = collect_node(node, &np);
+
+    if (r <= 0) {
+        release_node_parts(&np);
+        return r < 0 ? NULL : Py_NewRef(Py_NotImplemented);
+    }
+
+    out = PyByteArray_FromStringAndSize(NULL, np.size);
+    if (out != NULL) {
+        write_node(&np, PyByteArray_AS_STRING(out));
+        result = PyMemoryView_FromObject(out);
+        Py_DECREF(out);
+    }
+    release_node_parts(&np);
+    return result;
+}
+
+/*
+ * Compiled encode.encode_into(). Error cases (read-only or short buffers, bad
+ * offsets) return NotImplemented so that Python raises its own errors.
+ */
+static PyObject *
+speedups_encode_into(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    node_parts np;
+    Py_buffer view;
+    Py_ssize_t offset;
+    PyObject *result;
+    int r;
+
+    if (nargs != 3) {
+        PyErr_SetString(PyExc_TypeError, "encode_into() takes exactly 3 arguments");
+        return NULL;
+    }
+    if (!PyLong_CheckExact(args[2])) {
+        return Py_NewRef(Py_NotImplemented);
+    }
+    offset = PyLong_AsSsize_t(args[2]);
+    if (offset == -1 && PyErr_Occurred()) {
+        PyErr_Clear();
+        return Py_NewRef(Py_NotImplemented);
+    }
+
+    r = collect_node(args[0], &np);
+    if (r <= 0) {
+        release_node_parts(&np);
+        return r < 0 ? NULL : Py_NewRef(Py_NotImplemented);
+    }
+
+    r = get_flat_buffer(args[1], &view);
+    if (r <= 0 || view.readonly || offset < 0 || np.size > view.len - offset) {
+        if (r > 0) {
+            PyBuffer_Release(&view);
+        }
+        release_node_parts(&np);
+        return r < 0 ? NULL : Py_NewRef(Py_NotImplemented);
+    }
+
+    write_node(&np, (char *)view.buf + offset);
+    result = PyLong_FromSsize_t(np.size);
+    PyBuffer_Release(&view);
+    release_node_parts(&np);
+    return result;
+}
+
+/* ------------------------------------------------------------------ util */
+
+static int
+name_bytes(PyObject *link, PyObject **name, const char **buf, Py_ssize_t *len)
+{
+    *name = PyObject_GetAttr(link, str_name);
+    if (*name == NULL) {
+        return -1;
+    }
+    if (!PyUnicode_Check(*name)) {
+        *buf = "";
+        *len = 0;
+        return 0;
+    }
+    *buf = PyUnicode_AsUTF8AndSize(*name, len);
+    return *buf == NULL ? -1 : 0;
+}
+
+static PyObject *
+speedups_link_comparator(PyObject *module, PyObject *const *args, Py_ssize_t nargs)
+{
+    PyObject *aname = NULL, *bname = NULL, *result = NULL;
+    const char *abuf, *bbuf;
+    Py_ssize_t x, y, i;
+    int eq;
+
+    if (nargs != 2) {
+        PyErr_SetString(PyExc_TypeError,
+                        "link_comparator() takes exactly 2 arguments");
+        return NULL;
+    }
+
+    eq = PyObject_RichCompareBool(args[0], args[1], Py_EQ);
+    if (eq < 0) {
+        return NULL;
+    }
+    if (eq) {
+        return PyLong_FromLong(0);
+    }
+
+    if (name_bytes(args[0], &aname, &abuf, &x) < 0 ||
+        name_bytes(args[1], &bname, &bbuf, &y) < 0) {
+        goto done;
+    }
+
+    {
+        Py_ssize_t m = x < y ? x : y;
+        for (i = 0; i < m; i++) {
+            if (abuf[i] != bbuf[i]) {
+                x = (unsigned char)abuf[i];
+                y = (unsigned char)bbuf[i];
+                break;
+            }
+        }
+    }
+
+    result = PyLong_FromLong(x < y ? -1 : y < x ? 1 : 0);
+
+done:
+    Py_XDECREF(aname);
+    Py_XDECREF(bname);
+    return result;
+}
+
+/* ---------------------------------------------------------------- module */
+
+static PyMethodDef speedups_methods[] = {
+    {"decode_link", (PyCFunction)speedups_decode_link, METH_O,
+     "Compiled decode.decode_link(), or NotImplemented."},
+    {"decode_node", (PyCFunction)(void (*)(void))speedups_decode_node,
+     METH_FASTCALL, "Compiled decode.decode_node(), or NotImplemented."},
+    {"validate_bytes", (PyCFunction)(void (*)(void))speedups_validate_bytes,
+     METH_FASTCALL, "Compiled decode.validate_bytes(), or NotImplemented."},
+    {"encode_node", (PyCFunction)speedups_encode_node, METH_O,
+     "Compiled encode.encode_node(), or NotImplemented."},
+    {"encode_into", (PyCFunction)(void (*)(void))speedups_encode_into,
+     METH_FASTCALL, "Compiled encode.encode_into(), or NotImplemented."},
+    {"link_comparator", (PyCFunction)(void (*)(void))speedups_link_comparator,
+     METH_FASTCALL, "Compiled util.link_comparator()."},
+    {NULL, NULL, 0, NULL},
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "ipld_dag_pb._speedups",
+    "Compiled accelerator for the DAG-PB codec hot paths.",
+    -1,
+    speedups_methods,
+    NULL,
+    NULL,
+    NULL,
+    NULL,
+};
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    PyObject *node_module;
+
+    if (!(str_hash = PyUnicode_InternFromString("hash")) ||
+        !(str_name = PyUnicode_InternFromString("name")) ||
+        !(str_t_size = PyUnicode_InternFromString("t_size")) ||
+        !(str_record = PyUnicode_InternFromString("record")) ||
+        !(str_data = PyUnicode_InternFromString("data")) ||
+        !(str_links = PyUnicode_InternFromString("links"))) {
+        return NULL;
+    }
+
+    node_module = PyImport_ImportModule("ipld_dag_pb.node");
+    if (node_module == NULL) {
+        return NULL;
+    }
+    RawPBLink_type = PyObject_GetAttrString(node_module, "RawPBLink");
+    RawPBNode_type = PyObject_GetAttrString(node_module, "RawPBNode");
+    Py_DECREF(node_module);
+    if (RawPBLink_type == NULL || RawPBNode_type == NULL) {
+        return NULL;
+    }
+
+    return PyModule_Create(&speedups_module);
+}
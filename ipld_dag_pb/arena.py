@@ -0,0 +1,134 @@
+"""
+Encodes many nodes back to back into one contiguous buffer.
+
+:class:`BlockArena` keeps an `(offset, length)` index of the blocks it holds, so
+a batch can be sent or written with a single call and individual blocks read
+back as views. With `car=True` each block is written as a CAR section (varint
+length, binary CID, block), which together with :func:`ipld_dag_pb.car.encode_header`
+produces a complete CARv1 file::
+
+    arena = BlockArena(car=True)
+    for node in nodes:
+        arena.append(node)
+    with open("out.car", "wb") as f:
+        f.write(encode_header([arena.cid(len(arena) - 1)]))
+        arena.write_to(f)
+"""
+
+from typing import Any, Final
+from ._convert import to_raw
+from .car import dag_pb_code
+from .encode import encode_into, encode_varint, size_node, sov
+from .node import PBNode
+
+min_capacity: Final = 4096
+
+
+class BlockArena:
+    """
+    A growing buffer of encoded blocks. `index[i]` is the `(offset, length)` of
+    the i-th block within :meth:`view`.
+    """
+
+    car: bool
+    hashfn: str
+    index: list[tuple[int, int]]
+
+    def __init__(self, car: bool = False, hashfn: str = "sha2-256", capacity: int = 65536) -> None:
+        self.car = car
+        self.hashfn = hashfn
+        self.index = []
+        self._buf = bytearray(max(capacity, min_capacity))
+        self._size = 0
+        # the CID prefix (version 1, dag-pb) and the length of a binary CID
+        self._cid_prefix = bytes([1, dag_pb_code])
+        self._cid_len = 0
+        if car:
+            from multiformats import multihash  # pylint: disable=import-outside-toplevel
+
+            self._cid_len = len(self._cid_prefix) + len(multihash.digest(b"", hashfn))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def size(self) -> int:
+        """ Number of bytes used. """
+        return self._size
+
+    def _reserve(self, n: int) -> None:
+        needed = self._size + n
+        if needed <= len(self._buf):
+            return
+        capacity = len(self._buf)
+        while capacity < needed:
+            capacity *= 2
+        # a new buffer rather than a resize, which fails while views are alive
+        buf = bytearray(capacity)
+        buf[: self._size] = memoryview(self._buf)[: self._size]
+        self._buf = buf
+
+    def append(self, node: PBNode) -> int:
+        """
+        Encodes `node` at the end of the arena and returns its position in
+        `index`.
+        """
+        raw = to_raw(node)
+        length = size_node(raw)
+        header = 0
+        if self.car:
+            header = sov(self._cid_len + length) + self._cid_len
+        self._reserve(header + length)
+
+        offset = self._size + header
+        encode_into(raw, self._buf, offset)
+        if self.car:
+            from multiformats import multihash  # pylint: disable=import-outside-toplevel
+
+            view = memoryview(self._buf)
+            with view:
+                digest = multihash.digest(view[offset : offset + length], self.hashfn)
+                start = offset - self._cid_len
+                view[start : start + 2] = self._cid_prefix
+                view[start + 2 : offset] = digest
+                encode_varint(view, start, self._cid_len + length)
+
+        self._size = offset + length
+        self.index.append((offset, length))
+        return len(self.index) - 1
+
+    def view(self) -> memoryview:
+        """
+        All the bytes written so far. Views stay valid when the arena grows, but
+        do not see blocks appended afterwards.
+        """
+        return memoryview(self._buf)[: self._size]
+
+    def block(self, i: int) -> memoryview:
+        """ The i-th encoded block. """
+        offset, length = self.index[i]
+        return memoryview(self._buf)[offset : offset + length]
+
+    def cid(self, i: int) -> memoryview:
+        """
+        The binary CID of the i-th block. Only available with `car=True`.
+        """
+        if not self.car:
+            raise ValueError("arena: CIDs are only recorded in CAR mode")
+        offset = self.index[i][0]
+        return memoryview(self._buf)[offset - self._cid_len : offset]
+
+    def write_to(self, f: Any) -> int:
+        """
+        Writes the whole arena to the binary file-like `f` in one call.
+        """
+        with self.view() as view:
+            return int(f.write(view))
+
+    def clear(self) -> None:
+        """
+        Empties the arena, keeping its buffer for reuse. Views of previous
+        contents will see them overwritten.
+        """
+        self.index.clear()
+        self._size = 0
@@ -0,0 +1,30 @@
+"""
+Selects the codec implementation. The optional compiled accelerator
+(`ipld_dag_pb._speedups`) is used when it has been built and the
+``IPLD_DAG_PB_PURE_PYTHON`` environment variable is not set; otherwise the
+pure-Python implementation is used.
+"""
+
+import os
+from types import ModuleType
+from typing import Final, Optional
+
+PURE_PYTHON_ENV: Final = "IPLD_DAG_PB_PURE_PYTHON"
+
+
+def load_speedups() -> Optional[ModuleType]:
+    if os.environ.get(PURE_PYTHON_ENV, "") not in ("", "0"):
+        return None
+    try:
+        from . import _speedups  # type: ignore[attr-defined]
+    except ImportError:
+        return None
+    return _speedups  # type: ignore[no-any-return]
+
+
+speedups: Optional[ModuleType] = load_speedups()
+""" The compiled accelerator module, or None when running pure-Python. """
+
+
+def name() -> str:
+    return "python" if speedups is None else "native"
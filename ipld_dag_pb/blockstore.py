@@ -0,0 +1,65 @@
+"""
+The interface the DAG tools (:mod:`ipld_dag_pb.editor`, :mod:`ipld_dag_pb.diff`)
+read and write blocks through, and an in-memory implementation of it.
+"""
+
+from typing import TYPE_CHECKING, Iterable, Iterator, Protocol
+from .node import BytesLike
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+
+class Blockstore(Protocol):
+    """
+    A store of blocks keyed by CID. `get` raises KeyError for blocks it does
+    not hold. `put_many` writes a batch, letting stores that can commit many
+    blocks in one operation do so.
+    """
+
+    def get(self, cid: "CID") -> BytesLike: ...
+
+    def has(self, cid: "CID") -> bool: ...
+
+    def put_many(self, blocks: Iterable[tuple["CID", BytesLike]]) -> None: ...
+
+
+class MemoryBlockstore:
+    """
+    A :class:`Blockstore` over a dict. Blocks are not verified against their
+    CIDs.
+    """
+
+    blocks: dict["CID", bytes]
+
+    def __init__(self) -> None:
+        self.blocks = {}
+
+    def get(self, cid: "CID") -> BytesLike:
+        return self.blocks[cid]
+
+    def has(self, cid: "CID") -> bool:
+        return cid in self.blocks
+
+    def put(self, cid: "CID", block: BytesLike) -> None:
+        self.blocks[cid] = bytes(block)
+
+    def put_many(self, blocks: Iterable[tuple["CID", BytesLike]]) -> None:
+        for cid, block in blocks:
+            self.blocks[cid] = bytes(block)
+
+    def delete(self, cid: "CID") -> None:
+        """
+        Removes the block `cid`. Raises KeyError if it is not stored.
+        """
+        del self.blocks[cid]
+
+    def multihashes(self) -> Iterator[bytes]:
+        """
+        The multihashes of the stored blocks, e.g. to build a filter over them.
+        """
+        for cid in self.blocks:
+            yield cid.digest
+
+    def __len__(self) -> int:
+        return len(self.blocks)
@@ -0,0 +1,302 @@
+"""
+Bloom filters for answering "is this block new?" without a store lookup.
+
+:class:`ScalableBloomFilter` grows by adding filters of increasing capacity
+and decreasing error rate as keys are added, so its false positive rate stays
+below the target without knowing the number of keys in advance (Almeida et al.,
+"Scalable Bloom Filters", 2007).
+
+:class:`FilteredBlockstore` puts one in front of a blockstore so that `has`
+and `get` for blocks that are not stored, the common case when importing new
+data, are answered without touching the store::
+
+    store = FilteredBlockstore.open(PackBlockstore("blocks"), "blocks/bloom")
+    if not store.has(cid):
+        store.put(cid, block)
+    store.close()
+
+Blocks are keyed by multihash, as :class:`ipld_dag_pb.pack.PackBlockstore`
+does, so a block stored under one CID is never reported missing under another
+CID with the same multihash.
+"""
+
+import hashlib
+import math
+import os
+import struct
+from typing import TYPE_CHECKING, Any, BinaryIO, Final, Iterable, Optional, Protocol
+from .node import BytesLike
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+    from .blockstore import Blockstore
+
+file_magic: Final = b"DAGPBBLM"
+file_version: Final = 1
+_file_header: Final = struct.Struct(">8sIddI")
+""" magic, version, error rate, growth, number of filters. """
+_filter_header: Final = struct.Struct(">QQIQ")
+""" capacity, number of bits, number of hashes, number of keys. """
+
+
+def _hashes(key: BytesLike) -> tuple[int, int]:
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+    return (int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1)
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter sized for `capacity` keys at a false positive
+    rate of `error_rate`. Bit positions are derived from one BLAKE2b hash of
+    the key by double hashing.
+    """
+
+    capacity: int
+    num_bits: int
+    num_hashes: int
+    count: int
+    bits: bytearray
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("bloom: capacity must be positive and error_rate in (0, 1)")
+        self.capacity = capacity
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _add(self, h1: int, h2: int) -> None:
+        bits = self.bits
+        m = self.num_bits
+        for i in range(self.num_hashes):
+            n = (h1 + i * h2) % m
+            bits[n >> 3] |= 1 << (n & 7)
+        self.count += 1
+
+    def _contains(self, h1: int, h2: int) -> bool:
+        bits = self.bits
+        m = self.num_bits
+        for i in range(self.num_hashes):
+            n = (h1 + i * h2) % m
+            if not bits[n >> 3] & (1 << (n & 7)):
+                return False
+        return True
+
+    def add(self, key: BytesLike) -> None:
+        self._add(*_hashes(key))
+
+    def __contains__(self, key: BytesLike) -> bool:
+        return self._contains(*_hashes(key))
+
+    @property
+    def false_positive_rate(self) -> float:
+        """
+        The expected false positive rate at the current number of keys.
+        """
+        return float((1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes)
+
+
+class ScalableBloomFilter:
+    """
+    A Bloom filter that keeps its false positive rate below `error_rate` as it
+    grows. The first filter holds `initial_capacity` keys; each further filter
+    holds `growth` times more at half the error rate of the one before.
+    """
+
+    error_rate: float
+    growth: float
+    filters: list[BloomFilter]
+
+    def __init__(self, initial_capacity: int = 1 << 16, error_rate: float = 0.001, growth: float = 2) -> None:
+        if growth < 1:
+            raise ValueError("bloom: growth cannot be below 1")
+        self.error_rate = error_rate
+        self.growth = growth
+        # the error rates of the filters sum to at most error_rate
+        self.filters = [BloomFilter(initial_capacity, error_rate / 2)]
+
+    def add(self, key: BytesLike) -> None:
+        """
+        Adds `key`; adding a key that may already be present is a no-op.
+        """
+        h1, h2 = _hashes(key)
+        for f in self.filters:
+            if f._contains(h1, h2):  # pylint: disable=protected-access
+                return
+        last = self.filters[-1]
+        if last.count >= last.capacity:
+            last = BloomFilter(
+                math.ceil(last.capacity * self.growth), self.error_rate / 2 ** (len(self.filters) + 1)
+            )
+            self.filters.append(last)
+        last._add(h1, h2)  # pylint: disable=protected-access
+
+    def update(self, keys: Iterable[BytesLike]) -> None:
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: BytesLike) -> bool:
+        h1, h2 = _hashes(key)
+        for f in reversed(self.filters):  # most keys are in the largest
+            if f._contains(h1, h2):  # pylint: disable=protected-access
+                return True
+        return False
+
+    def __len__(self) -> int:
+        """ The number of keys added (approximate: a few may be merged away). """
+        return sum(f.count for f in self.filters)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """
+        The expected false positive rate at the current number of keys.
+        """
+        miss = 1.0
+        for f in self.filters:
+            miss *= 1 - f.false_positive_rate
+        return 1 - miss
+
+    @property
+    def size(self) -> int:
+        """ The memory used by the bit arrays, in bytes. """
+        return sum(len(f.bits) for f in self.filters)
+
+    def dump(self, f: BinaryIO) -> None:
+        f.write(_file_header.pack(file_magic, file_version, self.error_rate, self.growth, len(self.filters)))
+        for bf in self.filters:
+            f.write(_filter_header.pack(bf.capacity, bf.num_bits, bf.num_hashes, bf.count))
+            f.write(bf.bits)
+
+    @classmethod
+    def load(cls, f: BinaryIO) -> "ScalableBloomFilter":
+        magic, version, error_rate, growth, count = _file_header.unpack(_read(f, _file_header.size))
+        if magic != file_magic or version != file_version:
+            raise ValueError("bloom: not a saved Bloom filter")
+        sbf = cls.__new__(cls)
+        sbf.error_rate = error_rate
+        sbf.growth = growth
+        sbf.filters = []
+        for _ in range(count):
+            bf = BloomFilter.__new__(BloomFilter)
+            bf.capacity, bf.num_bits, bf.num_hashes, bf.count = _filter_header.unpack(
+                _read(f, _filter_header.size)
+            )
+            bf.bits = bytearray(_read(f, (bf.num_bits + 7) // 8))
+            sbf.filters.append(bf)
+        return sbf
+
+
+def _read(f: BinaryIO, n: int) -> bytes:
+    buf = f.read(n)
+    if len(buf) != n:
+        raise EOFError("bloom: unexpected end of data")
+    return buf
+
+
+class _Enumerable(Protocol):
+    def multihashes(self) -> Iterable[BytesLike]: ...
+
+
+class FilteredBlockstore:
+    """
+    A blockstore that answers `has` and `get` for blocks known not to be in
+    `store` from `filter` alone. Every block in `store` must have been added
+    to the filter, which :meth:`open` and :meth:`rebuild` take care of.
+    Deleted blocks stay in the filter, as occasional false positives.
+    """
+
+    store: "Blockstore"
+    filter: ScalableBloomFilter
+    path: Optional[str]
+    lookups: int
+    """ Lookups that had to go to the store. """
+
+    def __init__(self, store: "Blockstore", filter: ScalableBloomFilter, path: Optional[str] = None) -> None:  # pylint: disable=redefined-builtin
+        self.store = store
+        self.filter = filter
+        self.path = path
+        self.lookups = 0
+        self._saved = False
+
+    @classmethod
+    def rebuild(cls, store: Any, path: Optional[str] = None, **options: Any) -> "FilteredBlockstore":
+        """
+        Builds the filter by enumerating the store's `multihashes()`.
+        """
+        bloom = ScalableBloomFilter(**options)
+        enumerable: _Enumerable = store
+        bloom.update(enumerable.multihashes())
+        return cls(store, bloom, path)
+
+    @classmethod
+    def open(cls, store: Any, path: str, **options: Any) -> "FilteredBlockstore":
+        """
+        Loads the filter saved at `path` by :meth:`close`, or rebuilds it from
+        the store if there is none. The saved filter is removed once loaded,
+        so a process that stops without closing the store cannot leave a stale
+        filter behind that would hide blocks written after it was saved.
+        """
+        try:
+            with open(path, "rb") as f:
+                bloom = ScalableBloomFilter.load(f)
+        except FileNotFoundError:
+            return cls.rebuild(store, path, **options)
+        os.remove(path)
+        return cls(store, bloom, path)
+
+    def has(self, cid: "CID") -> bool:
+        if cid.digest not in self.filter:
+            return False
+        self.lookups += 1
+        return self.store.has(cid)
+
+    def get(self, cid: "CID") -> BytesLike:
+        if cid.digest not in self.filter:
+            raise KeyError(cid)
+        self.lookups += 1
+        return self.store.get(cid)
+
+    def put(self, cid: "CID", block: BytesLike) -> None:
+        self.put_many([(cid, block)])
+
+    def put_many(self, blocks: Iterable[tuple["CID", BytesLike]]) -> None:
+        blocks = list(blocks)
+        if self._saved:
+            # the saved filter would hide these blocks if loaded
+            assert self.path is not None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self._saved = False
+        # added first: a block must never be stored without being in the filter
+        for cid, _ in blocks:
+            self.filter.add(cid.digest)
+        self.store.put_many(blocks)
+
+    def save(self) -> None:
+        """
+        Writes the filter to `path`, atomically. The file is removed again
+        by the next put, so it is only ever loaded while still up to date.
+        """
+        if self.path is None:
+            raise ValueError("bloom: no path to save the filter to")
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            self.filter.dump(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._saved = True
+
+    def close(self) -> None:
+        """
+        Closes the store (if it can be) and saves the filter for :meth:`open`.
+        """
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            close()
+        if self.path is not None:
+            self.save()
@@ -0,0 +1,101 @@
+"""
+Reusable buffers for encoding without allocating per block.
+
+:class:`BufferPool` hands out bytearrays rounded up to power-of-two size
+classes and keeps a bounded number of released ones for reuse, so a steady
+stream of similarly sized nodes is encoded into the same few buffers::
+
+    pool = BufferPool()
+    for node in nodes:
+        with pool.encoded(node) as block:
+            store.put(block)  # block is only valid inside the with block
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator
+from ._convert import to_raw
+from .encode import encode_into, size_node
+from .node import PBNode
+
+
+class BufferPool:
+    """
+    A thread-safe pool of bytearrays in power-of-two size classes. At most
+    `per_class` free buffers are kept per class and `max_bytes` in total;
+    buffers released beyond that are left to the garbage collector.
+    """
+
+    min_size: int
+    per_class: int
+    max_bytes: int
+
+    def __init__(
+        self, min_size: int = 256, per_class: int = 16, max_bytes: int = 64 * 2**20
+    ) -> None:
+        if min_size <= 0 or min_size & (min_size - 1):
+            raise ValueError("BufferPool: min_size must be a power of two")
+        self.min_size = min_size
+        self.per_class = per_class
+        self.max_bytes = max_bytes
+        self._free: dict[int, list[bytearray]] = {}
+        self._retained = 0
+        self._lock = Lock()
+
+    @property
+    def retained(self) -> int:
+        """ Total size in bytes of the free buffers held by the pool. """
+        return self._retained
+
+    def size_class(self, size: int) -> int:
+        """ The length of the buffers handed out for a request of `size` bytes. """
+        return max(self.min_size, 1 << max(size - 1, 0).bit_length())
+
+    def acquire(self, size: int) -> bytearray:
+        """
+        A buffer of at least `size` bytes, reused if one is free. Its contents
+        are whatever was last written to it.
+        """
+        cls = self.size_class(size)
+        with self._lock:
+            free = self._free.get(cls)
+            if free:
+                self._retained -= cls
+                return free.pop()
+        return bytearray(cls)
+
+    def release(self, buf: bytearray) -> None:
+        """
+        Returns a buffer from :meth:`acquire` to the pool. It must not be used
+        afterwards, and no views of it may be alive.
+        """
+        cls = len(buf)
+        if cls != self.size_class(cls):
+            return  # not one of ours
+        with self._lock:
+            free = self._free.setdefault(cls, [])
+            if len(free) < self.per_class and self._retained + cls <= self.max_bytes:
+                free.append(buf)
+                self._retained += cls
+
+    def clear(self) -> None:
+        """ Drops all free buffers. """
+        with self._lock:
+            self._free.clear()
+            self._retained = 0
+
+    @contextmanager
+    def encoded(self, node: PBNode) -> Iterator[memoryview]:
+        """
+        Encodes `node` into a pooled buffer and yields a view of exactly the
+        encoded bytes. The buffer goes back to the pool when the block exits, so
+        the view must not be kept; copy it with `bytes()` if needed.
+        """
+        raw = to_raw(node)
+        buf = self.acquire(size_node(raw))
+        try:
+            size = encode_into(raw, buf)
+            with memoryview(buf)[:size] as block:
+                yield block
+        finally:
+            self.release(buf)
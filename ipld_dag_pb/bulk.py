@@ -0,0 +1,382 @@
+"""
+Columnar scanning of the links of many blocks at once, for analytics over
+large collections (fanout distributions, t_size totals, hash prefixes).
+
+:func:`scan_links` takes one buffer holding many blocks, e.g. a CAR or pack
+file, and the offset and length of each block in it. Rather than decoding
+blocks into objects it returns a :class:`LinkColumns` of flat arrays with one
+entry per link (or per block). With NumPy installed the blocks are parsed in
+lock-step, one field of every block per vectorized step, and the columns are
+NumPy arrays; without it a pure-Python scanner fills `array.array` columns.
+Either kind can be wrapped with `numpy.asarray` without copying::
+
+    cols = scan_car(buf)
+    fanout = numpy.bincount(cols.link_count)
+    total = cols.t_size[cols.has_t_size].sum()
+
+Blocks are checked against the framing rules decode_node() enforces; a block
+that breaks them is marked in `valid` and contributes no links. Names are not
+checked to be UTF-8 and hashes not checked to be CIDs, use validate_bytes()
+for that. Tsize values of 2**64 or more are treated as invalid.
+"""
+
+from array import array
+from typing import Any, Optional, Sequence
+from .car import data_bounds, first_section, iter_section_bounds
+from .decode import decode_varint
+from .node import BytesLike
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # type: ignore[assignment]
+
+
+class LinkColumns:
+    """
+    The links of a set of blocks as columns. Per-block columns are indexed
+    like the blocks passed to :func:`scan_links`; per-link columns hold the
+    links of all valid blocks, in block order then link order. Offsets are
+    positions in the scanned buffer, and -1 where the field is absent.
+    """
+
+    block_offset: Any
+    block_length: Any
+    valid: Any
+    """ Per block: whether it was well-formed. """
+    link_count: Any
+    """ Per block: the number of links (0 for invalid blocks). """
+    link_block: Any
+    """ Per link: the index of its block. """
+    hash_offset: Any
+    hash_length: Any
+    name_offset: Any
+    name_length: Any
+    t_size: Any
+    has_t_size: Any
+
+    def __init__(self, **columns: Any) -> None:
+        for name, column in columns.items():
+            setattr(self, name, column)
+
+    def __len__(self) -> int:
+        return len(self.link_block)
+
+
+link_columns = (
+    "link_block",
+    "hash_offset",
+    "hash_length",
+    "name_offset",
+    "name_length",
+    "t_size",
+    "has_t_size",
+)
+
+
+def scan_links(
+    buf: BytesLike,
+    offsets: Sequence[int],
+    lengths: Sequence[int],
+    vectorized: Optional[bool] = None,
+) -> LinkColumns:
+    """
+    Scans the blocks at `offsets`/`lengths` of `buf`. `vectorized` selects the
+    NumPy or pure-Python scanner; by default NumPy is used when installed.
+    """
+    if len(offsets) != len(lengths):
+        raise ValueError("scan_links: offsets and lengths differ in length")
+    if vectorized is None:
+        vectorized = numpy is not None
+    if vectorized:
+        if numpy is None:
+            raise ImportError("scan_links: vectorized scanning requires numpy")
+        return _scan_numpy(buf, offsets, lengths)
+    return _scan_python(buf, offsets, lengths)
+
+
+def scan_car(buf: BytesLike, vectorized: Optional[bool] = None) -> LinkColumns:
+    """
+    Scans the DAG-PB blocks of the CARv1 or CARv2 file held in `buf`; other
+    blocks are skipped.
+    """
+    offsets = array("q")
+    lengths = array("q")
+    start, end = data_bounds(buf)
+    sections = iter_section_bounds(buf, first_section(buf, start), end)
+    for _, cid_start, block_start, section_end in sections:
+        if _is_dag_pb(buf, cid_start):
+            offsets.append(block_start)
+            lengths.append(section_end - block_start)
+    return scan_links(buf, offsets, lengths, vectorized)
+
+
+def _is_dag_pb(buf: BytesLike, cid_start: int) -> bool:
+    if buf[cid_start] == 0x12 and buf[cid_start + 1] == 0x20:
+        return True  # CIDv0
+    _, index = decode_varint(buf, cid_start)
+    codec, _ = decode_varint(buf, index)
+    return codec == 0x70
+
+
+# ------------------------------------------------------------------ Python
+
+
+LinkFields = tuple[int, int, int, int, int, bool]
+
+
+def _scan_block(buf: BytesLike, start: int, end: int) -> list[LinkFields]:
+    """
+    The links of the block at buf[start:end] as (hash_offset, hash_length,
+    name_offset, name_length, t_size, has_t_size) tuples, following the rules
+    of _decode_node() and _decode_link(). Raises if the block is invalid.
+    """
+    links = []
+    index = start
+    has_data = has_links = links_before_data = False
+    while index < end:
+        wire, index = decode_varint(buf, index, end)
+        if wire & 0x7 != 2 or wire >> 3 not in (1, 2):
+            raise ValueError("invalid field")
+        length, index = decode_varint(buf, index, end)
+        field_end = index + length
+        if field_end > end:
+            raise EOFError("unexpected end of data")
+
+        if wire >> 3 == 1:
+            if has_data:
+                raise ValueError("duplicate Data section")
+            has_data = True
+            links_before_data = has_links
+        else:
+            if links_before_data:
+                raise ValueError("duplicate Links section")
+            links.append(_scan_link(buf, index, field_end))
+            has_links = True
+        index = field_end
+    return links
+
+
+def _scan_link(buf: BytesLike, index: int, end: int) -> LinkFields:
+    hash_offset = name_offset = -1
+    hash_length = name_length = t_size = 0
+    has_t_size = False
+    last = 0  # fields must appear in order, at most once each
+    while index < end:
+        wire, index = decode_varint(buf, index, end)
+        field = wire >> 3
+        if field not in (1, 2, 3) or field <= last or wire & 0x7 != (0 if field == 3 else 2):
+            raise ValueError("invalid link field")
+        last = field
+        if field == 3:
+            t_size, index = decode_varint(buf, index, end)
+            if t_size >= 2**64:
+                raise OverflowError("t_size does not fit 64 bits")
+            has_t_size = True
+            continue
+        length, index = decode_varint(buf, index, end)
+        if index + length > end:
+            raise EOFError("unexpected end of data")
+        if field == 1:
+            hash_offset, hash_length = index, length
+        else:
+            name_offset, name_length = index, length
+        index += length
+    return (hash_offset, hash_length, name_offset, name_length, t_size, has_t_size)
+
+
+def _scan_python(
+    buf: BytesLike, offsets: Sequence[int], lengths: Sequence[int]
+) -> LinkColumns:
+    valid = array("b")
+    link_count = array("q")
+    columns = [array(code) for code in ("q", "q", "q", "q", "q", "Q", "b")]
+    for block, (offset, length) in enumerate(zip(offsets, lengths)):
+        if offset < 0 or offset + length > len(buf):
+            raise ValueError("scan_links: block extends past the end of the buffer")
+        try:
+            links = _scan_block(buf, offset, offset + length)
+        except (ValueError, EOFError, OverflowError):
+            valid.append(False)
+            link_count.append(0)
+            continue
+        valid.append(True)
+        link_count.append(len(links))
+        for link in links:
+            columns[0].append(block)
+            for column, value in zip(columns[1:], link):
+                column.append(value)
+    return LinkColumns(
+        block_offset=array("q", offsets),
+        block_length=array("q", lengths),
+        valid=valid,
+        link_count=link_count,
+        **dict(zip(link_columns, columns)),
+    )
+
+
+# ------------------------------------------------------------------- NumPy
+
+
+def _read_varints(data: Any, pos: Any, end: Any) -> tuple[Any, Any, Any]:
+    """
+    Decodes the varints at positions `pos`, each of which must end before the
+    matching `end`. Returns (values, positions after them, ok).
+    """
+    last = len(data) - 1
+    byte = data[numpy.minimum(pos, last)]
+    values = (byte & 0x7F).astype(numpy.uint64)
+    after = pos + 1
+    # most varints are one or two bytes, so only continue the rows that need it
+    rows = numpy.flatnonzero(byte >= 0x80)
+    for shift in range(7, 70, 7):
+        if rows.size == 0:
+            break
+        byte = data[numpy.minimum(after[rows], last)]
+        if shift == 63:
+            byte = numpy.where(byte > 1, 0xFF, byte)  # more than 64 bits
+        values[rows] |= (byte & 0x7F).astype(numpy.uint64) << numpy.uint64(shift)
+        after[rows] += 1
+        rows = rows[byte >= 0x80]
+    ok = after <= end
+    if rows.size:
+        ok[rows] = False
+    return (values, after, ok)
+
+
+def _read_lengths(data: Any, pos: Any, end: Any) -> tuple[Any, Any, Any]:
+    """
+    Like _read_varints() for length prefixes, which must not overrun `end`.
+    Returns (start, stop, ok) of the length-prefixed bytes.
+    """
+    values, start, ok = _read_varints(data, pos, end)
+    ok &= values <= numpy.maximum(end - start, 0).astype(numpy.uint64)
+    stop = start + numpy.where(ok, values, 0).astype(numpy.int64)
+    return (start, stop, ok)
+
+
+def _optional_field(
+    data: Any, pos: Any, end: Any, key: int, varint: bool
+) -> tuple[Any, Any, Any, Any]:
+    """
+    Reads the field with single-byte `key` where present at `pos`. Returns
+    (present, start or value, stop, ok); `stop` is `pos` where absent.
+    """
+    present = (pos < end) & (data[numpy.minimum(pos, len(data) - 1)] == key)
+    if varint:
+        first, stop, ok = _read_varints(data, pos + 1, end)
+    else:
+        first, stop, ok = _read_lengths(data, pos + 1, end)
+    ok |= ~present
+    return (present, first, numpy.where(present & ok, stop, pos), ok)
+
+
+def _scan_numpy(
+    buf: BytesLike, offsets: Sequence[int], lengths: Sequence[int]
+) -> LinkColumns:
+    data = numpy.frombuffer(buf, dtype=numpy.uint8)
+    block_offset = numpy.asarray(offsets, dtype=numpy.int64)
+    block_length = numpy.asarray(lengths, dtype=numpy.int64)
+    n = len(block_offset)
+    end = block_offset + block_length
+    if n and (block_offset.min() < 0 or end.max() > len(data)):
+        raise ValueError("scan_links: block extends past the end of the buffer")
+
+    pos = block_offset.copy()
+    valid = numpy.ones(n, dtype=bool)
+    # blocks the lock-step scanner can't handle, e.g. multi-byte keys
+    deferred = numpy.zeros(n, dtype=bool)
+    has_data = numpy.zeros(n, dtype=bool)
+    has_links = numpy.zeros(n, dtype=bool)
+    links_before_data = numpy.zeros(n, dtype=bool)
+    steps: list[tuple[Any, ...]] = []
+
+    active = numpy.flatnonzero(pos < end)
+    while active.size:
+        p = pos[active]
+        e = end[active]
+        key = data[p]
+        is_data = key == 0x0A
+        is_link = key == 0x12
+        start, stop, ok = _read_lengths(data, p + 1, e)
+        irregular = ~(is_data | is_link)
+        bad = ~ok | (is_data & has_data[active]) | (is_link & links_before_data[active])
+
+        link = is_link & ok
+        h_present, h_start, h_stop, h_ok = _optional_field(data, start, stop, 0x0A, False)
+        n_present, n_start, n_stop, n_ok = _optional_field(data, h_stop, stop, 0x12, False)
+        t_present, t_value, q, t_ok = _optional_field(data, n_stop, stop, 0x18, True)
+        # anything left over is another field order, a bad field or a
+        # multi-byte key: leave it to the Python scanner to decide
+        irregular |= link & ((q != stop) | ~(h_ok & n_ok & t_ok))
+
+        done = bad | irregular
+        valid[active[bad & ~irregular]] = False
+        deferred[active[irregular]] = True
+        take = link & ~done
+        steps.append((
+            active[take],
+            numpy.where(h_present, h_start, -1)[take],
+            numpy.where(h_present, h_stop - h_start, 0)[take],
+            numpy.where(n_present, n_start, -1)[take],
+            numpy.where(n_present, n_stop - n_start, 0)[take],
+            numpy.where(t_present, t_value, 0)[take],
+            t_present[take],
+        ))
+        blocks = active[is_data & ~done]
+        links_before_data[blocks] = has_links[blocks]
+        has_data[blocks] = True
+        has_links[active[take]] = True
+
+        pos[active] = numpy.where(done, e, stop)
+        active = active[pos[active] < e]
+    return _assemble(buf, block_offset, block_length, valid, deferred, steps)
+
+
+def _assemble(
+    buf: BytesLike,
+    block_offset: Any,
+    block_length: Any,
+    valid: Any,
+    deferred: Any,
+    steps: list[tuple[Any, ...]],
+) -> LinkColumns:
+    int64 = numpy.int64
+    dtypes = (int64, int64, int64, int64, int64, numpy.uint64, bool)
+    if steps:
+        columns = [
+            numpy.concatenate(parts).astype(dtype)
+            for parts, dtype in zip(zip(*steps), dtypes)
+        ]
+    else:
+        columns = [numpy.zeros(0, dtype=dtype) for dtype in dtypes]
+    keep = ~deferred[columns[0]] & valid[columns[0]]
+    columns = [c[keep] for c in columns]
+
+    extra: list[tuple[Any, ...]] = []
+    for block in numpy.flatnonzero(deferred):
+        offset = int(block_offset[block])
+        try:
+            links = _scan_block(buf, offset, offset + int(block_length[block]))
+        except (ValueError, EOFError, OverflowError):
+            valid[block] = False
+            continue
+        extra.extend((block,) + link for link in links)
+    if extra:
+        columns = [
+            numpy.concatenate((column, numpy.array(values, dtype=dtype)))
+            for column, values, dtype in zip(columns, zip(*extra), dtypes)
+        ]
+
+    # each step took at most one link per block, so a stable sort by block
+    # restores the link order within blocks
+    order = numpy.argsort(columns[0], kind="stable")
+    columns = [c[order] for c in columns]
+    link_count = numpy.bincount(columns[0], minlength=len(valid)).astype(numpy.int64)
+    return LinkColumns(
+        block_offset=block_offset,
+        block_length=block_length,
+        valid=valid,
+        link_count=link_count,
+        **dict(zip(link_columns, columns)),
+    )
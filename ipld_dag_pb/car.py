@@ -0,0 +1,237 @@
+"""
+Minimal reader for CAR (Content Addressable aRchive) files, versions 1 and 2:
+https://ipld.io/specs/transport/car/
+
+Only the block sections are parsed. The CARv1 header (DAG-CBOR) is skipped
+rather than decoded, so the roots are not available. CARv2 indexes can be
+written and searched in the IndexSorted format.
+"""
+
+from typing import Final, Iterable, Iterator, NamedTuple, Optional
+from .decode import decode_varint
+from .encode import encode_varint, sov
+from .node import BytesLike
+
+carv2_pragma: Final = bytes.fromhex("0aa16776657273696f6e02")
+""" The fixed bytes every CARv2 file starts with. """
+
+carv2_header_size: Final = 40
+
+dag_pb_code: Final = 0x70
+
+index_sorted_code: Final = 0x0400
+""" The multicodec of the CARv2 IndexSorted index format. """
+
+
+class Section(NamedTuple):
+    """
+    A block section of a CAR file. `offset` is the position of the section's
+    length prefix within the buffer that was read.
+    """
+
+    cid: memoryview
+    block: memoryview
+    offset: int
+
+
+def _cbor_head(major: int, n: int) -> bytes:
+    if n < 24:
+        return bytes([major << 5 | n])
+    for info, width in ((24, 1), (25, 2), (26, 4), (27, 8)):
+        if n < 1 << (8 * width):
+            return bytes([major << 5 | info]) + n.to_bytes(width, "big")
+    raise ValueError("car: length too large for CBOR")
+
+
+def encode_header(roots: list[BytesLike]) -> bytes:
+    """
+    The length-prefixed CARv1 header, `{"roots": [...], "version": 1}` in
+    DAG-CBOR, for the given binary root CIDs.
+    """
+    header = bytearray(b"\xa2\x65roots")
+    header += _cbor_head(4, len(roots))
+    for root in roots:
+        header += b"\xd8\x2a"  # tag 42, a CID
+        header += _cbor_head(2, len(root) + 1)
+        header += b"\x00"
+        header += root
+    header += b"\x67version\x01"
+    prefix = memoryview(bytearray(sov(len(header))))
+    encode_varint(prefix, len(prefix), len(header))
+    return bytes(prefix) + bytes(header)
+
+
+def data_bounds(buf: BytesLike) -> tuple[int, int]:
+    """
+    The (start, end) of the CARv1 payload, which is the whole buffer for a
+    CARv1 file and the wrapped data for a CARv2 file.
+    """
+    if bytes(buf[: len(carv2_pragma)]) != carv2_pragma:
+        return (0, len(buf))
+    header = bytes(buf[len(carv2_pragma) : len(carv2_pragma) + carv2_header_size])
+    if len(header) != carv2_header_size:
+        raise EOFError("car: unexpected end of data in CARv2 header")
+    start = int.from_bytes(header[16:24], "little")
+    size = int.from_bytes(header[24:32], "little")
+    if start + size > len(buf):
+        raise EOFError("car: CARv2 data payload extends past end of file")
+    return (start, start + size)
+
+
+def first_section(buf: BytesLike, start: int = 0) -> int:
+    """
+    The offset of the first block section of the CARv1 payload at `start`.
+    """
+    header_len, offset = decode_varint(buf, start)
+    offset += header_len
+    if offset > len(buf):
+        raise EOFError("car: unexpected end of data in header")
+    return offset
+
+
+def cid_length(buf: BytesLike, offset: int) -> int:
+    """
+    The length in bytes of the binary CID starting at `offset`.
+    """
+    if offset + 1 < len(buf) and buf[offset] == 0x12 and buf[offset + 1] == 0x20:
+        return 34  # CIDv0, a bare sha2-256 multihash
+    index = offset
+    for _ in range(3):  # version, codec, multihash code
+        _, index = decode_varint(buf, index)
+    digest_len, index = decode_varint(buf, index)
+    return index + digest_len - offset
+
+
+def cid_codec(cid: BytesLike) -> int:
+    """
+    The multicodec of a binary CID, without fully decoding it.
+    """
+    if len(cid) == 34 and cid[0] == 0x12 and cid[1] == 0x20:
+        return dag_pb_code
+    _, index = decode_varint(cid, 0)
+    codec, _ = decode_varint(cid, index)
+    return codec
+
+
+def cid_multihash(cid: BytesLike) -> BytesLike:
+    """
+    The multihash of a binary CID, as a slice of `cid`.
+    """
+    if len(cid) == 34 and cid[0] == 0x12 and cid[1] == 0x20:
+        return cid  # CIDv0, a bare sha2-256 multihash
+    _, index = decode_varint(cid, 0)
+    _, index = decode_varint(cid, index)
+    return cid[index:]
+
+
+def iter_section_bounds(
+    buf: BytesLike, offset: int, end: int
+) -> Iterator[tuple[int, int, int, int]]:
+    """
+    Yields `(offset, cid_start, block_start, section_end)` for each block
+    section between `offset` and `end`, without slicing `buf`.
+    """
+    while offset < end:
+        length, start = decode_varint(buf, offset)
+        section_end = start + length
+        if length == 0 or section_end > end:
+            raise EOFError("car: unexpected end of data in section at " + str(offset))
+        n = cid_length(buf, start)
+        if start + n > section_end:
+            raise ValueError("car: CID overruns section at " + str(offset))
+        yield (offset, start, start + n, section_end)
+        offset = section_end
+
+
+def iter_sections(buf: BytesLike, offset: int, end: int) -> Iterator[Section]:
+    """
+    Yields the block sections between `offset` and `end`. The CID and block are
+    views into `buf`.
+    """
+    view = memoryview(buf)
+    for section, cid_start, block_start, section_end in iter_section_bounds(view, offset, end):
+        yield Section(view[cid_start:block_start], view[block_start:section_end], section)
+
+
+def read_car(buf: BytesLike) -> Iterator[Section]:
+    """
+    Yields every block section of a CARv1 or CARv2 file held in `buf`.
+    """
+    start, end = data_bounds(buf)
+    return iter_sections(buf, first_section(buf, start), end)
+
+
+def _varint(n: int) -> bytes:
+    buf = memoryview(bytearray(sov(n)))
+    encode_varint(buf, len(buf), n)
+    return bytes(buf)
+
+
+def encode_carv2_header(data_offset: int, data_size: int, index_offset: int) -> bytes:
+    """
+    The CARv2 pragma and header for a file whose CARv1 payload of `data_size`
+    bytes starts at `data_offset`, followed by an index at `index_offset` (0
+    for none).
+    """
+    return (
+        carv2_pragma
+        + bytes(16)  # characteristics
+        + data_offset.to_bytes(8, "little")
+        + data_size.to_bytes(8, "little")
+        + index_offset.to_bytes(8, "little")
+    )
+
+
+def encode_index_sorted(entries: Iterable[tuple[BytesLike, int]]) -> bytes:
+    """
+    A CARv2 index in the IndexSorted format from `(digest, offset)` pairs: the
+    digest of each block's multihash (without the hash code and length) and
+    the offset of its section from the start of the CARv1 payload. Entries are
+    bucketed by digest length and sorted by digest within each bucket.
+    """
+    buckets: dict[int, list[bytes]] = {}
+    for digest, offset in entries:
+        record = bytes(digest) + offset.to_bytes(8, "little")
+        buckets.setdefault(len(record), []).append(record)
+    out = bytearray(_varint(index_sorted_code))
+    out += len(buckets).to_bytes(4, "little")
+    for width in sorted(buckets):
+        records = sorted(buckets[width])
+        out += width.to_bytes(4, "little")
+        out += (width * len(records)).to_bytes(8, "little")
+        out += b"".join(records)
+    return bytes(out)
+
+
+def index_lookup(index: BytesLike, digest: BytesLike) -> Optional[int]:
+    """
+    The payload offset of the section holding the block with multihash
+    `digest` in an IndexSorted `index`, or None if it is not indexed.
+    """
+    view = memoryview(index)
+    codec, pos = decode_varint(view, 0)
+    if codec != index_sorted_code:
+        raise ValueError(f"car: unsupported index codec 0x{codec:x}")
+    key = bytes(digest)
+    buckets = int.from_bytes(view[pos : pos + 4], "little")
+    pos += 4
+    for _ in range(buckets):
+        width = int.from_bytes(view[pos : pos + 4], "little")
+        size = int.from_bytes(view[pos + 4 : pos + 12], "little")
+        pos += 12
+        if pos + size > len(view):
+            raise EOFError("car: unexpected end of data in index")
+        if width == len(key) + 8:
+            lo, hi = 0, size // width
+            while lo < hi:
+                mid = (lo + hi) // 2
+                at = pos + mid * width
+                if bytes(view[at : at + len(key)]) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            at = pos + lo * width
+            if lo < size // width and view[at : at + len(key)] == key:
+                return int.from_bytes(view[at + len(key) : at + width], "little")
+        pos += size
+    return None
@@ -0,0 +1,393 @@
+"""
+``ipld-dag-pb`` command-line tool for inspecting, validating and re-encoding
+DAG-PB blocks in bulk.
+
+Inputs are block files, CAR files (by their ``.car`` extension) or directories
+of either, which are walked recursively. Work is spread over a process pool;
+progress and throughput are reported on stderr.
+
+* ``dump`` prints one JSON object per block with the node in DAG-JSON form
+* ``validate`` checks that each block is well-formed and in canonical form
+  (links sorted by name, links before data, minimal varints) without decoding
+  it; exits 1 otherwise
+* ``canonicalize`` re-encodes each block canonically into an output directory
+  and prints the old and new CIDs
+* ``verify-car`` checks each CAR file's blocks against their CIDs and for
+  dangling links (see :func:`ipld_dag_pb.verify.verify_car`), printing one JSON
+  object per file; with an output directory, also writes each file there as a
+  CARv2 file with an index
+"""
+
+import argparse
+import json
+import mmap
+import os
+import sys
+from base64 import b64encode
+from concurrent.futures import Future, ProcessPoolExecutor
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Iterator, NamedTuple, Optional, TextIO
+from . import code, decode
+from .car import (
+    cid_codec,
+    dag_pb_code,
+    data_bounds,
+    first_section,
+    iter_section_bounds,
+    iter_sections,
+)
+from .decode import decode_node, validate_bytes
+from .encode import encode_node
+from .node import BytesLike, PBNode
+from .util import cid_class
+from .verify import verify_car, write_carv2
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+batch_size = 1024
+""" Number of CAR sections handed to a worker at a time. """
+
+
+class Task(NamedTuple):
+    """
+    A unit of work: a whole block file (`end` is -1) or the CAR sections
+    between `offset` and `end` of a CAR file.
+    """
+
+    path: str
+    offset: int
+    end: int
+
+
+class Result(NamedTuple):
+    records: list[dict[str, Any]]
+    blocks: int
+    bytes: int
+    skipped: int
+    failed: int
+
+
+def cid_string(cid: "CID") -> str:
+    """
+    The conventional string form of a CID: base58btc for CIDv0, base32 for CIDv1.
+    """
+    return str(cid if cid.version == 0 else cid.set(base="base32"))
+
+
+def to_dag_json(node: PBNode) -> dict[str, Any]:
+    """
+    The DAG-JSON form of a PBNode.
+    """
+    form: dict[str, Any] = {}
+    if node.data is not None:
+        data = b64encode(node.data).decode("ascii").rstrip("=")
+        form["Data"] = {"/": {"bytes": data}}
+    links = []
+    for link in node.links:
+        l: dict[str, Any] = {"Hash": {"/": cid_string(link.hash)}}
+        if link.name is not None:
+            l["Name"] = link.name
+        if link.t_size is not None:
+            l["Tsize"] = link.t_size
+        links.append(l)
+    form["Links"] = links
+    return form
+
+
+def canonical_problem(buf: BytesLike) -> Optional[str]:
+    """
+    Describes why `buf` is not a valid, canonically encoded PBNode, or returns
+    None if it is. Link CIDs are checked for well-formedness only.
+    """
+    try:
+        validate_bytes(buf)
+    except Exception as e:  # pylint: disable=broad-except
+        try:
+            validate_bytes(buf, canonical=False)
+        except Exception as invalid:  # pylint: disable=broad-except
+            return "invalid: " + str(invalid)
+        return str(e)
+    return None
+
+
+def canonicalize(buf: BytesLike) -> memoryview:
+    """
+    Re-encodes the PBNode in `buf` in canonical form.
+    """
+    raw = decode_node(buf)
+    raw.links.sort(key=lambda l: l.name.encode("utf-8") if hasattr(l, "name") else b"")
+    return encode_node(raw)
+
+
+def block_cid(buf: BytesLike) -> "CID":
+    from multiformats import multihash  # pylint: disable=import-outside-toplevel
+
+    return cid_class()("base32", 1, code, multihash.digest(buf, "sha2-256"))
+
+
+def _blocks(task: Task) -> Iterator[tuple[Optional[memoryview], memoryview]]:
+    with open(task.path, "rb") as f:
+        if task.end < 0:
+            yield (None, memoryview(f.read()))
+            return
+        f.seek(task.offset)
+        buf = f.read(task.end - task.offset)
+    for section in iter_sections(buf, 0, len(buf)):
+        yield (section.cid, section.block)
+
+
+def _process(command: str, task: Task, outdir: Optional[str]) -> Result:
+    records: list[dict[str, Any]] = []
+    blocks = size = skipped = failed = 0
+
+    for cid, block in _blocks(task):
+        if cid is not None and cid_codec(cid) != dag_pb_code:
+            skipped += 1
+            continue
+        blocks += 1
+        size += len(block)
+        record: dict[str, Any] = {"source": task.path}
+        if cid is not None:
+            try:
+                record["cid"] = cid_string(cid_class().decode(bytes(cid)))
+            except (KeyError, ValueError) as e:
+                record["cid"] = bytes(cid).hex()  # codes multiformats does not know
+                record["error"] = "invalid CID: " + str(e)
+                if command == "validate":
+                    record["valid"] = False
+                failed += 1
+                records.append(record)
+                continue
+
+        if command == "dump":
+            try:
+                record["node"] = to_dag_json(decode(block))
+            except Exception as e:  # pylint: disable=broad-except
+                record["error"] = str(e)
+                failed += 1
+        elif command == "validate":
+            problem = canonical_problem(block)
+            record["valid"] = problem is None
+            if problem is not None:
+                record["reason"] = problem
+                failed += 1
+        else:
+            try:
+                out = canonicalize(block)
+            except Exception as e:  # pylint: disable=broad-except
+                record["error"] = str(e)
+                failed += 1
+            else:
+                new_cid = block_cid(out)
+                record["canonical_cid"] = str(new_cid)
+                record["changed"] = bytes(out) != bytes(block)
+                assert outdir is not None
+                with open(os.path.join(outdir, str(new_cid)), "wb") as f:
+                    f.write(out)
+        records.append(record)
+
+    return Result(records, blocks, size, skipped, failed)
+
+
+def _car_tasks(path: str) -> Iterator[Task]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise EOFError("car: empty file " + path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                start, end = data_bounds(view)
+                batch_start = -1
+                section_end = 0
+                for i, (offset, _, _, section_end) in enumerate(
+                    iter_section_bounds(view, first_section(view, start), end)
+                ):
+                    if i % batch_size == 0:
+                        if batch_start >= 0:
+                            yield Task(path, batch_start, offset)
+                        batch_start = offset
+                if batch_start >= 0:
+                    yield Task(path, batch_start, section_end)
+            finally:
+                view.release()
+
+
+def plan(paths: list[str]) -> Iterator[Task]:
+    """
+    Splits the inputs into tasks: one per block file and one per batch of
+    sections of each CAR file.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                yield from plan([os.path.join(root, f) for f in sorted(files)])
+        elif path.endswith(".car"):
+            yield from _car_tasks(path)
+        else:
+            yield Task(path, 0, -1)
+
+
+class Progress:
+    """
+    Tracks throughput and periodically reports it on a stream.
+    """
+
+    def __init__(self, out: TextIO, live: bool) -> None:
+        self.out = out
+        self.live = live
+        self.start = monotonic()
+        self.last = 0.0
+        self.blocks = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def add(self, result: Result) -> None:
+        self.blocks += result.blocks
+        self.bytes += result.bytes
+        self.skipped += result.skipped
+        self.failed += result.failed
+        now = monotonic()
+        if self.live and now - self.last >= 0.5:
+            self.last = now
+            self.out.write("\r" + self.summary())
+            self.out.flush()
+
+    def summary(self) -> str:
+        elapsed = max(monotonic() - self.start, 1e-9)
+        return (
+            f"{self.blocks} blocks, {self.bytes / 2**20:.1f} MiB in {elapsed:.2f}s "
+            f"({self.blocks / elapsed:.0f} blocks/s, {self.bytes / 2**20 / elapsed:.1f} MiB/s), "
+            f"{self.failed} failed, {self.skipped} skipped"
+        )
+
+    def finish(self) -> None:
+        self.out.write(("\r" if self.live else "") + self.summary() + "\n")
+
+
+def run(
+    command: str,
+    paths: list[str],
+    jobs: int = 1,
+    outdir: Optional[str] = None,
+    out: TextIO = sys.stdout,
+    progress: Optional[Progress] = None,
+) -> Progress:
+    """
+    Runs `command` over `paths`, writing one JSON line per block to `out`.
+    """
+    progress = progress or Progress(sys.stderr, False)
+
+    def emit(result: Result) -> None:
+        for record in result.records:
+            out.write(json.dumps(record) + "\n")
+        progress.add(result)
+
+    if jobs <= 1:
+        for task in plan(paths):
+            emit(_process(command, task, outdir))
+        return progress
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending: list[Future[Result]] = []
+        for task in plan(paths):
+            pending.append(pool.submit(_process, command, task, outdir))
+            # emit in order while keeping the pool busy
+            while pending and (pending[0].done() or len(pending) > 4 * jobs):
+                emit(pending.pop(0).result())
+        for fut in pending:
+            emit(fut.result())
+    return progress
+
+
+def verify_cars(
+    paths: list[str],
+    jobs: int = 1,
+    outdir: Optional[str] = None,
+    out: TextIO = sys.stdout,
+    progress: Optional[Progress] = None,
+) -> Progress:
+    """
+    Verifies the CAR files `paths`, writing one JSON line per file to `out`.
+    """
+    progress = progress or Progress(sys.stderr, False)
+    CID = cid_class()  # pylint: disable=invalid-name
+
+    def cid(buf: bytes) -> str:
+        try:
+            return cid_string(CID.decode(buf))
+        except (KeyError, ValueError):
+            return buf.hex()  # codes multiformats does not know
+
+    for path in paths:
+        report = verify_car(path, jobs)
+        record: dict[str, Any] = {
+            "source": path,
+            "blocks": report.blocks,
+            "bytes": report.size,
+            "ok": report.ok,
+            "problems": [
+                {"offset": p.offset, "cid": cid(p.cid), "error": p.message}
+                for p in report.problems
+            ],
+            "dangling": [cid(link) for link in report.dangling],
+            "seconds": round(report.seconds, 6),
+        }
+        if outdir is not None:
+            write_carv2(path, os.path.join(outdir, os.path.basename(path)), report.carv2_index)
+        out.write(json.dumps(record) + "\n")
+        failed = len(report.problems) + (1 if report.dangling else 0)
+        progress.add(Result([], report.blocks, report.size, 0, failed))
+    return progress
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="ipld-dag-pb", description="Inspect, validate and re-encode DAG-PB blocks."
+    )
+    parser.add_argument(
+        "command",
+        choices=("dump", "validate", "canonicalize", "verify-car"),
+        help="what to do with each block",
+    )
+    parser.add_argument("paths", nargs="+", help="block files, CAR files or directories")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes"
+    )
+    parser.add_argument("-o", "--output", help="output directory for canonicalize or verify-car")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress or stats")
+    args = parser.parse_args(argv)
+
+    if args.command == "canonicalize":
+        if not args.output:
+            parser.error("canonicalize requires --output")
+        os.makedirs(args.output, exist_ok=True)
+
+    devnull = open(os.devnull, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+    try:
+        stream = devnull if args.quiet else sys.stderr
+        if args.command == "verify-car":
+            if args.output:
+                os.makedirs(args.output, exist_ok=True)
+            progress = verify_cars(
+                args.paths, args.jobs, args.output, sys.stdout, Progress(stream, stream.isatty())
+            )
+        else:
+            progress = run(
+                args.command,
+                args.paths,
+                args.jobs,
+                args.output,
+                sys.stdout,
+                Progress(stream, stream.isatty()),
+            )
+        progress.finish()
+    finally:
+        devnull.close()
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,18 @@
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
+from . import backend
+from .encode import size_link
 from .node import BytesLike, RawPBLink, RawPBNode
 
 
-def decode_varint(buf: BytesLike, offset: int) -> Tuple[int, int]:
+def decode_varint(buf: BytesLike, offset: int, end: Optional[int] = None) -> Tuple[int, int]:
+    if end is None:
+        end = len(buf)
     v = 0
     shift = 0
     while True:
         if shift >= 64:
             raise OverflowError("protobuf: varint overflow")
-        if offset >= len(buf):
+        if offset >= end:
             raise EOFError("protobuf: unexpected end of data")
 
         b = buf[offset]
@@ -34,13 +38,167 @@ def decode_bytes(buf: BytesLike, offset: int) -> Tuple[BytesLike, int]:
     return (buf[offset:post_offset], post_offset)
 
 
-def decode_key(buf: BytesLike, index: int) -> Tuple[int, int, int]:
-    wire, index = decode_varint(buf, index)
+def decode_key(buf: BytesLike, index: int, end: Optional[int] = None) -> Tuple[int, int, int]:
+    wire, index = decode_varint(buf, index, end)
     # (wire_type, field_num, new_index)
     return (wire & 0x7, wire >> 3, index)
 
 
+class DecodeLimits:
+    """
+    Bounds on the resources decode_node() may spend on a block, for decoding
+    untrusted input. Each is checked before the corresponding objects are
+    created; None means unlimited. Exceeding a limit raises ValueError.
+    """
+
+    max_block_size: Optional[int]
+    """ Maximum size of the block in bytes, checked before decoding starts. """
+    max_links: Optional[int]
+    max_name_length: Optional[int]
+    """ Maximum length of a link Name, in UTF-8 bytes. """
+    max_hash_length: Optional[int]
+    """ Maximum length of a link Hash (binary CID), in bytes. """
+
+    def __init__(
+        self,
+        max_block_size: Optional[int] = None,
+        max_links: Optional[int] = None,
+        max_name_length: Optional[int] = None,
+        max_hash_length: Optional[int] = None,
+    ) -> None:
+        for limit in (max_block_size, max_links, max_name_length, max_hash_length):
+            if limit is not None and limit < 0:
+                raise ValueError("DecodeLimits: limits cannot be negative")
+        self.max_block_size = max_block_size
+        self.max_links = max_links
+        self.max_name_length = max_name_length
+        self.max_hash_length = max_hash_length
+
+    def check_block_size(self, size: int) -> None:
+        if self.max_block_size is not None and size > self.max_block_size:
+            raise ValueError(
+                "protobuf: (PBNode) block size "
+                + str(size)
+                + " exceeds limit of "
+                + str(self.max_block_size)
+                + " bytes"
+            )
+
+
+def _check_length(
+    buf: BytesLike, offset: int, limit: Optional[int], what: str, end: Optional[int] = None
+) -> None:
+    """
+    Raises if the length prefix at `offset` exceeds `limit`, before the bytes
+    it describes are sliced.
+    """
+    if limit is None:
+        return
+    length, _ = decode_varint(buf, offset, end)
+    if length > limit:
+        raise ValueError(
+            "protobuf: (PBLink) "
+            + what
+            + " length "
+            + str(length)
+            + " exceeds limit of "
+            + str(limit)
+            + " bytes"
+        )
+
+
 def decode_link(buf: BytesLike) -> RawPBLink:
+    if backend.speedups is not None:
+        link = backend.speedups.decode_link(buf)
+        if link is not NotImplemented:
+            return link  # type: ignore[no-any-return]
+    return _decode_link(buf)
+
+
+def decode_node(
+    buf: BytesLike,
+    keep_records: bool = False,
+    limits: Optional[DecodeLimits] = None,
+    fields: Optional[str] = None,
+    link_slice: Optional[slice] = None,
+) -> RawPBNode:
+    """
+    Decodes the bytes of a PBNode. When `keep_records` is set, each link in
+    canonical form also carries its encoded bytes as `record` so that an
+    unchanged link can be spliced back verbatim by the encoder. `limits` bounds the work done on
+    untrusted input.
+
+    `fields` ("data" or "links") and `link_slice` decode only part of the
+    node, e.g. one page of a large directory: the Data is left out unless
+    requested, and only the links selected by `link_slice` are created. The
+    whole block is still checked, the other links as :func:`validate_bytes`
+    checks them, so a block is only accepted if decoding all of it would
+    succeed.
+    """
+    if limits is not None:
+        limits.check_block_size(len(buf))
+    if fields is not None or link_slice is not None:
+        want_data, link_slice = _selection(fields, link_slice)
+        if backend.speedups is not None:
+            max_links = max_name_length = max_hash_length = None
+            if limits is not None:
+                max_links = limits.max_links
+                max_name_length = limits.max_name_length
+                max_hash_length = limits.max_hash_length
+            node = backend.speedups.decode_node(
+                buf,
+                keep_records,
+                _c_bound(max_links),
+                _c_bound(max_name_length),
+                _c_bound(max_hash_length),
+                want_data,
+                link_slice,
+            )
+            if node is not NotImplemented:
+                return node  # type: ignore[no-any-return]
+        return _decode_node_partial(buf, keep_records, limits, want_data, link_slice)
+    if backend.speedups is not None:
+        if limits is None:
+            node = backend.speedups.decode_node(buf, keep_records)
+        else:
+            node = backend.speedups.decode_node(
+                buf,
+                keep_records,
+                _c_bound(limits.max_links),
+                _c_bound(limits.max_name_length),
+                _c_bound(limits.max_hash_length),
+            )
+        if node is not NotImplemented:
+            return node  # type: ignore[no-any-return]
+    return _decode_node(buf, keep_records, limits)
+
+
+def _selection(fields: Optional[str], link_slice: Optional[slice]) -> Tuple[bool, slice]:
+    """
+    Resolves the `fields` and `link_slice` arguments of decode_node() into
+    whether to decode Data and which links to decode.
+    """
+    if fields not in (None, "data", "links"):
+        raise ValueError("decode: fields must be 'data' or 'links', not " + repr(fields))
+    if link_slice is not None and not isinstance(link_slice, slice):
+        raise TypeError("decode: link_slice must be a slice, not " + type(link_slice).__name__)
+    if fields == "data":
+        if link_slice is not None:
+            raise ValueError("decode: link_slice cannot be used with fields='data'")
+        return (True, slice(0, 0))
+    return (fields is None, slice(None) if link_slice is None else link_slice)
+
+
+def _c_bound(limit: Optional[int]) -> int:
+    # the accelerator takes -1 for no limit and cannot represent larger ones
+    return -1 if limit is None or limit >= 2**62 else limit
+
+
+def _decode_link(
+    buf: BytesLike,
+    max_name_length: Optional[int] = None,
+    max_hash_length: Optional[int] = None,
+) -> RawPBLink:
     link = RawPBLink()
     l = len(buf)
     index = 0
@@ -66,6 +224,7 @@ def decode_link(buf: BytesLike) -> RawPBLink:
                     "protobuf: (PBLink) invalid order, found Tsize before Hash"
                 )
 
+            _check_length(buf, index, max_hash_length, "Hash")
             link.hash, index = decode_bytes(buf, index)
         elif field_num == 2:
             if hasattr(link, "name"):
@@ -81,6 +240,7 @@ def decode_link(buf: BytesLike) -> RawPBLink:
                     "protobuf: (PBLink) invalid order, found Tsize before Name"
                 )
 
+            _check_length(buf, index, max_name_length, "Name")
             byts, index = decode_bytes(buf, index)
             link.name = str(byts, "utf-8")
         elif field_num == 3:
@@ -106,9 +266,26 @@ def decode_link(buf: BytesLike) -> RawPBLink:
     return link
 
 
-def decode_node(buf: BytesLike) -> RawPBNode:
+def _is_canonical_link(link: RawPBLink, byts: BytesLike) -> bool:
+    """
+    Whether `byts`, which _decode_link() decoded to `link`, are what encoding
+    `link` would produce. The field order is already enforced, so only
+    non-minimal varints can make them longer; such links get no `record`, so
+    that re-encoding them yields the canonical form.
+    """
+    return size_link(link) == len(byts)
+
+
+def _decode_node(
+    buf: BytesLike, keep_records: bool = False, limits: Optional[DecodeLimits] = None
+) -> RawPBNode:
     l = len(buf)
     index = 0
+    max_links = max_name_length = max_hash_length = None
+    if limits is not None:
+        max_links = limits.max_links
+        max_name_length = limits.max_name_length
+        max_hash_length = limits.max_hash_length
     links: Union[list[RawPBLink], None] = None
     links_before_data = False
     data: Union[BytesLike, None] = None
@@ -134,9 +311,16 @@ def decode_node(buf: BytesLike) -> RawPBNode:
                 raise Exception("protobuf: (PBNode) duplicate Links section")
             elif links is None:
                 links = []
+            if max_links is not None and len(links) >= max_links:
+                raise ValueError(
+                    "protobuf: (PBNode) more than " + str(max_links) + " links"
+                )
 
             byts, index = decode_bytes(buf, index)
-            links.append(decode_link(byts))
+            link = _decode_link(byts, max_name_length, max_hash_length)
+            if keep_records and _is_canonical_link(link, byts):
+                link.record = byts
+            links.append(link)
         else:
             raise Exception(
                 "protobuf: (PBNode) invalid fieldNumber, expected 1 or 2, got "
@@ -155,3 +339,313 @@ def decode_node(buf: BytesLike) -> RawPBNode:
         node.links = []  # Ensure links is never None in output, matching JS
 
     return node
+
+
+def _decode_node_partial(
+    buf: BytesLike,
+    keep_records: bool,
+    limits: Optional[DecodeLimits],
+    want_data: bool,
+    link_slice: slice,
+) -> RawPBNode:
+    """
+    _decode_node() for the part of a node selected by _selection(). A first
+    pass checks every link with _validate_link(), under the same limits, and
+    counts them; once the selection is known, a second pass decodes only the
+    selected links.
+    """
+    l = len(buf)
+    index = 0
+    max_links = max_name_length = max_hash_length = None
+    if limits is not None:
+        max_links = limits.max_links
+        max_name_length = limits.max_name_length
+        max_hash_length = limits.max_hash_length
+    count = 0
+    # (index, has_hash) of the links decode() would reject after decode_node()
+    bad: list[Tuple[int, bool]] = []
+    has_data = False
+    links_before_data = False
+    data: Union[BytesLike, None] = None
+
+    while index < l:
+        wire_type, field_num, index = decode_key(buf, index)
+
+        if wire_type != 2:
+            raise Exception(
+                "protobuf: (PBNode) invalid wire type, expected 2, got "
+                + str(wire_type)
+            )
+
+        if field_num == 1:
+            if has_data:
+                raise Exception("protobuf: (PBNode) duplicate Data section")
+
+            start, index = _bytes_bounds(buf, index, l, False)
+            if want_data:
+                data = buf[start:index]
+            has_data = True
+            if count > 0:
+                links_before_data = True
+        elif field_num == 2:
+            if links_before_data:
+                raise Exception("protobuf: (PBNode) duplicate Links section")
+            if max_links is not None and count >= max_links:
+                raise ValueError(
+                    "protobuf: (PBNode) more than " + str(max_links) + " links"
+                )
+
+            start, index = _bytes_bounds(buf, index, l, False)
+            _, _, has_hash, is_cid = _validate_link(
+                buf, start, index, False, max_name_length, max_hash_length
+            )
+            if not is_cid:
+                bad.append((count, has_hash))
+            count += 1
+        else:
+            raise Exception(
+                "protobuf: (PBNode) invalid fieldNumber, expected 1 or 2, got "
+                + str(field_num)
+            )
+
+    selected = range(count)[link_slice]
+    # decode() would fail on these after decode_node()
+    for i, has_hash in bad:
+        if i in selected:
+            continue
+        if not has_hash:
+            raise TypeError("Invalid Hash field found in link, expected CID")
+        raise ValueError("protobuf: (PBLink) Hash is not a binary CID")
+
+    links: list[RawPBLink] = []
+    if selected:
+        last = max(selected[0], selected[-1])
+        index = 0
+        i = 0
+        while i <= last:
+            _, field_num, index = decode_key(buf, index)
+            start, index = _bytes_bounds(buf, index, l, False)
+            if field_num != 2:
+                continue
+            if i in selected:
+                byts = buf[start:index]
+                link = _decode_link(byts, max_name_length, max_hash_length)
+                if keep_records and _is_canonical_link(link, byts):
+                    link.record = byts
+                links.append(link)
+            i += 1
+        if selected.step < 0:
+            links.reverse()
+
+    node = RawPBNode()
+    if data is not None:
+        node.data = data
+    node.links = links
+    return node
+
+
+def validate_bytes(buf: BytesLike, canonical: bool = True) -> None:
+    """
+    Checks that `buf` is a well-formed PBNode without decoding it: raises the
+    error decode() would raise (short of looking up the codes of the link CIDs
+    in the multiformats tables), and otherwise returns None. With `canonical`,
+    also requires the canonical form: links sorted by name bytes, links before
+    data and minimal varints.
+
+    Names are compared in place and no link objects are created, so this is
+    considerably cheaper than a decode and re-encode. Only the C accelerator
+    also checks names for UTF-8 in place: the pure-Python fallback decodes
+    each name to a str to check it.
+    """
+    if backend.speedups is not None:
+        result = backend.speedups.validate_bytes(buf, canonical)
+        if result is not NotImplemented:
+            return
+    _validate_bytes(buf, canonical)
+
+
+def _check_minimal(buf: BytesLike, start: int, end: int) -> None:
+    if end - start > 1 and buf[end - 1] == 0:
+        raise ValueError("protobuf: non-minimal varint")
+
+
+def _bytes_bounds(buf: BytesLike, offset: int, end: int, canonical: bool) -> Tuple[int, int]:
+    """
+    Mirrors decode_bytes() for buf[:end] but returns the bounds of the bytes
+    rather than a slice.
+    """
+    byte_len, start = decode_varint(buf, offset, end)
+    if canonical:
+        _check_minimal(buf, offset, start)
+    if start + byte_len > end:
+        raise EOFError("protobuf: unexpected end of data")
+    return (start, start + byte_len)
+
+
+def _is_binary_cid(buf: BytesLike, start: int, end: int) -> bool:
+    if end - start == 34 and buf[start] == 0x12 and buf[start + 1] == 0x20:
+        return True  # CIDv0
+    values = []
+    index = start
+    for _ in range(4):  # version, codec, multihash code, digest length
+        try:
+            value, next_index = decode_varint(buf, index, end)
+        except (EOFError, OverflowError):
+            return False
+        if next_index - index > 1 and buf[next_index - 1] == 0:
+            return False  # rejected by CID.decode()
+        values.append(value)
+        index = next_index
+    return values[0] == 1 and index + values[3] == end
+
+
+def _compare_names(buf: BytesLike, a: Tuple[int, int], b: Tuple[int, int]) -> int:
+    """
+    Compares the name bytes at bounds `a` and `b` of `buf` like
+    link_comparator(), without slicing.
+    """
+    for i in range(min(a[1] - a[0], b[1] - b[0])):
+        x = buf[a[0] + i]
+        y = buf[b[0] + i]
+        if x != y:
+            return -1 if x < y else 1
+    x = a[1] - a[0]
+    y = b[1] - b[0]
+    return -1 if x < y else 1 if y < x else 0
+
+
+def _validate_link(
+    buf: BytesLike,
+    start: int,
+    end: int,
+    canonical: bool,
+    max_name_length: Optional[int] = None,
+    max_hash_length: Optional[int] = None,
+) -> Tuple[int, int, bool, bool]:
+    """
+    Mirrors _decode_link() for buf[start:end]. Returns the bounds of the name
+    (empty if absent), whether there is a Hash and whether it is a binary CID.
+    The name is decoded to check that it is UTF-8, which allocates; the
+    accelerator's validate_link() checks it in place.
+    """
+    index = start
+    has_hash = has_name = has_t_size = False
+    is_cid = False
+    name = (start, start)
+
+    while index < end:
+        key_start = index
+        wire_type, field_num, index = decode_key(buf, index, end)
+        if canonical:
+            _check_minimal(buf, key_start, index)
+
+        if field_num == 1:
+            if has_hash:
+                raise Exception("protobuf: (PBLink) duplicate Hash section")
+            if wire_type != 2:
+                raise ValueError(
+                    "protobuf: (PBLink) wrong wire type (" + str(wire_type) + ") for Hash"
+                )
+            if has_name:
+                raise Exception("protobuf: (PBLink) invalid order, found Name before Hash")
+            if has_t_size:
+                raise Exception("protobuf: (PBLink) invalid order, found Tsize before Hash")
+
+            _check_length(buf, index, max_hash_length, "Hash", end)
+            hash_start, index = _bytes_bounds(buf, index, end, canonical)
+            is_cid = _is_binary_cid(buf, hash_start, index)
+            has_hash = True
+        elif field_num == 2:
+            if has_name:
+                raise Exception("protobuf: (PBLink) duplicate Name section")
+            if wire_type != 2:
+                raise ValueError(
+                    "protobuf: (PBLink) wrong wire type (" + str(wire_type) + ") for Name"
+                )
+            if has_t_size:
+                raise Exception("protobuf: (PBLink) invalid order, found Tsize before Name")
+
+            _check_length(buf, index, max_name_length, "Name", end)
+            name = _bytes_bounds(buf, index, end, canonical)
+            index = name[1]
+            if name[0] < name[1]:
+                str(buf[name[0] : name[1]], "utf-8")  # raises UnicodeDecodeError
+            has_name = True
+        elif field_num == 3:
+            if has_t_size:
+                raise Exception("protobuf: (PBLink) duplicate Tsize section")
+            if wire_type != 0:
+                raise ValueError(
+                    "protobuf: (PBLink) wrong wire type (" + str(wire_type) + ") for Tsize"
+                )
+
+            value_start = index
+            _, index = decode_varint(buf, index, end)
+            if canonical:
+                _check_minimal(buf, value_start, index)
+            has_t_size = True
+        else:
+            raise Exception(
+                "protobuf: (PBLink) invalid field number, expected 1, 2 or 3, got "
+                + str(field_num)
+            )
+
+    return (name[0], name[1], has_hash, is_cid)
+
+
+def _validate_bytes(buf: BytesLike, canonical: bool = True) -> None:
+    l = len(buf)
+    index = 0
+    has_data = False
+    has_links = False
+    links_before_data = False
+    prev_name = (0, 0)
+    # hash errors are raised by decode() after decode_node() has succeeded
+    hash_error: Optional[Exception] = None
+
+    while index < l:
+        key_start = index
+        wire_type, field_num, index = decode_key(buf, index)
+        if canonical:
+            _check_minimal(buf, key_start, index)
+
+        if wire_type != 2:
+            raise Exception(
+                "protobuf: (PBNode) invalid wire type, expected 2, got " + str(wire_type)
+            )
+
+        if field_num == 1:
+            if has_data:
+                raise Exception("protobuf: (PBNode) duplicate Data section")
+
+            _, index = _bytes_bounds(buf, index, l, canonical)
+            has_data = True
+            if has_links:
+                links_before_data = True
+        elif field_num == 2:
+            if links_before_data:
+                raise Exception("protobuf: (PBNode) duplicate Links section")
+            if canonical and has_data:
+                raise ValueError("protobuf: (PBNode) data appears before links")
+
+            start, index = _bytes_bounds(buf, index, l, canonical)
+            name_start, name_end, has_hash, is_cid = _validate_link(
+                buf, start, index, canonical
+            )
+            if hash_error is None and not has_hash:
+                hash_error = TypeError("Invalid Hash field found in link, expected CID")
+            elif hash_error is None and not is_cid:
+                hash_error = ValueError("protobuf: (PBLink) Hash is not a binary CID")
+            name = (name_start, name_end)
+            if canonical and has_links and _compare_names(buf, name, prev_name) < 0:
+                raise ValueError("protobuf: (PBNode) links are not sorted by name bytes")
+            prev_name = name
+            has_links = True
+        else:
+            raise Exception(
+                "protobuf: (PBNode) invalid fieldNumber, expected 1 or 2, got "
+                + str(field_num)
+            )
+
+    if hash_error is not None:
+        raise hash_error
@@ -0,0 +1,248 @@
+"""
+Edits a DAG by path, re-encoding only the nodes on the edited paths.
+
+:class:`DagEditor` applies `put`, `remove` and `move` operations to copies of
+the nodes along each path, decoding every node at most once however many edits
+pass through it. Nothing is written until :meth:`DagEditor.commit`, which
+encodes and hashes each modified node exactly once, from the leaves up, and
+writes the new blocks to the store in a single batch::
+
+    editor = DagEditor(store, root)
+    editor.put("docs/guide/intro.md", intro_cid, len(intro))
+    editor.move("docs/old", "archive/old")
+    editor.remove("tmp")
+    root = editor.commit()
+
+The `t_size` of each rewritten link is set to the cumulative size of the
+subtree below it: the node's encoded size plus the `t_size` of its links.
+"""
+
+from typing import TYPE_CHECKING, Optional
+from . import code, decode, encode
+from .blockstore import Blockstore
+from .car import dag_pb_code
+from .node import BytesLike, PBLink, PBNode
+from .util import cid_class
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+
+class _Entry:
+    """
+    An editable copy of a node on an edited path. `children` holds the entries
+    loaded below it, keyed by link name; `dirty` entries must be re-encoded.
+    """
+
+    __slots__ = ("node", "children", "dirty")
+
+    node: PBNode
+    children: dict[str, "_Entry"]
+    dirty: bool
+
+    def __init__(self, node: PBNode, dirty: bool = False) -> None:
+        self.node = node
+        self.children = {}
+        self.dirty = dirty
+
+
+def _split(path: str) -> list[str]:
+    names = path.strip("/").split("/")
+    if names == [""] or "" in names:
+        raise ValueError(f"editor: invalid path {path!r}")
+    return names
+
+
+def _name_bytes(name: Optional[str]) -> bytes:
+    return name.encode("utf-8") if name is not None else b""
+
+
+def _find(links: list[PBLink], name: str) -> int:
+    """
+    The index of the first link named `name`, or -1.
+    """
+    for i, link in enumerate(links):
+        if (link.name or "") == name:
+            return i
+    return -1
+
+
+def _insert(links: list[PBLink], link: PBLink) -> None:
+    """
+    Inserts `link` after any links with the same name, keeping `links` sorted
+    by name bytes.
+    """
+    key = _name_bytes(link.name)
+    i = len(links)
+    while i > 0 and _name_bytes(links[i - 1].name) > key:
+        i -= 1
+    links.insert(i, link)
+
+
+class DagEditor:
+    """
+    A transaction of path edits over the DAG at `root` (or a new, empty DAG if
+    `root` is None) in `store`. Intermediate nodes that do not exist are
+    created with `directory_data` as their Data. Paths are `/` separated link
+    names; when a node has several links with the same name, the first is used.
+    """
+
+    store: Blockstore
+    root: Optional["CID"]
+    hashfn: str
+    directory_data: Optional[bytes]
+    _root: Optional[_Entry]
+
+    def __init__(
+        self,
+        store: Blockstore,
+        root: Optional["CID"] = None,
+        hashfn: str = "sha2-256",
+        directory_data: Optional[bytes] = None,
+    ) -> None:
+        self.store = store
+        self.root = root
+        self.hashfn = hashfn
+        self.directory_data = directory_data
+        self._root = None
+
+    def _load(self, cid: "CID", path: str) -> _Entry:
+        if cid.codec.code != dag_pb_code:
+            raise ValueError(f"editor: {path!r} is not a DAG-PB node")
+        return _Entry(decode(self.store.get(cid)))
+
+    def _new(self) -> _Entry:
+        return _Entry(PBNode(self.directory_data, []), dirty=True)
+
+    def _walk(self, names: list[str], create: bool) -> list[_Entry]:
+        """
+        The entries from the root down to the node at `names`, loading them as
+        needed and creating missing ones if `create` is set.
+        """
+        if self._root is None:
+            self._root = self._new() if self.root is None else self._load(self.root, "")
+        entries = [self._root]
+        for depth, name in enumerate(names):
+            parent = entries[-1]
+            entry = parent.children.get(name)
+            if entry is None:
+                i = _find(parent.node.links, name)
+                path = "/".join(names[: depth + 1])
+                if i >= 0:
+                    entry = self._load(parent.node.links[i].hash, path)
+                elif create:
+                    entry = self._new()
+                else:
+                    raise KeyError(path)
+            entries.append(entry)
+        # only once the whole path resolved, so a failed edit changes nothing
+        for parent, name, entry in zip(entries, names, entries[1:]):
+            parent.children[name] = entry
+        return entries
+
+    def _detach(self, names: list[str]) -> tuple[Optional[PBLink], Optional[_Entry]]:
+        entries = self._walk(names[:-1], create=False)
+        parent = entries[-1]
+        name = names[-1]
+        entry = parent.children.pop(name, None)
+        i = _find(parent.node.links, name)
+        link = parent.node.links.pop(i) if i >= 0 else None
+        if link is None and entry is None:
+            raise KeyError("/".join(names))
+        for e in entries:
+            e.dirty = True
+        return (link, entry)
+
+    def _attach(
+        self, names: list[str], link: Optional[PBLink], entry: Optional[_Entry]
+    ) -> None:
+        entries = self._walk(names[:-1], create=True)
+        parent = entries[-1]
+        name = names[-1]
+        parent.children.pop(name, None)
+        i = _find(parent.node.links, name)
+        if i >= 0:
+            parent.node.links.pop(i)
+        if entry is not None and entry.dirty:
+            # linked when committed
+            parent.children[name] = entry
+        elif link is not None:
+            _insert(parent.node.links, PBLink(link.hash, name, link.t_size))
+        for e in entries:
+            e.dirty = True
+
+    def put(self, path: str, cid: "CID", t_size: Optional[int] = None) -> None:
+        """
+        Links `cid` at `path`, replacing any existing link of that name.
+        """
+        self._attach(_split(path), PBLink(cid, None, t_size), None)
+
+    def remove(self, path: str) -> None:
+        """
+        Removes the link at `path`. Raises KeyError if there is none.
+        """
+        self._detach(_split(path))
+
+    def move(self, src: str, dst: str) -> None:
+        """
+        Moves the link at `src`, with any pending edits below it, to `dst`,
+        replacing any existing link there.
+        """
+        src_names = _split(src)
+        dst_names = _split(dst)
+        if dst_names[: len(src_names)] == src_names:
+            raise ValueError(f"editor: cannot move {src!r} into itself")
+        # fail before detaching
+        parent = self._walk(src_names[:-1], create=False)[-1]
+        if src_names[-1] not in parent.children and _find(parent.node.links, src_names[-1]) < 0:
+            raise KeyError(src)
+        self._walk(dst_names[:-1], create=True)
+        link, entry = self._detach(src_names)
+        self._attach(dst_names, link, entry)
+
+    def commit(self) -> "CID":
+        """
+        Encodes the modified nodes, writes them to the store in one batch and
+        returns the new root CID. The editor can be used for further edits on
+        top of the new root.
+        """
+        if self._root is None and self.root is not None:
+            return self.root
+        if self._root is None:
+            self._root = self._new()
+        root = self.root
+        blocks: list[tuple["CID", BytesLike]] = []
+        if self._root.dirty or root is None:
+            root = self._flush(self._root, blocks)[0]
+        self.store.put_many(blocks)
+        self.root = root
+        self._root = None
+        return root
+
+    def discard(self) -> None:
+        """
+        Drops the edits made since the last commit.
+        """
+        self._root = None
+
+    def _flush(self, entry: _Entry, blocks: list[tuple["CID", BytesLike]]) -> tuple["CID", int]:
+        links = entry.node.links
+        for name, child in entry.children.items():
+            if not child.dirty:
+                continue
+            cid, t_size = self._flush(child, blocks)
+            i = _find(links, name)
+            if i >= 0:
+                links[i].hash = cid
+                links[i].t_size = t_size
+            else:
+                _insert(links, PBLink(cid, name, t_size))
+        entry.children = {}
+
+        from multiformats import multihash  # pylint: disable=import-outside-toplevel
+
+        block = encode(entry.node)
+        cid = cid_class()("base32", 1, code, multihash.digest(block, self.hashfn))
+        blocks.append((cid, block))
+        entry.dirty = False
+        return (cid, len(block) + sum(link.t_size or 0 for link in links))
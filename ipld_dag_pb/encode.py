@@ -1,4 +1,6 @@
 from math import floor
+from typing import Any
+from . import backend
 from .node import RawPBLink, RawPBNode, byteslike
 
 max_int32 = 2**32
@@ -12,6 +14,11 @@ def encode_link(link: RawPBLink, buf: memoryview) -> int:
     """
     i = len(buf)
 
+    if hasattr(link, "record") and isinstance(link.record, byteslike):
+        i -= len(link.record)
+        buf[i:] = link.record
+        return len(buf) - i
+
     if hasattr(link, "t_size") and isinstance(link.t_size, int):
         if link.t_size < 0:
             raise TypeError("t_size cannot be negative")
@@ -21,15 +28,13 @@ def encode_link(link: RawPBLink, buf: memoryview) -> int:
     if hasattr(link, "name") and isinstance(link.name, str):
         name_bytes = link.name.encode("utf-8")
         i -= len(name_bytes)
-        for n in range(len(name_bytes)):
-            buf[i + n] = name_bytes[n]
+        buf[i : i + len(name_bytes)] = name_bytes
         i = encode_varint(buf, i, len(name_bytes)) - 1
         buf[i] = 0x12
 
     if hasattr(link, "hash") and isinstance(link.hash, byteslike):
         i -= len(link.hash)
-        for n in range(len(link.hash)):
-            buf[i + n] = link.hash[n]
+        buf[i : i + len(link.hash)] = link.hash
         i = encode_varint(buf, i, len(link.hash)) - 1
         buf[i] = 0xA
 
@@ -40,31 +45,74 @@ def encode_node(node: RawPBNode) -> memoryview:
     """
     Encodes a PBNode into a new byte array of precisely the correct size.
     """
+    if backend.speedups is not None:
+        buf = backend.speedups.encode_node(node)
+        if buf is not NotImplemented:
+            return buf  # type: ignore[no-any-return]
+    return _encode_node(node)
+
+
+def _encode_node(node: RawPBNode) -> memoryview:
+    buf = memoryview(bytearray(size_node(node)))
+    _write_node(node, buf)
+    return buf
+
+
+def encode_into(node: RawPBNode, buf: Any, offset: int = 0) -> int:
+    """
+    Encodes a PBNode into the writable buffer `buf` starting at `offset`, and
+    returns the number of bytes written. Raises ValueError if it does not fit.
+    """
+    if backend.speedups is not None:
+        n = backend.speedups.encode_into(node, buf, offset)
+        if n is not NotImplemented:
+            return n  # type: ignore[no-any-return]
+    return _encode_into(node, buf, offset)
+
+
+def _encode_into(node: RawPBNode, buf: Any, offset: int = 0) -> int:
     size = size_node(node)
-    buf = bytearray(size)
-    i = size
+    view = memoryview(buf).cast("B")
+    if view.readonly:
+        raise TypeError("encode_into: buffer is read-only")
+    if offset < 0:
+        raise ValueError("encode_into: offset cannot be negative")
+    if offset + size > len(view):
+        raise ValueError(
+            f"encode_into: node needs {size} bytes at offset {offset}, "
+            f"buffer has {len(view)}"
+        )
+    _write_node(node, view[offset : offset + size])
+    return size
+
+
+def _write_node(node: RawPBNode, buf: memoryview) -> None:
+    """
+    Writes the encoded node into `buf`, which is exactly `size_node(node)` long.
+    """
+    i = len(buf)
 
     if hasattr(node, "data") and isinstance(node.data, byteslike):
         i -= len(node.data)
-        for n in range(len(node.data)):
-            buf[i + n] = node.data[n]
-        i = encode_varint(memoryview(buf), i, len(node.data)) - 1
+        buf[i : i + len(node.data)] = node.data
+        i = encode_varint(buf, i, len(node.data)) - 1
         buf[i] = 0xA
 
     if hasattr(node, "links") and isinstance(node.links, list):
         for index in range(len(node.links) - 1, -1, -1):
-            size = encode_link(node.links[index], memoryview(buf)[0:i])
+            size = encode_link(node.links[index], buf[0:i])
             i -= size
-            i = encode_varint(memoryview(buf), i, size) - 1
+            i = encode_varint(buf, i, size) - 1
             buf[i] = 0x12
 
-    return memoryview(buf)
-
 
 def size_link(link: RawPBLink) -> int:
     """
     work out exactly how many bytes this link takes up
     """
+    if hasattr(link, "record") and isinstance(link.record, byteslike):
+        return len(link.record)
+
     n = 0
 
     if hasattr(link, "hash") and isinstance(link.hash, byteslike):
@@ -0,0 +1,177 @@
+"""
+Immutable DAG-PB nodes that remember their encoding.
+
+A :class:`FrozenPBNode` is encoded once, when it is created, and keeps the
+encoded bytes; its CID is computed on first use and kept too, so a node that
+is stored, hashed and compared many times (in caches, or as the unchanged
+nodes of an edited DAG) is serialized and hashed only once. Nodes created
+from an encoded block keep those bytes and decode their data and links only
+when they are accessed.
+
+Frozen nodes are hashable. Two nodes are equal when their encodings are:
+once both CIDs are known (with the same hash function) they are compared
+instead, and since each node's hash is cached, unequal nodes are usually
+told apart in constant time::
+
+    node = FrozenPBNode(b"\\x08\\x01", [FrozenPBLink(cid, "a", 10)])
+    store.put(node.cid, node.encoded)
+    editable = node.thaw()  # a PBNode
+"""
+
+from typing import TYPE_CHECKING, Iterable, NamedTuple, Optional, Union
+from . import code, decode, encode
+from .decode import validate_bytes
+from .node import BytesLike, PBLink, PBNode
+from .util import cid_class
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+
+class FrozenPBLink(NamedTuple):
+    """
+    An immutable :class:`ipld_dag_pb.PBLink`.
+    """
+
+    hash: "CID"
+    name: Optional[str] = None
+    t_size: Optional[int] = None
+
+
+class FrozenPBNode:
+    """
+    An immutable, hashable :class:`ipld_dag_pb.PBNode` with memoized encoded
+    bytes and CID. Creating one from `data` and `links` encodes it, raising
+    the errors :func:`ipld_dag_pb.encode` would; links must already be in
+    canonical order (see :func:`ipld_dag_pb.prepare`).
+    """
+
+    __slots__ = ("_encoded", "_hashfn", "_cid", "_data", "_links", "_hash")
+
+    _encoded: bytes
+    _hashfn: str
+    _cid: Optional["CID"]
+    _data: Optional[bytes]
+    _links: Optional[tuple[FrozenPBLink, ...]]
+    _hash: Optional[int]
+
+    def __init__(
+        self,
+        data: Optional[BytesLike] = None,
+        links: Iterable[Union[FrozenPBLink, PBLink]] = (),
+        hashfn: str = "sha2-256",
+    ) -> None:
+        data = None if data is None else bytes(data)
+        frozen = tuple(FrozenPBLink(l.hash, l.name, l.t_size) for l in links)
+        node = PBNode(data, [PBLink(*l) for l in frozen])
+        self._init(bytes(encode(node)), hashfn, None)
+        self._data = data
+        self._links = frozen
+
+    def _init(self, encoded: bytes, hashfn: str, cid: Optional["CID"]) -> None:
+        self._encoded = encoded
+        self._hashfn = hashfn
+        self._cid = cid
+        self._hash = None
+
+    @classmethod
+    def from_node(cls, node: PBNode, hashfn: str = "sha2-256") -> "FrozenPBNode":
+        """
+        Freezes a copy of `node`.
+        """
+        return cls(node.data, node.links, hashfn)
+
+    @classmethod
+    def from_bytes(
+        cls, buf: BytesLike, cid: Optional["CID"] = None, hashfn: str = "sha2-256"
+    ) -> "FrozenPBNode":
+        """
+        A node for the encoded block `buf`, which is checked with
+        :func:`ipld_dag_pb.validate_bytes` but only decoded when its data or
+        links are accessed. If the block's `cid` is known it is used as the
+        node's CID (and its hash function as `hashfn`) without hashing the
+        block again, so it must be correct.
+        """
+        validate_bytes(buf, canonical=False)
+        if cid is not None:
+            if cid.codec.code != code:
+                raise ValueError(f"frozen: CID {cid} is not for a DAG-PB block")
+            hashfn = cid.hashfun.name
+        node = cls.__new__(cls)
+        node._init(bytes(buf), hashfn, cid)
+        node._data = None
+        node._links = None
+        return node
+
+    def _decode(self) -> None:
+        node = decode(self._encoded)
+        self._data = None if node.data is None else bytes(node.data)
+        self._links = tuple(FrozenPBLink(l.hash, l.name, l.t_size) for l in node.links)
+
+    @property
+    def data(self) -> Optional[bytes]:
+        if self._links is None:
+            self._decode()
+        return self._data
+
+    @property
+    def links(self) -> tuple[FrozenPBLink, ...]:
+        if self._links is None:
+            self._decode()
+            assert self._links is not None
+        return self._links
+
+    @property
+    def encoded(self) -> bytes:
+        """
+        The encoded block.
+        """
+        return self._encoded
+
+    @property
+    def size(self) -> int:
+        """
+        The size of the encoded block in bytes.
+        """
+        return len(self._encoded)
+
+    @property
+    def hashfn(self) -> str:
+        return self._hashfn
+
+    @property
+    def cid(self) -> "CID":
+        """
+        The CIDv1 of the encoded block, hashed with `hashfn` on first use.
+        """
+        if self._cid is None:
+            from multiformats import multihash  # pylint: disable=import-outside-toplevel
+
+            digest = multihash.digest(self._encoded, self._hashfn)
+            self._cid = cid_class()("base32", 1, code, digest)
+        return self._cid
+
+    def thaw(self) -> PBNode:
+        """
+        A mutable copy of this node.
+        """
+        return PBNode(self.data, [PBLink(*l) for l in self.links])
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(self._encoded)
+        return self._hash
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, FrozenPBNode):
+            return NotImplemented
+        if hash(self) != hash(other):
+            return False
+        if self._cid is not None and other._cid is not None and self._hashfn == other._hashfn:
+            return self._cid.digest == other._cid.digest
+        return self._encoded == other._encoded
+
+    def __repr__(self) -> str:
+        return f"FrozenPBNode({self.size} bytes, {self.cid})"
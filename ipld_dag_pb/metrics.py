@@ -0,0 +1,204 @@
+"""
+Opt-in instrumentation for :func:`ipld_dag_pb.encode` and
+:func:`ipld_dag_pb.decode`.
+
+Nothing is measured until :func:`enable` is called; while disabled the codec
+only pays for a single flag check per call. Once enabled, every call updates
+the counters and latency histograms returned by :func:`stats` and is passed as
+a :class:`CodecEvent` to each registered hook, e.g. to export to Prometheus::
+
+    from prometheus_client import Counter
+    from ipld_dag_pb import metrics
+
+    codec_bytes = Counter("dag_pb_bytes", "DAG-PB bytes", ["op"])
+    metrics.add_hook(lambda e: codec_bytes.labels(e.op).inc(e.size))
+    metrics.enable()
+"""
+
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Callable, Final, Literal, Optional
+from .encode import sov
+
+Op = Literal["encode", "decode"]
+
+latency_bounds: Final = tuple(1000 * 2**i for i in range(20))
+""" Upper bounds (in nanoseconds) of the latency histogram buckets, 1µs to ~0.5s. """
+
+enabled = False
+""" Whether encode/decode calls are being measured, see :func:`enable`. """
+
+
+class CodecEvent:
+    """
+    A single measured encode or decode call.
+    """
+
+    op: Op
+    size: int
+    """ Size of the encoded block in bytes. """
+    data_size: int
+    """ Bytes taken by the Data section, including its field header. """
+    links_size: int
+    """ Bytes taken by all Links sections, including their field headers. """
+    links: int
+    """ Number of links. """
+    duration: int
+    """ Wall-clock duration of the call in nanoseconds. """
+
+    def __init__(
+        self,
+        op: Op,
+        size: int,
+        data_size: int,
+        links_size: int,
+        links: int,
+        duration: int,
+    ) -> None:
+        self.op = op
+        self.size = size
+        self.data_size = data_size
+        self.links_size = links_size
+        self.links = links
+        self.duration = duration
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. `counts[i]` holds observations less than or equal to
+    `bounds[i]`, the final bucket holds everything larger.
+    """
+
+    bounds: tuple[int, ...]
+    counts: list[int]
+    count: int
+    sum: int
+
+    def __init__(self, bounds: tuple[int, ...] = latency_bounds) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value: int) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class OpStats:
+    """
+    Counters for one direction (encode or decode).
+    """
+
+    nodes: int
+    bytes: int
+    data_bytes: int
+    links_bytes: int
+    links: int
+    errors: int
+    latency: Histogram
+
+    def __init__(self) -> None:
+        self.nodes = 0
+        self.bytes = 0
+        self.data_bytes = 0
+        self.links_bytes = 0
+        self.links = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "nodes": self.nodes,
+            "bytes": self.bytes,
+            "data_bytes": self.data_bytes,
+            "links_bytes": self.links_bytes,
+            "links": self.links,
+            "errors": self.errors,
+            "latency": self.latency.to_dict(),
+        }
+
+
+Hook = Callable[[CodecEvent], None]
+
+_lock = Lock()
+_hooks: list[Hook] = []
+_stats: dict[str, OpStats] = {"encode": OpStats(), "decode": OpStats()}
+
+
+def enable() -> None:
+    global enabled  # pylint: disable=global-statement
+    enabled = True
+
+
+def disable() -> None:
+    global enabled  # pylint: disable=global-statement
+    enabled = False
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Registers a callable that receives a :class:`CodecEvent` for every measured
+    call. Hooks run synchronously on the calling thread; exceptions they raise
+    propagate to the caller of encode/decode.
+    """
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    with _lock:
+        _hooks.remove(hook)
+
+
+def stats() -> dict[str, dict[str, Any]]:
+    """
+    A snapshot of the counters and latency histograms since the last
+    :func:`reset`, keyed by "encode" and "decode".
+    """
+    with _lock:
+        return {op: s.to_dict() for op, s in _stats.items()}
+
+
+def reset() -> None:
+    with _lock:
+        for op in _stats:
+            _stats[op] = OpStats()
+
+
+def record(event: CodecEvent) -> None:
+    with _lock:
+        s = _stats[event.op]
+        s.nodes += 1
+        s.bytes += event.size
+        s.data_bytes += event.data_size
+        s.links_bytes += event.links_size
+        s.links += event.links
+        s.latency.observe(event.duration)
+        hooks = tuple(_hooks)
+    for hook in hooks:
+        hook(event)
+
+
+def record_error(op: Op) -> None:
+    with _lock:
+        _stats[op].errors += 1
+
+
+def section_sizes(size: int, data: Optional[Any]) -> tuple[int, int]:
+    """
+    Splits the size of an encoded block into its (data, links) section sizes.
+    """
+    if data is None:
+        return (0, size)
+    data_size = 1 + sov(len(data)) + len(data)
+    return (data_size, size - data_size)
@@ -1,5 +1,8 @@
-from typing import Any, Final, Optional, Union
-from multiformats import CID
+from typing import TYPE_CHECKING, Any, Final, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    # imported lazily elsewhere, see util.cid_class()
+    from multiformats import CID
 
 BytesLike = Union[bytes, bytearray, memoryview]
 """ Type alias for bytes-like objects. """
@@ -13,17 +16,27 @@ https://github.com/ipld/specs/blob/master/block-layer/codecs/dag-pb.md#logical-f
 """
 
 
+LinkRecord = Tuple["CID", Optional[str], Optional[int], BytesLike]
+"""
+Snapshot of a decoded link: the ``(hash, name, t_size)`` it was decoded as and
+the encoded bytes of the link itself. Used to splice unchanged links verbatim
+when a decoded node is re-encoded.
+"""
+
+
 class PBLink:
     name: Optional[str]
     t_size: Optional[int]
-    hash: CID
+    hash: "CID"
+    _record: Optional[LinkRecord]
 
     def __init__(
-        self, hash: CID, name: Optional[str] = None, size: Optional[int] = None
+        self, hash: "CID", name: Optional[str] = None, size: Optional[int] = None
     ) -> None:
         self.hash = hash
         self.name = name
         self.t_size = size
+        self._record = None
 
     def __eq__(self, other: Any) -> bool:
         if self is other:
@@ -37,15 +50,25 @@ class PBLink:
         )
 
 
+_no_links: Any = object()
+""" The default `links` of a PBNode, told apart from an explicit None. """
+
+
 class PBNode:
     data: Optional[BytesLike]
     links: list[PBLink]
+    partial: bool = False
+    """
+    Set on nodes decoded with `fields` or `link_slice`, which hold only part
+    of the block and so cannot be encoded.
+    """
 
     def __init__(
-        self, data: Optional[BytesLike] = None, links: list[PBLink] = []
+        self, data: Optional[BytesLike] = None, links: list[PBLink] = _no_links
     ) -> None:
         self.data = data
-        self.links = links
+        # a new list each time, rather than a default shared by all nodes
+        self.links = [] if links is _no_links else links
 
     def __eq__(self, other: Any) -> bool:
         if self is other:
@@ -69,6 +92,12 @@ class RawPBLink:
     name: str
     t_size: int
     hash: BytesLike
+    record: BytesLike
+    """
+    Optional, the complete encoded form of this link (the contents of the
+    PBNode Links field). When present, the encoder copies it verbatim instead of
+    serializing hash, name and t_size.
+    """
 
 
     def __eq__(self, other: Any) -> bool:
@@ -0,0 +1,464 @@
+"""
+A blockstore for very many blocks, kept in a few large files.
+
+Blocks are appended to segment files (``segment-NNNNNN.pack``) as CAR block
+sections (varint length, binary CID, block), and :meth:`PackBlockstore.get`
+returns a memoryview straight into the memory-mapped segment, which can be
+passed to :func:`ipld_dag_pb.decode` without copying.
+
+The index from block to location is a set of sorted runs (``index-NNNNNN.idx``)
+of fixed-size records, each memory-mapped and binary searched; newer runs take
+precedence, and deletions are recorded as tombstones. Blocks written since the
+last :meth:`PackBlockstore.flush` are indexed in memory, and a flush writes
+them out as a new run. When there are more than `max_runs` runs they are
+merged into one. Each run records how far into the segments it indexes, so
+after a crash the blocks appended since the last flush are recovered by
+scanning the segments from there, truncating a partially written section.
+
+Blocks are keyed by multihash, so the same bytes stored under CIDs with
+different codecs are stored once. Deletions are durable once flushed; the
+space they free is reclaimed by :meth:`PackBlockstore.compact`, which copies
+the live blocks of mostly-dead segments to the end of the active segment and
+removes the old files. It can run on a background thread, taking the store's
+lock one segment at a time.
+"""
+
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import threading
+from typing import TYPE_CHECKING, Final, Iterable, Iterator, NamedTuple, Optional
+from .car import cid_multihash, iter_section_bounds
+from .decode import decode_varint
+from .encode import encode_varint, sov
+from .node import BytesLike
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+run_magic: Final = b"DAGPBRUN"
+run_version: Final = 1
+run_header: Final = struct.Struct(">8sIQIQ")
+""" magic, version, record count, and the (segment, offset) indexed up to. """
+run_record: Final = struct.Struct(">32sIQHI")
+""" key, segment, section offset, section header length, block length. """
+tombstone: Final = 0xFFFFFFFF
+""" The segment number of a deletion record. """
+
+
+class Location(NamedTuple):
+    """
+    Where a block is stored: its section starts at `offset` in `segment`, and
+    the block itself `header` bytes later.
+    """
+
+    segment: int
+    offset: int
+    header: int
+    length: int
+
+
+def block_key(cid: "CID") -> bytes:
+    """
+    The fixed-size index key of a block: the SHA-256 of its multihash.
+    """
+    return hashlib.sha256(cid.digest).digest()
+
+
+def _binary_key(cid: BytesLike) -> bytes:
+    return hashlib.sha256(cid_multihash(cid)).digest()
+
+
+def _section(cid: bytes, block: BytesLike) -> tuple[bytes, bytes, int]:
+    """
+    The key, CAR section and section header length for a block.
+    """
+    length = len(cid) + len(block)
+    varint = memoryview(bytearray(sov(length)))
+    encode_varint(varint, len(varint), length)
+    return (_binary_key(cid), b"".join((varint, cid, block)), len(varint) + len(cid))
+
+
+class _Run:
+    """
+    A sorted run of index records, mapped into memory.
+    """
+
+    path: str
+    seq: int
+    count: int
+    indexed_to: tuple[int, int]
+    _map: Optional[mmap.mmap]
+
+    def __init__(self, path: str, seq: int) -> None:
+        self.path = path
+        self.seq = seq
+        with open(path, "rb") as f:
+            magic, version, self.count, segment, offset = run_header.unpack(
+                f.read(run_header.size)
+            )
+            if magic != run_magic or version != run_version:
+                raise ValueError(f"pack: {path} is not an index run")
+            self.indexed_to = (segment, offset)
+            if run_header.size + self.count * run_record.size > os.fstat(f.fileno()).st_size:
+                raise ValueError(f"pack: index run {path} is truncated")
+            self._map = None
+            if self.count > 0:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _key(self, i: int) -> bytes:
+        assert self._map is not None
+        start = run_header.size + i * run_record.size
+        return self._map[start : start + 32]
+
+    def _location(self, i: int) -> Location:
+        assert self._map is not None
+        _, segment, offset, header, length = run_record.unpack_from(
+            self._map, run_header.size + i * run_record.size
+        )
+        return Location(segment, offset, header, length)
+
+    def find(self, key: bytes) -> Optional[Location]:
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key(lo) == key:
+            return self._location(lo)
+        return None
+
+    def __iter__(self) -> Iterator[tuple[bytes, Location]]:
+        for i in range(self.count):
+            yield (self._key(i), self._location(i))
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def _write_run(path: str, records: Iterable[tuple[bytes, Location]], indexed_to: tuple[int, int]) -> None:
+    """
+    Writes sorted `records` as a run, atomically: the run only appears at
+    `path` once it is complete and on disk.
+    """
+    tmp = path + ".tmp"
+    count = 0
+    with open(tmp, "wb") as f:
+        f.write(bytes(run_header.size))
+        for key, location in records:
+            f.write(run_record.pack(key, *location))
+            count += 1
+        f.seek(0)
+        f.write(run_header.pack(run_magic, run_version, count, *indexed_to))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class PackBlockstore:
+    """
+    A :class:`ipld_dag_pb.blockstore.Blockstore` in the directory `path`.
+    New segments are started once the active one reaches `segment_size`
+    bytes. Safe to use from several threads.
+    """
+
+    path: str
+    segment_size: int
+    max_runs: int
+
+    def __init__(self, path: str, segment_size: int = 1 << 30, max_runs: int = 8) -> None:
+        self.path = path
+        self.segment_size = segment_size
+        self.max_runs = max_runs
+        self._lock = threading.RLock()
+        self._recent: dict[bytes, Location] = {}
+        self._deleted: set[bytes] = set()
+        self._maps: dict[int, mmap.mmap] = {}
+
+        os.makedirs(path, exist_ok=True)
+        runs: list[int] = []
+        segments: list[int] = []
+        for name in os.listdir(path):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(path, name))  # an interrupted write
+            elif name.startswith("index-") and name.endswith(".idx"):
+                runs.append(int(name[6:-4]))
+            elif name.startswith("segment-") and name.endswith(".pack"):
+                segments.append(int(name[8:-5]))
+        self._runs = [_Run(self._run_path(seq), seq) for seq in sorted(runs)]
+        self._segments = sorted(segments) or [1]
+        self._active = self._segments[-1]
+        self._recover()
+        self._file = open(self._segment_path(self._active), "ab", buffering=0)  # pylint: disable=consider-using-with
+        self._size = self._file.tell()
+
+    def _run_path(self, seq: int) -> str:
+        return os.path.join(self.path, f"index-{seq:06d}.idx")
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment-{segment:06d}.pack")
+
+    def _recover(self) -> None:
+        """
+        Indexes the sections appended after the newest run's high-water mark.
+        """
+        segment, offset = self._runs[-1].indexed_to if self._runs else (0, 0)
+        for n in self._segments:
+            if n < segment:
+                continue
+            start = offset if n == segment else 0
+            path = self._segment_path(n)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size <= start:
+                continue
+            with open(path, "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(m)
+            end = start
+            try:
+                for section, cid_start, block_start, section_end in iter_section_bounds(view, start, size):
+                    key = _binary_key(view[cid_start:block_start])
+                    self._recent[key] = Location(n, section, block_start - section, section_end - block_start)
+                    self._deleted.discard(key)
+                    end = section_end
+            except (EOFError, ValueError) as e:
+                if n != self._segments[-1]:
+                    raise ValueError(f"pack: segment {path} is corrupt at {end}") from e
+            finally:
+                view.release()
+                m.close()
+            if end < size:
+                # a section cut short by a crash
+                os.truncate(path, end)
+
+    def _find(self, key: bytes) -> Optional[Location]:
+        location = self._recent.get(key)
+        if location is not None:
+            return location
+        if key in self._deleted:
+            return None
+        for run in reversed(self._runs):
+            location = run.find(key)
+            if location is not None:
+                return location if location.segment != tombstone else None
+        return None
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        m = self._maps.get(segment)
+        if m is None or len(m) < end:
+            # (re)map, as the active segment grows; views into an old mapping
+            # keep it alive
+            with open(self._segment_path(segment), "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = m
+        return m
+
+    def _view(self, location: Location) -> memoryview:
+        start = location.offset + location.header
+        end = start + location.length
+        return memoryview(self._map(location.segment, end))[start:end]
+
+    def get(self, cid: "CID") -> memoryview:
+        """
+        The block `cid`, as a view into the mapped segment that stays valid
+        even if the block is later deleted or compacted away.
+        """
+        with self._lock:
+            location = self._find(block_key(cid))
+            if location is None:
+                raise KeyError(cid)
+            return self._view(location)
+
+    def has(self, cid: "CID") -> bool:
+        with self._lock:
+            return self._find(block_key(cid)) is not None
+
+    def put(self, cid: "CID", block: BytesLike) -> None:
+        self.put_many([(cid, block)])
+
+    def put_many(self, blocks: Iterable[tuple["CID", BytesLike]]) -> None:
+        with self._lock:
+            self._append(_section(bytes(cid), block) for cid, block in blocks)
+
+    def _append(self, sections: Iterable[tuple[bytes, BytesLike, int]], replace: bool = False) -> None:
+        """
+        Appends `(key, section, header length)` sections, skipping blocks that
+        are already stored unless `replace` is set, in as few writes as the
+        segment size allows.
+        """
+        out = bytearray()
+        pending: dict[bytes, Location] = {}
+        for key, section, header in sections:
+            if key in pending or (not replace and self._find(key) is not None):
+                continue
+            if self._size + len(out) > 0 and self._size + len(out) + len(section) > self.segment_size:
+                self._write(out, pending)
+                out = bytearray()
+                pending = {}
+                self._roll()
+            pending[key] = Location(self._active, self._size + len(out), header, len(section) - header)
+            out += section
+        self._write(out, pending)
+
+    def _write(self, out: bytearray, pending: dict[bytes, Location]) -> None:
+        if out:
+            self._file.write(out)
+            self._size += len(out)
+        self._recent.update(pending)
+        self._deleted.difference_update(pending)
+
+    def _roll(self) -> None:
+        self._file.close()
+        self._active += 1
+        self._segments.append(self._active)
+        self._file = open(self._segment_path(self._active), "ab", buffering=0)  # pylint: disable=consider-using-with
+        self._size = 0
+
+    def delete(self, cid: "CID") -> None:
+        """
+        Removes the block `cid`. Raises KeyError if it is not stored.
+        """
+        with self._lock:
+            key = block_key(cid)
+            if self._find(key) is None:
+                raise KeyError(cid)
+            self._recent.pop(key, None)
+            self._deleted.add(key)
+
+    def flush(self) -> None:
+        """
+        Syncs the active segment and writes the blocks and deletions since the
+        last flush to a new index run.
+        """
+        with self._lock:
+            os.fsync(self._file.fileno())
+            if not self._recent and not self._deleted:
+                return
+            records = list(self._recent.items())
+            records += [(key, Location(tombstone, 0, 0, 0)) for key in self._deleted]
+            records.sort()
+            seq = self._runs[-1].seq + 1 if self._runs else 1
+            _write_run(self._run_path(seq), records, (self._active, self._size))
+            self._runs.append(_Run(self._run_path(seq), seq))
+            self._recent = {}
+            self._deleted = set()
+            if len(self._runs) > self.max_runs:
+                self._merge_runs()
+
+    def _merge_runs(self) -> None:
+        """
+        Replaces all runs by one, keeping the newest record for each key and
+        dropping tombstones, since no older run remains for them to mask.
+        """
+        newest = self._runs[-1]
+
+        def tagged(run: _Run, age: int) -> Iterator[tuple[bytes, int, Location]]:
+            for key, location in run:
+                yield (key, age, location)
+
+        def merged() -> Iterator[tuple[bytes, Location]]:
+            last = None
+            streams = [tagged(run, len(self._runs) - i) for i, run in enumerate(self._runs)]
+            for key, _, location in heapq.merge(*streams):
+                if key == last:
+                    continue
+                last = key
+                if location.segment != tombstone:
+                    yield (key, location)
+
+        seq = newest.seq + 1
+        _write_run(self._run_path(seq), merged(), newest.indexed_to)
+        old = self._runs
+        self._runs = [_Run(self._run_path(seq), seq)]
+        for run in old:
+            run.close()
+            os.remove(run.path)
+
+    def compact(self, threshold: float = 0.5) -> int:
+        """
+        Rewrites the segments (other than the active one) in which less than
+        `threshold` of the bytes belong to live blocks, and returns the number
+        of bytes reclaimed.
+        """
+        with self._lock:
+            self.flush()
+            if len(self._runs) > 1:
+                self._merge_runs()
+            live = dict.fromkeys(self._segments, 0)
+            for _, location in self._runs[0] if self._runs else ():
+                live[location.segment] = live.get(location.segment, 0) + location.header + location.length
+            sizes = {n: os.path.getsize(self._segment_path(n)) for n in self._segments}
+            victims = [
+                n for n in self._segments
+                if n != self._active and live[n] < threshold * sizes[n]
+            ]
+            moves: dict[int, list[tuple[bytes, Location]]] = {n: [] for n in victims}
+            if victims:
+                for key, location in self._runs[0]:
+                    if location.segment in moves:
+                        moves[location.segment].append((key, location))
+
+        reclaimed = 0
+        for n in victims:
+            # one segment at a time, so that readers and writers interleave
+            with self._lock:
+                view = memoryview(self._map(n, sizes[n]))
+                self._append(
+                    (
+                        (key, view[location.offset : location.offset + location.header + location.length], location.header)
+                        for key, location in moves[n]
+                        if self._find(key) == location  # not deleted meanwhile
+                    ),
+                    replace=True,
+                )
+                self.flush()
+                view.release()
+                del self._maps[n]
+                self._segments.remove(n)
+                os.remove(self._segment_path(n))
+                reclaimed += sizes[n] - live[n]
+        return reclaimed
+
+    def multihashes(self) -> Iterator[BytesLike]:
+        """
+        The multihashes of the stored blocks, read from the segments. Flushes
+        first, and holds the store's lock until the iteration ends.
+        """
+        with self._lock:
+            self.flush()
+            if len(self._runs) > 1:
+                self._merge_runs()
+            for _, location in self._runs[0] if self._runs else ():
+                view = memoryview(self._map(location.segment, location.offset + location.header))
+                _, cid_start = decode_varint(view, location.offset)
+                yield bytes(cid_multihash(view[cid_start : location.offset + location.header]))
+                view.release()
+
+    def compact_in_background(self, threshold: float = 0.5) -> threading.Thread:
+        """
+        Runs :meth:`compact` on a new daemon thread, which is returned.
+        """
+        thread = threading.Thread(target=self.compact, args=(threshold,), daemon=True)
+        thread.start()
+        return thread
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self._file.close()
+            for run in self._runs:
+                run.close()
+            self._maps = {}
+
+    def __enter__(self) -> "PackBlockstore":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
@@ -0,0 +1,250 @@
+"""
+Profiling harness for the codec. Runs representative workloads through
+`prepare`, `validate`, `encode` and `decode` under a deterministic profiler and
+attributes the time to codec phases:
+
+* ``varint``: `decode_varint`, `encode_varint`, `sov` and `len64`
+* ``copy``: `decode_bytes`, which slices field contents out of the block
+* ``has_only_attrs``: the extraneous-property checks in `validate`
+* ``link_comparator``: link sorting and sort-order validation
+* ``cid``: multiformats, i.e. `CID.decode` and CID serialization
+* ``other``: everything else, including the copies done inline by the encoder
+
+Usage::
+
+    python -m ipld_dag_pb.profile [--workload NAME] [--iterations N]
+                                  [--flamegraph FILE] [--json] [--native]
+
+`--flamegraph` writes collapsed stacks (one ``frame;frame;frame microseconds``
+line per stack) that `flamegraph.pl`, speedscope or inferno can render.
+
+The compiled accelerator is bypassed unless `--native` is given, since its
+phases are not visible to the profiler. Deterministic profiling adds a roughly
+constant overhead per call, which inflates small functions such as
+`decode_varint`; compare breakdowns between runs rather than reading them as
+absolute timings.
+"""
+
+import argparse
+import json
+import sys
+from functools import partial
+from time import perf_counter_ns
+from types import FrameType
+from typing import Any, Callable, Final, Optional, TextIO
+from multiformats import CID, multihash
+from . import backend, code, decode, encode
+from .node import PBNode
+from .util import prepare, validate
+
+phases: Final = {
+    "ipld_dag_pb.decode.decode_varint": "varint",
+    "ipld_dag_pb.encode.encode_varint": "varint",
+    "ipld_dag_pb.encode.sov": "varint",
+    "ipld_dag_pb.encode.len64": "varint",
+    "ipld_dag_pb.decode.decode_bytes": "copy",
+    "ipld_dag_pb.util.has_only_attrs": "has_only_attrs",
+    "ipld_dag_pb.util.link_comparator": "link_comparator",
+    "ipld_dag_pb.util._link_comparator": "link_comparator",
+}
+""" Maps profiled function names to the phase their time is attributed to. """
+
+phase_names: Final = ("varint", "copy", "has_only_attrs", "link_comparator", "cid", "other")
+
+workload_names: Final = ("leaves", "file", "directory")
+
+
+def phase_of(stack: tuple[str, ...]) -> str:
+    """
+    The phase of the innermost frame in `stack` that belongs to one.
+    """
+    for frame in reversed(stack):
+        phase = phases.get(frame)
+        if phase is not None:
+            return phase
+        if frame.startswith("multiformats."):
+            return "cid"
+    return "other"
+
+
+def _frame_name(frame: FrameType) -> str:
+    code_obj = frame.f_code
+    name = getattr(code_obj, "co_qualname", code_obj.co_name)
+    return str(frame.f_globals.get("__name__", "?")) + "." + name
+
+
+def _c_name(fn: Any) -> str:
+    module = getattr(fn, "__module__", None) or "builtins"
+    return module + "." + getattr(fn, "__qualname__", getattr(fn, "__name__", "?"))
+
+
+class Profiler:
+    """
+    Deterministic profiler recording self time (in nanoseconds) per call stack.
+    """
+
+    samples: dict[tuple[str, ...], int]
+
+    def __init__(self) -> None:
+        self.samples = {}
+        self._stack: list[str] = []
+        self._last = 0
+
+    def _profile(self, frame: FrameType, event: str, arg: Any) -> None:
+        now = perf_counter_ns()
+        if self._stack:
+            key = tuple(self._stack)
+            self.samples[key] = self.samples.get(key, 0) + now - self._last
+
+        if event == "call":
+            self._stack.append(_frame_name(frame))
+        elif event == "c_call":
+            self._stack.append(_c_name(arg))
+        elif self._stack:  # return, c_return or c_exception
+            self._stack.pop()
+
+        # exclude the profiler's own overhead
+        self._last = perf_counter_ns()
+
+    def run(self, fn: Callable[[], Any]) -> None:
+        self._stack = []
+        self._last = perf_counter_ns()
+        sys.setprofile(self._profile)
+        try:
+            fn()
+        finally:
+            sys.setprofile(None)
+
+    def breakdown(self) -> dict[str, int]:
+        """
+        Total self time in nanoseconds per phase.
+        """
+        totals = dict.fromkeys(phase_names, 0)
+        for stack, ns in self.samples.items():
+            totals[phase_of(stack)] += ns
+        return totals
+
+    def write_collapsed(self, out: TextIO) -> None:
+        """
+        Writes the samples as collapsed stacks with microsecond weights.
+        """
+        for stack, ns in sorted(self.samples.items()):
+            us = ns // 1000
+            if us > 0:
+                out.write(";".join(stack) + " " + str(us) + "\n")
+
+
+def _cid(byts: bytes) -> CID:
+    return CID("base32", 1, code, multihash.digest(byts, "sha2-256"))
+
+
+def workloads(scale: int = 1) -> dict[str, Callable[[], None]]:
+    """
+    Representative workloads, each a callable performing one round of work:
+
+    * ``leaves``: small data-only nodes, as produced by a file chunker
+    * ``file``: a file root with many unnamed links and UnixFS metadata
+    * ``directory``: a directory with many named links in unsorted order
+    """
+    leaf_data = [bytes([i % 256]) * 1024 for i in range(64 * scale)]
+    leaf_blocks = [bytes(encode(prepare(d))) for d in leaf_data]
+
+    cids = [_cid(b) for b in leaf_blocks]
+    file_node = prepare({
+        "data": bytes.fromhex("08021880808001"),
+        "links": [{"hash": c, "name": "", "t_size": 1024} for c in cids] * 4,
+    })
+    file_block = bytes(encode(file_node))
+
+    dir_links = [
+        {"hash": cids[i % len(cids)], "name": "entry-" + str((i * 7919) % 1000), "t_size": i}
+        for i in range(256 * scale)
+    ]
+    dir_block = bytes(encode(prepare({"data": b"\x08\x01", "links": dir_links})))
+
+    def leaves() -> None:
+        for d in leaf_data:
+            decode(encode(prepare(d)))
+        for b in leaf_blocks:
+            decode(b)
+
+    def file() -> None:
+        node = decode(file_block)
+        validate(node)
+        encode(node)
+        encode(PBNode(node.data, list(node.links)))
+
+    def directory() -> None:
+        node = prepare({"data": b"\x08\x01", "links": dir_links})
+        encode(node)
+        validate(decode(dir_block))
+
+    return {"leaves": leaves, "file": file, "directory": directory}
+
+
+def _repeat(fn: Callable[[], None], iterations: int) -> None:
+    for _ in range(iterations):
+        fn()
+
+
+def profile(
+    names: Optional[list[str]] = None, iterations: int = 10, native: bool = False
+) -> Profiler:
+    """
+    Profiles the named workloads (all by default), `iterations` rounds each.
+    """
+    available = workloads()
+    profiler = Profiler()
+    speedups = backend.speedups
+    if not native:
+        backend.speedups = None
+    try:
+        for name in names or list(available):
+            profiler.run(partial(_repeat, available[name], iterations))
+    finally:
+        backend.speedups = speedups
+    return profiler
+
+
+def _report(totals: dict[str, int], out: TextIO) -> None:
+    total = sum(totals.values()) or 1
+    out.write(f"{'phase':<16} {'ms':>10} {'share':>7}\n")
+    for phase in phase_names:
+        ns = totals[phase]
+        out.write(f"{phase:<16} {ns / 1e6:>10.2f} {100 * ns / total:>6.1f}%\n")
+    out.write(f"{'total':<16} {total / 1e6:>10.2f}\n")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m ipld_dag_pb.profile",
+        description="Attribute DAG-PB codec time to varint, copy, validation and CID phases.",
+    )
+    parser.add_argument(
+        "--workload", action="append", choices=workload_names,
+        help="workload to run, may be repeated (default: all)",
+    )
+    parser.add_argument("--iterations", type=int, default=10, help="rounds per workload")
+    parser.add_argument("--flamegraph", metavar="FILE", help="write collapsed stacks to FILE")
+    parser.add_argument("--json", action="store_true", help="print the breakdown as JSON")
+    parser.add_argument(
+        "--native", action="store_true", help="keep the compiled accelerator enabled"
+    )
+    args = parser.parse_args(argv)
+
+    profiler = profile(args.workload, args.iterations, args.native)
+    totals = profiler.breakdown()
+    if args.json:
+        used = backend.name() if args.native else "python"
+        json.dump({"backend": used, "phases_ns": totals}, sys.stdout)
+        sys.stdout.write("\n")
+    else:
+        _report(totals, sys.stdout)
+    if args.flamegraph:
+        with open(args.flamegraph, "w", encoding="utf-8") as f:
+            profiler.write_collapsed(f)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
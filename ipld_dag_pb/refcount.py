@@ -0,0 +1,493 @@
+"""
+Reference counts of blocks, for incremental garbage collection.
+
+:class:`RefCountedBlockstore` wraps a blockstore and keeps, for every block,
+the number of links to it from the blocks in the store. The links of each
+DAG-PB block are read with the raw decoder as it is put, and again when it
+is deleted, so a block is garbage exactly when its count is zero and it is
+not pinned. :meth:`RefCountedBlockstore.collect` frees such blocks and,
+following their links, the subtrees that nothing else references, doing work
+in proportion to what it frees rather than to the size of the store::
+
+    store = RefCountedBlockstore(PackBlockstore("blocks"), "blocks/refs")
+    store.put_many(new_version_blocks)
+    store.pin(new_root)
+    store.unpin(old_root)
+    store.collect()  # frees the blocks only the old version used
+    store.close()
+
+Newly put blocks that nothing links to are garbage too, so the root of an
+import must be pinned before the next :meth:`~RefCountedBlockstore.collect`.
+
+The counts are held in memory and persisted in the directory `path` as a
+snapshot plus a journal. Each put, delete, pin and unpin is appended to the
+journal with a checksum and, with `sync`, synced to disk before the store is
+changed. On opening, the journal is replayed over the snapshot: puts the
+store did not keep are dropped and deletes are redone, so after a crash no
+stored block is counted as having fewer parents than it has, and nothing
+reachable is freed. :meth:`~RefCountedBlockstore.flush` flushes the store,
+writes a new snapshot and starts a new journal.
+
+Blocks are identified by multihash throughout, as
+:class:`ipld_dag_pb.pack.PackBlockstore` keys them: a CIDv0 link counts for
+the block put under the CIDv1 with the same multihash, a block is stored once,
+under the CID it was first put with, and `get`, `has` and `delete` accept any
+CID with its multihash.
+"""
+
+import os
+import struct
+import threading
+import zlib
+from typing import TYPE_CHECKING, Any, BinaryIO, Final, Iterable, Iterator, Optional, Protocol
+from .car import cid_codec, cid_multihash, dag_pb_code
+from .decode import decode_node
+from .node import BytesLike
+from .util import cid_decoder
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+snapshot_magic: Final = b"DAGPBREF"
+snapshot_version: Final = 2
+snapshot_header: Final = struct.Struct(">8sIQQQQQ")
+""" magic, version, generation, and the number of counts, blocks, pins and candidates. """
+journal_record: Final = struct.Struct(">IIB")
+""" payload length, CRC-32 of the op and payload, op. """
+_length: Final = struct.Struct(">H")
+_count: Final = struct.Struct(">Q")
+
+op_put: Final = 1
+op_delete: Final = 2
+op_pin: Final = 3
+op_unpin: Final = 4
+
+
+class _Deletable(Protocol):
+    def get(self, cid: "CID") -> BytesLike: ...
+
+    def has(self, cid: "CID") -> bool: ...
+
+    def put_many(self, blocks: Iterable[tuple["CID", BytesLike]]) -> None: ...
+
+    def delete(self, cid: "CID") -> None: ...
+
+
+def block_links(cid: BytesLike, block: BytesLike) -> list[bytes]:
+    """
+    The binary CIDs that the block with binary CID `cid` links to: those of a
+    DAG-PB block's links, and none for other codecs.
+    """
+    if cid_codec(cid) != dag_pb_code:
+        return []
+    pbn = decode_node(block, fields="links")
+    links = []
+    for link in getattr(pbn, "links", ()):
+        if not hasattr(link, "hash"):
+            raise TypeError("Invalid Hash field found in link, expected CID")
+        links.append(bytes(link.hash))
+    return links
+
+
+def _pack_cids(cids: Iterable[bytes]) -> bytes:
+    return b"".join(_length.pack(len(cid)) + cid for cid in cids)
+
+
+def _unpack_cids(buf: bytes) -> list[bytes]:
+    cids = []
+    index = 0
+    while index < len(buf):
+        (n,) = _length.unpack_from(buf, index)
+        index += _length.size
+        cids.append(buf[index : index + n])
+        index += n
+    return cids
+
+
+def _key(cid: BytesLike) -> bytes:
+    return bytes(cid_multihash(cid))
+
+
+class RefCountedBlockstore:
+    """
+    A blockstore that counts the references to each block of `store`, which
+    must also support `delete`, persisting the counts in the directory
+    `path`. Opening it recovers the counts as of the last change that reached
+    the journal. Safe to use from several threads.
+
+    Only blocks put through this wrapper are counted, so `store` must be empty
+    when `path` is first used: blocks already in it would never be collected,
+    and the links in them would not count as references, so the blocks they
+    point to could be collected while still in use.
+    """
+
+    store: _Deletable
+    path: str
+    sync: bool
+
+    def __init__(self, store: Any, path: str, sync: bool = True) -> None:
+        self.store = store
+        self.path = path
+        self.sync = sync
+        self._lock = threading.RLock()
+        self._decode_cid = cid_decoder()
+        self._counts: dict[bytes, int] = {}
+        self._stored: dict[bytes, bytes] = {}
+        """ The binary CID each block was stored under, by multihash. """
+        self._pins: dict[bytes, bytes] = {}
+        self._candidates: set[bytes] = set()
+        """ Multihashes of blocks that may be garbage; checked by collect(). """
+        self._generation = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+        # replay into a new snapshot, so the journal never grows across opens
+        replayed = self._replay()
+        self._journal: Optional[BinaryIO] = None
+        if replayed:
+            self.flush()
+        else:
+            self._open_journal()
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.path, "refcounts")
+
+    def _journal_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"journal-{generation:06d}")
+
+    def _load(self) -> None:
+        try:
+            f = open(self._snapshot_path(), "rb")  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return
+        with f:
+            buf = f.read()
+        if len(buf) < snapshot_header.size:
+            raise ValueError(f"refcount: snapshot {self._snapshot_path()} is truncated")
+        magic, version, generation, counts, blocks, pins, candidates = snapshot_header.unpack_from(
+            buf
+        )
+        if magic != snapshot_magic or version != snapshot_version:
+            raise ValueError(f"refcount: {self._snapshot_path()} is not a reference count snapshot")
+        self._generation = generation
+        index = snapshot_header.size
+        try:
+            for _ in range(counts):
+                (n,) = _length.unpack_from(buf, index)
+                key = buf[index + _length.size : index + _length.size + n]
+                index += _length.size + n
+                (self._counts[key],) = _count.unpack_from(buf, index)
+                index += _count.size
+            for table, n in ((self._stored, blocks), (self._pins, pins)):
+                for _ in range(n):
+                    (length,) = _length.unpack_from(buf, index)
+                    cid = buf[index + _length.size : index + _length.size + length]
+                    index += _length.size + length
+                    table[_key(cid)] = cid
+            for _ in range(candidates):
+                (length,) = _length.unpack_from(buf, index)
+                self._candidates.add(buf[index + _length.size : index + _length.size + length])
+                index += _length.size + length
+        except struct.error as e:
+            raise ValueError(f"refcount: snapshot {self._snapshot_path()} is truncated") from e
+
+    def _records(self) -> Iterator[tuple[int, list[bytes]]]:
+        """
+        The `(op, CIDs)` records of the current journal, stopping at (and
+        truncating) a record cut short or corrupted by a crash.
+        """
+        path = self._journal_path(self._generation)
+        try:
+            f = open(path, "rb")  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return
+        with f:
+            buf = f.read()
+        index = 0
+        while index + journal_record.size <= len(buf):
+            length, crc, op = journal_record.unpack_from(buf, index)
+            start = index + journal_record.size
+            payload = buf[start : start + length]
+            if len(payload) != length or zlib.crc32(bytes([op]) + payload) != crc:
+                break
+            yield (op, _unpack_cids(payload))
+            index = start + length
+        if index < len(buf):
+            os.truncate(path, index)
+
+    def _replay(self) -> bool:
+        """
+        Applies the journal. A put is only applied if the store kept the
+        block, which is the case if it is still stored or deleted by a later
+        record; a delete is redone if the store still holds the block.
+        """
+        records = list(self._records())
+        later: dict[bytes, int] = {}
+        next_op: list[Optional[int]] = [None] * len(records)
+        for i in range(len(records) - 1, -1, -1):
+            op, cids = records[i]
+            if op in (op_put, op_delete):
+                key = _key(cids[0])
+                next_op[i] = later.get(key)
+                later[key] = op
+        for i, (op, cids) in enumerate(records):
+            cid = cids[0]
+            if op == op_put:
+                if next_op[i] == op_delete or (
+                    next_op[i] is None and self.store.has(self._decode_cid(cid))
+                ):
+                    self._apply_put(cid, cids[1:])
+            elif op == op_delete:
+                self._apply_delete(cid, cids[1:])
+                if next_op[i] is None and self.store.has(self._decode_cid(cid)):
+                    self.store.delete(self._decode_cid(cid))
+            elif op == op_pin:
+                self._pins[_key(cid)] = cid
+            elif op == op_unpin:
+                self._apply_unpin(cid)
+        return bool(records)
+
+    def _open_journal(self) -> None:
+        self._journal = open(self._journal_path(self._generation), "ab")  # pylint: disable=consider-using-with
+
+    def _log(self, records: Iterable[tuple[int, list[bytes]]]) -> None:
+        out = bytearray()
+        for op, cids in records:
+            payload = _pack_cids(cids)
+            out += journal_record.pack(len(payload), zlib.crc32(bytes([op]) + payload), op)
+            out += payload
+        assert self._journal is not None
+        self._journal.write(out)
+        self._journal.flush()
+        if self.sync:
+            os.fsync(self._journal.fileno())
+
+    def _apply_put(self, cid: bytes, links: list[bytes]) -> None:
+        key = _key(cid)
+        if key in self._stored:
+            return
+        self._stored[key] = cid
+        if not self._counts.get(key):
+            self._candidates.add(key)
+        for link in links:
+            link_key = _key(link)
+            self._counts[link_key] = self._counts.get(link_key, 0) + 1
+
+    def _apply_delete(self, cid: bytes, links: list[bytes]) -> None:
+        key = _key(cid)
+        if self._stored.pop(key, None) is None:
+            return  # logged again after a failed collect()
+        self._candidates.discard(key)
+        for link in links:
+            link_key = _key(link)
+            count = self._counts.get(link_key, 0) - 1
+            if count > 0:
+                self._counts[link_key] = count
+            else:
+                self._counts.pop(link_key, None)
+                self._candidates.add(link_key)
+
+    def _apply_unpin(self, cid: bytes) -> None:
+        key = _key(cid)
+        self._pins.pop(key, None)
+        if not self._counts.get(key):
+            self._candidates.add(key)
+
+    def _stored_cid(self, cid: "CID") -> "CID":
+        """
+        The CID the block with the multihash of `cid` was stored under, or
+        `cid` if it was not put through this store.
+        """
+        binary = bytes(cid)
+        stored = self._stored.get(_key(binary))
+        return cid if stored is None or stored == binary else self._decode_cid(stored)
+
+    def get(self, cid: "CID") -> BytesLike:
+        return self.store.get(self._stored_cid(cid))
+
+    def has(self, cid: "CID") -> bool:
+        return _key(bytes(cid)) in self._stored or self.store.has(cid)
+
+    def put(self, cid: "CID", block: BytesLike) -> None:
+        self.put_many([(cid, block)])
+
+    def put_many(self, blocks: Iterable[tuple["CID", BytesLike]]) -> None:
+        """
+        Stores the blocks that are not already stored and counts their links.
+        Raises the errors :func:`ipld_dag_pb.decode` would for a malformed
+        DAG-PB block, before anything is stored.
+        """
+        with self._lock:
+            new: list[tuple["CID", BytesLike]] = []
+            records: list[tuple[int, list[bytes]]] = []
+            seen: set[bytes] = set()
+            for cid, block in blocks:
+                binary = bytes(cid)
+                key = _key(binary)
+                if key in seen or self.has(cid):
+                    continue
+                seen.add(key)
+                new.append((cid, block))
+                records.append((op_put, [binary] + block_links(binary, block)))
+            if not new:
+                return
+            self._log(records)
+            try:
+                self.store.put_many(new)
+            except BaseException:
+                # count what the store kept, as recovery would
+                for (cid, _), (_, cids) in zip(new, records):
+                    if self.store.has(cid):
+                        self._apply_put(cids[0], cids[1:])
+                raise
+            for _, cids in records:
+                self._apply_put(cids[0], cids[1:])
+
+    def delete(self, cid: "CID") -> None:
+        """
+        Removes the block `cid` and the references it holds, even if other
+        blocks still link to it. Raises KeyError if it is not stored.
+        """
+        with self._lock:
+            if not self.has(cid):
+                raise KeyError(cid)
+            self._delete([self._stored_cid(cid)])
+
+    def _delete(self, cids: list["CID"]) -> None:
+        records = []
+        for cid in cids:
+            binary = bytes(cid)
+            records.append((op_delete, [binary] + block_links(binary, self.store.get(cid))))
+        self._log(records)
+        for cid, (_, logged) in zip(cids, records):
+            # a logged delete is redone on recovery whether or not the store
+            # got to it, and one that fails here is retried by collect()
+            self.store.delete(cid)
+            self._apply_delete(logged[0], logged[1:])
+
+    def pin(self, cid: "CID") -> None:
+        """
+        Keeps the block `cid`, and everything it links to, from being
+        collected. The block does not need to be stored yet.
+        """
+        with self._lock:
+            binary = bytes(cid)
+            if _key(binary) in self._pins:
+                return
+            self._log([(op_pin, [binary])])
+            self._pins[_key(binary)] = binary
+
+    def unpin(self, cid: "CID") -> None:
+        """
+        Releases a pin, making the block garbage if no stored block links to
+        it. Raises KeyError if it is not pinned.
+        """
+        with self._lock:
+            binary = bytes(cid)
+            if _key(binary) not in self._pins:
+                raise KeyError(cid)
+            self._log([(op_unpin, [binary])])
+            self._apply_unpin(binary)
+
+    def pinned(self, cid: "CID") -> bool:
+        return _key(bytes(cid)) in self._pins
+
+    def references(self, cid: "CID") -> int:
+        """
+        The number of links to `cid` from stored blocks.
+        """
+        return self._counts.get(_key(bytes(cid)), 0)
+
+    def collect(self) -> int:
+        """
+        Deletes every stored block that is neither pinned nor linked to from
+        another stored block, including the blocks that become unreferenced
+        as a result, and returns how many were deleted. Only blocks whose
+        references changed since the last collection are examined.
+        """
+        freed = 0
+        with self._lock:
+            while self._candidates:
+                # a wave at a time, so that each wave is one journal write
+                candidates = self._candidates
+                self._candidates = set()
+                try:
+                    wave = []
+                    for key in candidates:
+                        binary = self._stored.get(key)
+                        if binary is None or self._counts.get(key) or key in self._pins:
+                            continue
+                        cid = self._decode_cid(binary)
+                        if self.store.has(cid):
+                            wave.append(cid)
+                    if wave:
+                        self._delete(wave)
+                except BaseException:
+                    # the blocks that were deleted are no longer stored, so
+                    # the next collection skips them
+                    self._candidates |= candidates
+                    raise
+                freed += len(wave)
+        return freed
+
+    def flush(self) -> None:
+        """
+        Flushes the store (if it can be) and writes a new snapshot of the
+        counts, replacing the journal.
+        """
+        with self._lock:
+            flush = getattr(self.store, "flush", None)
+            if flush is not None:
+                flush()
+            generation = self._generation + 1
+            path = self._snapshot_path()
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(
+                    snapshot_header.pack(
+                        snapshot_magic,
+                        snapshot_version,
+                        generation,
+                        len(self._counts),
+                        len(self._stored),
+                        len(self._pins),
+                        len(self._candidates),
+                    )
+                )
+                f.write(
+                    b"".join(
+                        _length.pack(len(key)) + key + _count.pack(count)
+                        for key, count in self._counts.items()
+                    )
+                )
+                f.write(_pack_cids(self._stored.values()))
+                f.write(_pack_cids(self._pins.values()))
+                f.write(_pack_cids(self._candidates))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            if self._journal is not None:
+                self._journal.close()
+            self._generation = generation
+            self._open_journal()
+            for name in os.listdir(self.path):
+                if name.startswith("journal-") and name != f"journal-{generation:06d}":
+                    os.remove(os.path.join(self.path, name))
+
+    def close(self) -> None:
+        """
+        Flushes, then closes the store (if it can be).
+        """
+        with self._lock:
+            self.flush()
+            assert self._journal is not None
+            self._journal.close()
+            close = getattr(self.store, "close", None)
+            if close is not None:
+                close()
+
+    def __enter__(self) -> "RefCountedBlockstore":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
@@ -0,0 +1,194 @@
+"""
+Passing blocks to worker processes through shared memory instead of pickles.
+
+Sending decoded nodes between processes pickles every link's CID object,
+which often costs more than decoding. :class:`SharedBlocks` instead places a
+batch of encoded blocks in one :class:`multiprocessing.shared_memory.SharedMemory`
+segment; it pickles as the segment's name, and unpickling it attaches to the
+same memory, so each process reads the blocks as memoryviews without copying
+and decodes only the ones it works on (with zero-copy `data`).
+
+:func:`map_blocks` and :func:`map_nodes` fan a function out over a batch on a
+process pool this way, e.g. to process one level of a DAG traversal. The
+function's results are still pickled back, so it should return small values
+(counts, binary CIDs) rather than nodes or views of the blocks.
+"""
+
+import multiprocessing
+import struct
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Final, Iterable, Optional, TypeVar
+from .node import BytesLike, PBNode
+
+T = TypeVar("T")
+
+magic: Final = b"DAGPBSHM"
+header: Final = struct.Struct("=8sQ")
+""" magic, block count; followed by count + 1 native 64-bit offsets. """
+
+
+class SharedBlocks:
+    """
+    A read-only sequence of encoded blocks in shared memory, indexed from 0.
+    Create one with :meth:`create`, which copies the blocks in once; other
+    processes attach to it by unpickling it, or with :meth:`attach`.
+
+    The memoryviews returned by indexing, and nodes decoded from them, must
+    be released before :meth:`close`. Closing the instance that created the
+    memory also frees it, so it should outlive the processes using it.
+    """
+
+    name: str
+    """ The name of the shared memory segment. """
+
+    def __init__(self, shm: SharedMemory, owner: bool) -> None:
+        self._shm = shm
+        self._owner = owner
+        self.name = shm.name
+        buf = shm.buf
+        assert buf is not None
+        found, count = header.unpack_from(buf)
+        if found != magic:
+            shm.close()
+            raise ValueError(f"shared: {shm.name} does not hold shared blocks")
+        self._count: int = count
+        self._closed = False
+        self._buf = buf
+        self._offsets = buf[header.size : header.size + 8 * (count + 1)].cast("Q")
+
+    @classmethod
+    def create(cls, blocks: Iterable[BytesLike]) -> "SharedBlocks":
+        """
+        Copies `blocks` into a new shared memory segment.
+        """
+        views = [memoryview(block).cast("B") for block in blocks]
+        start = header.size + 8 * (len(views) + 1)
+        size = start + sum(len(view) for view in views)
+        shm = SharedMemory(create=True, size=size)
+        try:
+            buf = shm.buf
+            assert buf is not None
+            header.pack_into(buf, 0, magic, len(views))
+            offsets = buf[header.size : start].cast("Q")
+            offset = start
+            for i, view in enumerate(views):
+                offsets[i] = offset
+                buf[offset : offset + len(view)] = view
+                offset += len(view)
+            offsets[len(views)] = offset
+            offsets.release()
+            return cls(shm, owner=True)
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedBlocks":
+        """
+        Attaches to the shared blocks created under `name`.
+        """
+        return cls(SharedMemory(name=name), owner=False)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> memoryview:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("shared: block index out of range")
+        return self._buf[self._offsets[index] : self._offsets[index + 1]]
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return (SharedBlocks.attach, (self.name,))
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory, and frees it if this instance created
+        it.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._offsets.release()
+        try:
+            self._shm.close()
+        finally:
+            if self._owner:
+                self._shm.unlink()
+
+    def __enter__(self) -> "SharedBlocks":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+_worker_blocks: Optional[SharedBlocks] = None
+""" The blocks a pool worker started by :func:`map_blocks` works on. """
+
+
+def _init_worker(blocks: SharedBlocks) -> None:
+    global _worker_blocks  # pylint: disable=global-statement
+    _worker_blocks = blocks
+
+
+def _run_blocks(fn: Callable[[memoryview], T], start: int, stop: int) -> list[T]:
+    assert _worker_blocks is not None
+    return [fn(_worker_blocks[i]) for i in range(start, stop)]
+
+
+def _run_nodes(fn: Callable[[PBNode], T], start: int, stop: int) -> list[T]:
+    from . import decode  # pylint: disable=import-outside-toplevel
+
+    assert _worker_blocks is not None
+    return [fn(decode(_worker_blocks[i])) for i in range(start, stop)]
+
+
+def _map(
+    run: Callable[..., list[T]],
+    fn: Callable[[Any], T],
+    blocks: Iterable[BytesLike],
+    processes: Optional[int],
+    chunksize: Optional[int],
+) -> list[T]:
+    with SharedBlocks.create(blocks) as shared:
+        n = len(shared)
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if chunksize is None:
+            chunksize = max(1, -(-n // (processes * 4)))
+        tasks = [(fn, start, min(start + chunksize, n)) for start in range(0, n, chunksize)]
+        with multiprocessing.Pool(processes, _init_worker, (shared,)) as pool:
+            chunks = pool.starmap(run, tasks)
+    return [result for chunk in chunks for result in chunk]
+
+
+def map_blocks(
+    fn: Callable[[memoryview], T],
+    blocks: Iterable[BytesLike],
+    processes: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> list[T]:
+    """
+    Returns `[fn(block) for block in blocks]`, computed on a pool of
+    `processes` worker processes (by default one per CPU) that read the
+    blocks from shared memory, `chunksize` blocks per task. `fn` must be
+    picklable, e.g. a module-level function, and is passed a memoryview that
+    is only valid during the call.
+    """
+    return _map(_run_blocks, fn, blocks, processes, chunksize)
+
+
+def map_nodes(
+    fn: Callable[[PBNode], T],
+    blocks: Iterable[BytesLike],
+    processes: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> list[T]:
+    """
+    :func:`map_blocks` with each block decoded in the worker, so `fn` is
+    passed a :class:`PBNode` whose `data` is a view of the shared memory.
+    """
+    return _map(_run_nodes, fn, blocks, processes, chunksize)
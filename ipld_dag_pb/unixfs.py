@@ -0,0 +1,502 @@
+"""
+Random access reads of UnixFS files: https://github.com/ipfs/specs/blob/main/UNIXFS.md
+
+A UnixFS file is a tree of DAG-PB nodes whose leaves (raw blocks, or nodes
+with inline Data) hold the content. Each file node lists the content size of
+every child in the `blocksizes` of its UnixFS Data, so :func:`index_node`
+turns it into prefix sums, and the child holding a given offset is found by
+binary search instead of by summing sizes from the first link.
+:class:`UnixFSFile` uses this to read any byte range by decoding only the
+nodes on the path to it, `O(depth * log(fanout))`::
+
+    f = UnixFSFile(store.get, root)
+    chunk = f.read(offset=10 * 2**30, length=4096)
+
+Nodes are indexed straight from their blocks with the raw decoder, and a CID
+object is only created for the child a read descends into: building a CID
+costs more than decoding a whole node's links, so decoding every link's CID
+would dominate a seek through nodes of a few hundred links.
+
+Nodes without UnixFS Data are indexed by their links' `t_size`, which is the
+content size when the children are raw blocks.
+
+:func:`build_file` imports a file in kubo's default balanced layout: 256 KiB
+raw leaves under file nodes of up to 174 links, every subtree full except
+along the last path. Because a full subtree of height `h` always covers
+`chunk_size * fanout**h` bytes, :func:`build_file_parallel` cuts the input
+into ranges of that size, builds each range's subtree in a worker, and
+stitches the subtree roots together at level `h`, producing the same blocks
+and root as the sequential builder.
+"""
+
+import hashlib
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import accumulate, repeat
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Final,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+from .car import dag_pb_code
+from .decode import decode_bytes, decode_key, decode_node, decode_varint
+from .encode import encode_node, encode_varint, sov
+from .node import BytesLike, PBNode, RawPBLink, RawPBNode
+from .util import cid_class, cid_decoder
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+raw_code: Final = 0x55
+
+type_raw: Final = 0
+type_directory: Final = 1
+type_file: Final = 2
+type_metadata: Final = 3
+type_symlink: Final = 4
+type_hamt_shard: Final = 5
+
+
+class UnixFSData(NamedTuple):
+    """
+    The fields of the UnixFS Data message used for reading files.
+    """
+
+    type: int
+    data: Optional[BytesLike]
+    filesize: Optional[int]
+    blocksizes: list[int]
+
+
+def decode_data(buf: BytesLike) -> UnixFSData:
+    """
+    Decodes the UnixFS Data message held in a PBNode's `data`. Fields other
+    than Type, Data, filesize and blocksizes are skipped.
+    """
+    type_ = None
+    data = None
+    filesize = None
+    blocksizes: list[int] = []
+    index = 0
+    while index < len(buf):
+        wire_type, field_num, index = decode_key(buf, index)
+        if wire_type == 0:
+            value, index = decode_varint(buf, index)
+            if field_num == 1:
+                type_ = value
+            elif field_num == 3:
+                filesize = value
+            elif field_num == 4:
+                blocksizes.append(value)
+        elif wire_type == 2:
+            value_bytes, index = decode_bytes(buf, index)
+            if field_num == 2:
+                data = value_bytes
+            elif field_num == 4:  # packed, as some encoders write it
+                i = 0
+                while i < len(value_bytes):
+                    value, i = decode_varint(value_bytes, i)
+                    blocksizes.append(value)
+        else:
+            raise ValueError(f"unixfs: (Data) unsupported wire type {wire_type}")
+    if type_ is None:
+        raise ValueError("unixfs: (Data) missing Type")
+    return UnixFSData(type_, data, filesize, blocksizes)
+
+
+def _field(out: bytearray, key: int, value: int) -> None:
+    for v in (key, value):
+        varint = memoryview(bytearray(sov(v)))
+        encode_varint(varint, len(varint), v)
+        out += varint
+
+
+def encode_data(
+    type_: int,
+    data: Optional[BytesLike] = None,
+    filesize: Optional[int] = None,
+    blocksizes: Sequence[int] = (),
+) -> bytes:
+    """
+    Encodes a UnixFS Data message, for use as a PBNode's `data`.
+    """
+    out = bytearray()
+    _field(out, 0x08, type_)
+    if data is not None:
+        _field(out, 0x12, len(data))
+        out += data
+    if filesize is not None:
+        _field(out, 0x18, filesize)
+    for size in blocksizes:
+        _field(out, 0x20, size)
+    return bytes(out)
+
+
+class FileIndex(NamedTuple):
+    """
+    A file node's content layout: the inline `data` comes first, then the
+    content of `links[i]` (a binary CID) spans `offsets[i]` to `offsets[i + 1]`.
+    """
+
+    data: BytesLike
+    links: list[BytesLike]
+    offsets: list[int]
+
+    @property
+    def size(self) -> int:
+        return self.offsets[-1]
+
+    def child(self, offset: int) -> int:
+        """
+        The index of the link holding content `offset` (clamped to the links).
+        """
+        return min(max(bisect_right(self.offsets, offset) - 1, 0), len(self.links) - 1)
+
+
+def _index(
+    data: Optional[BytesLike], hashes: list[BytesLike], t_sizes: list[Optional[int]]
+) -> FileIndex:
+    if data is None:
+        inline: BytesLike = b""
+        sizes: list[int] = []
+        for t_size in t_sizes:
+            if t_size is None:
+                raise ValueError("unixfs: link has no Tsize to index by")
+            sizes.append(t_size)
+    else:
+        unixfs = decode_data(data)
+        if unixfs.type not in (type_raw, type_file):
+            raise ValueError(f"unixfs: node of type {unixfs.type} is not a file")
+        if len(unixfs.blocksizes) != len(hashes):
+            raise ValueError("unixfs: blocksizes do not match the links")
+        inline = unixfs.data if unixfs.data is not None else b""
+        sizes = unixfs.blocksizes
+    return FileIndex(inline, hashes, list(accumulate(sizes, initial=len(inline))))
+
+
+def index_node(node: PBNode) -> FileIndex:
+    """
+    Builds the :class:`FileIndex` of a UnixFS file node, or of a plain DAG-PB
+    node over raw blocks.
+    """
+    return _index(
+        node.data,
+        [bytes(link.hash) for link in node.links],
+        [link.t_size for link in node.links],
+    )
+
+
+def index_block(buf: BytesLike) -> FileIndex:
+    """
+    :func:`index_node` for an encoded node, without decoding its links' CIDs.
+    """
+    pbn = decode_node(memoryview(buf))
+    links = getattr(pbn, "links", [])
+    for link in links:
+        if not hasattr(link, "hash"):
+            raise TypeError("Invalid Hash field found in link, expected CID")
+    return _index(
+        getattr(pbn, "data", None),
+        [link.hash for link in links],
+        [getattr(link, "t_size", None) for link in links],
+    )
+
+
+class UnixFSFile:
+    """
+    Reads ranges of the UnixFS file at `root`, with blocks read through `get`.
+    The indexes (and CIDs) of up to `cache_size` recently used nodes are
+    kept, so the upper levels of the tree are not decoded again for every read.
+    """
+
+    get: Callable[["CID"], BytesLike]
+    root: "CID"
+    cache_size: int
+    decoded: int
+    """ The number of nodes decoded so far. """
+    _cache: "OrderedDict[bytes, FileIndex]"
+    _cids: "OrderedDict[bytes, CID]"
+
+    def __init__(self, get: Callable[["CID"], BytesLike], root: "CID", cache_size: int = 1024) -> None:
+        self.get = get
+        self.root = root
+        self.cache_size = cache_size
+        self.decoded = 0
+        self._cache = OrderedDict()
+        self._cids = OrderedDict()
+
+    def _remember(self, cache: "OrderedDict[bytes, Any]", key: bytes, value: Any) -> None:
+        if self.cache_size > 0:
+            cache[key] = value
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def _cid(self, binary: BytesLike) -> "CID":
+        key = bytes(binary)
+        cid = self._cids.get(key)
+        if cid is not None:
+            self._cids.move_to_end(key)
+            return cid
+        cid = cid_class().decode(key)
+        self._remember(self._cids, key, cid)
+        return cid
+
+    def index(self, cid: "CID") -> FileIndex:
+        """
+        The :class:`FileIndex` of the DAG-PB node `cid`.
+        """
+        key = bytes(cid)
+        found = self._cache.get(key)
+        if found is not None:
+            self._cache.move_to_end(key)
+            return found
+        found = index_block(self.get(cid))
+        self.decoded += 1
+        self._remember(self._cache, key, found)
+        return found
+
+    @property
+    def size(self) -> int:
+        if self.root.codec.code == raw_code:
+            return len(self.get(self.root))
+        return self.index(self.root).size
+
+    def read(self, offset: int, length: int) -> bytes:
+        """
+        Up to `length` bytes of content from `offset`; fewer at the end of the
+        file.
+        """
+        if offset < 0 or length < 0:
+            raise ValueError("unixfs: offset and length cannot be negative")
+        out = bytearray()
+        self._read(self.root, offset, offset + length, out)
+        return bytes(out)
+
+    def _read(self, cid: "CID", start: int, end: int, out: bytearray) -> None:
+        if cid.codec.code == raw_code:
+            out += memoryview(self.get(cid))[start:end]
+            return
+        if cid.codec.code != dag_pb_code:
+            raise ValueError(f"unixfs: unsupported codec {cid.codec.name}")
+
+        index = self.index(cid)
+        if start < len(index.data):
+            out += memoryview(index.data)[start:end]
+        if not index.links:
+            return
+        offsets = index.offsets
+        i = index.child(start)
+        while i < len(index.links) and offsets[i] < end:
+            lo = offsets[i]
+            hi = offsets[i + 1]
+            if hi > start:
+                self._read(self._cid(index.links[i]), max(start, lo) - lo, min(end, hi) - lo, out)
+            i += 1
+
+
+default_chunk_size: Final = 256 * 1024
+default_fanout: Final = 174
+
+_raw_prefix: Final = bytes([1, raw_code, 0x12, 0x20])
+_dag_pb_prefix: Final = bytes([1, dag_pb_code, 0x12, 0x20])
+
+
+class _Child(NamedTuple):
+    cid: bytes
+    size: int
+    """ Content bytes. """
+    t_size: int
+    """ Encoded bytes of the whole subtree. """
+
+
+class _TreeBuilder:
+    """
+    Groups children into parents of `fanout` links level by level as they
+    arrive, keeping only the unfinished group of each level. New blocks are
+    appended to `blocks` as `(binary CID, block)` unless it is None.
+    """
+
+    def __init__(self, fanout: int, blocks: Optional[list[tuple[bytes, bytes]]]) -> None:
+        if fanout < 2:
+            raise ValueError("unixfs: fanout must be at least 2")
+        self.fanout = fanout
+        self.blocks = blocks
+        self.levels: list[list[_Child]] = []
+
+    def leaf(self, chunk: bytes) -> None:
+        cid = _raw_prefix + hashlib.sha256(chunk).digest()
+        if self.blocks is not None:
+            self.blocks.append((cid, chunk))
+        self.add(_Child(cid, len(chunk), len(chunk)), 0)
+
+    def add(self, child: _Child, level: int) -> None:
+        while len(self.levels) <= level:
+            self.levels.append([])
+        siblings = self.levels[level]
+        siblings.append(child)
+        if len(siblings) == self.fanout:
+            self.levels[level] = []
+            self.add(self._parent(siblings), level + 1)
+
+    def _parent(self, children: list[_Child]) -> _Child:
+        sizes = [child.size for child in children]
+        node = RawPBNode()
+        node.data = encode_data(type_file, None, sum(sizes), sizes)
+        node.links = []
+        for child in children:
+            link = RawPBLink()
+            link.hash = child.cid
+            link.name = ""
+            link.t_size = child.t_size
+            node.links.append(link)
+        block = bytes(encode_node(node))
+        cid = _dag_pb_prefix + hashlib.sha256(block).digest()
+        if self.blocks is not None:
+            self.blocks.append((cid, block))
+        return _Child(cid, sum(sizes), len(block) + sum(child.t_size for child in children))
+
+    def finish(self, height: Optional[int] = None) -> _Child:
+        """
+        Closes the unfinished groups and returns the root, or with `height`
+        the root of a subtree of exactly that height, even if it has a single
+        child.
+        """
+        level = 0
+        while True:
+            siblings = self.levels[level] if level < len(self.levels) else []
+            if height is None:
+                if len(siblings) == 1 and not any(self.levels[level + 1 :]):
+                    return siblings[0]
+            elif level == height:
+                assert len(siblings) == 1
+                return siblings[0]
+            if siblings:
+                self.levels[level] = []
+                self.add(self._parent(siblings), level + 1)
+            level += 1
+
+
+def _read_chunk(stream: BinaryIO, size: int) -> bytes:
+    chunk = stream.read(size)
+    # streams such as pipes can return less than asked before the end
+    while chunk and len(chunk) < size:
+        more = stream.read(size - len(chunk))
+        if not more:
+            break
+        chunk += more
+    return chunk
+
+
+def _put(
+    blocks: Optional[list[tuple[bytes, bytes]]],
+    put: Optional[Callable[["CID", bytes], Any]],
+    decode_cid: Optional[Callable[[bytes], "CID"]],
+) -> None:
+    if blocks and put is not None and decode_cid is not None:
+        for cid, block in blocks:
+            put(decode_cid(cid), block)
+        blocks.clear()
+
+
+def build_file(
+    stream: BinaryIO,
+    put: Optional[Callable[["CID", bytes], Any]] = None,
+    chunk_size: int = default_chunk_size,
+    fanout: int = default_fanout,
+) -> "CID":
+    """
+    Imports the content of `stream` as a UnixFS file in the balanced layout
+    and returns its root: sha2-256 CIDv1s, raw leaves of `chunk_size` bytes,
+    and file nodes of up to `fanout` unnamed links whose `t_size` is the
+    encoded size of the linked subtree. A file of at most one chunk is a
+    single raw block. Each new block is passed to `put`, e.g.
+    :meth:`ipld_dag_pb.blockstore.MemoryBlockstore.put`, as it is created.
+    """
+    blocks: Optional[list[tuple[bytes, bytes]]] = [] if put is not None else None
+    decode_cid = cid_decoder() if put is not None else None
+    builder = _TreeBuilder(fanout, blocks)
+    first = True
+    while True:
+        chunk = _read_chunk(stream, chunk_size)
+        if not chunk and not first:
+            break
+        first = False
+        builder.leaf(chunk)
+        _put(blocks, put, decode_cid)
+        if len(chunk) < chunk_size:
+            break
+    root = builder.finish()
+    _put(blocks, put, decode_cid)
+    return cid_class().decode(root.cid).set(base="base32")
+
+
+def _build_range(
+    path: str, start: int, end: int, chunk_size: int, fanout: int, height: int, keep: bool
+) -> tuple[_Child, Optional[list[tuple[bytes, bytes]]]]:
+    blocks: Optional[list[tuple[bytes, bytes]]] = [] if keep else None
+    builder = _TreeBuilder(fanout, blocks)
+    with open(path, "rb") as f:
+        f.seek(start)
+        for offset in range(start, end, chunk_size):
+            chunk = f.read(min(chunk_size, end - offset))
+            if len(chunk) != min(chunk_size, end - offset):
+                raise EOFError(f"unixfs: {path} changed while it was imported")
+            builder.leaf(chunk)
+    return builder.finish(height), blocks
+
+
+def build_file_parallel(
+    path: str,
+    put: Optional[Callable[["CID", bytes], Any]] = None,
+    jobs: Optional[int] = None,
+    threads: bool = False,
+    chunk_size: int = default_chunk_size,
+    fanout: int = default_fanout,
+    height: int = 1,
+) -> "CID":
+    """
+    :func:`build_file` for the file at `path`, with the subtrees of height
+    `height` (each covering `chunk_size * fanout**height` bytes) built on a
+    pool of `jobs` worker processes, or threads if `threads` is set. The
+    blocks and root are identical to :func:`build_file`'s, and are passed to
+    `put` in the same order. Blocks built by worker processes are pickled
+    back to be put, so with no `put` only the root is computed.
+    """
+    if height < 1:
+        raise ValueError("unixfs: height must be at least 1")
+    span = chunk_size * fanout**height
+    size = os.path.getsize(path)
+    if size <= span or jobs == 1:
+        with open(path, "rb") as f:
+            return build_file(f, put, chunk_size, fanout)
+
+    blocks: Optional[list[tuple[bytes, bytes]]] = [] if put is not None else None
+    decode_cid = cid_decoder() if put is not None else None
+    builder = _TreeBuilder(fanout, blocks)
+    starts = range(0, size, span)
+    ends = [min(start + span, size) for start in starts]
+    pool: Executor = (ThreadPoolExecutor if threads else ProcessPoolExecutor)(jobs)
+    with pool:
+        for root, range_blocks in pool.map(
+            _build_range,
+            repeat(path),
+            starts,
+            ends,
+            repeat(chunk_size),
+            repeat(fanout),
+            repeat(height),
+            repeat(put is not None),
+        ):
+            _put(range_blocks, put, decode_cid)
+            builder.add(root, height)
+            _put(blocks, put, decode_cid)
+    root = builder.finish()
+    _put(blocks, put, decode_cid)
+    return cid_class().decode(root.cid).set(base="base32")
@@ -1,13 +1,34 @@
-from functools import cmp_to_key
-from typing import Any, Optional, Union
-from multiformats import CID
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, Sequence, Type, Union
+from . import backend
+from .decode import decode_varint
 from .node import BytesLike, PBLink, PBNode, byteslike
 
-pb_node_properties = ["data", "links"]
-pb_link_properties = ["hash", "name", "t_size"]
+if TYPE_CHECKING:
+    from multiformats import CID
+
+pb_node_properties = ["data", "links", "partial"]
+pb_link_properties = ["hash", "name", "t_size", "_record"]
+
+
+def cid_class() -> Type["CID"]:
+    """
+    The multiformats CID class, imported on first use: loading multiformats
+    builds its multicodec and multibase tables, which dominates import time and
+    is not needed to work with raw blocks.
+    """
+    from multiformats import CID  # pylint: disable=import-outside-toplevel
+
+    return CID
 
 
 def link_comparator(a: PBLink, b: PBLink) -> int:
+    if backend.speedups is not None:
+        return backend.speedups.link_comparator(a, b)  # type: ignore[no-any-return]
+    return _link_comparator(a, b)
+
+
+def _link_comparator(a: PBLink, b: PBLink) -> int:
     if a == b:
         return 0
 
@@ -26,6 +47,150 @@ def link_comparator(a: PBLink, b: PBLink) -> int:
     return -1 if x < y else 1 if y < x else 0
 
 
+def _comparator() -> Callable[[PBLink, PBLink], int]:
+    """
+    The active link_comparator() implementation, to avoid dispatching per call
+    when sorting or validating many links.
+    """
+    if backend.speedups is not None:
+        return backend.speedups.link_comparator  # type: ignore[no-any-return]
+    return _link_comparator
+
+
+def _name_key(link: PBLink) -> bytes:
+    """
+    A sort key ordering links as link_comparator() does: by name bytes, with
+    a missing name sorting as empty.
+    """
+    return link.name.encode("utf-8") if isinstance(link.name, str) else b""
+
+
+def cid_decoder() -> Callable[[Union[str, BytesLike]], "CID"]:
+    """
+    Returns a function that decodes CIDs like `CID.decode`, for decoding
+    many binary CIDs that share a few prefixes (version, codec and multihash
+    code and length), such as the links of a directory. Only the first CID
+    with each prefix goes through `CID.decode`, which checks the codes
+    against the multiformats tables; later ones are built from it, about 20
+    times faster.
+    """
+    cid_type = cid_class()
+
+    def decode_cid(value: Union[str, BytesLike]) -> "CID":
+        if isinstance(value, str):
+            return cid_type.decode(value)
+        return decode_binary_cid(bytes(value))
+
+    return decode_cid
+
+
+_max_cid_templates = 1024
+_cid_templates: dict[bytes, "CID"] = {}
+
+
+def decode_binary_cid(buf: bytes) -> "CID":
+    """
+    `CID.decode(buf)` for a binary CID, built from a template CID shared
+    by the process when one with the same prefix was decoded before.
+
+    Only the first CID with a given prefix, and malformed ones, go through
+    `CID.decode`. multiformats checks its arguments by raising and catching
+    TypeErrors, which leaves reference cycles through the calling frames:
+    until the next garbage collection these can keep alive views of a block
+    that was decoded without copying, and so keep its buffer exported. Call
+    `gc.collect()` before resizing such a buffer if that matters.
+    """
+    cid_type = cid_class()
+    # not part of the public multiformats API, so only used if present
+    new_instance = getattr(cid_type, "_new_instance", None)
+    bounds = _multihash_bounds(buf)
+    if new_instance is None or bounds is None:
+        return cid_type.decode(buf)  # malformed, let it raise
+    start, digest_start = bounds
+    template = _cid_templates.get(buf[:digest_start])
+    if template is None:
+        template = cid_type.decode(buf)
+        if len(_cid_templates) < _max_cid_templates:
+            _cid_templates[buf[:digest_start]] = template
+        return template
+    return new_instance(  # type: ignore[no-any-return]
+        cid_type, template.base, template.version, template.codec, template.hashfun, buf[start:]
+    )
+
+
+def _multihash_bounds(buf: bytes) -> Optional[tuple[int, int]]:
+    """
+    Where the multihash and its digest start in the binary CID `buf`, or None
+    if it is not well-formed.
+    """
+    if len(buf) == 34 and buf[0] == 0x12 and buf[1] == 0x20:
+        return (0, 2)  # CIDv0
+    index = 0
+    values = []
+    starts = []
+    for _ in range(4):  # version, codec, multihash code, digest length
+        starts.append(index)
+        try:
+            value, next_index = decode_varint(buf, index)
+        except (EOFError, OverflowError):
+            return None
+        if next_index - index > 1 and buf[next_index - 1] == 0:
+            return None  # non-minimal
+        values.append(value)
+        index = next_index
+    if values[0] != 1 or index + values[3] != len(buf):
+        return None
+    return (starts[2], index)
+
+
+def links_from_columns(
+    names: Sequence[Optional[str]],
+    cids: Sequence[Union["CID", str, BytesLike]],
+    sizes: Optional[Sequence[Optional[int]]] = None,
+    presorted: bool = False,
+) -> list[PBLink]:
+    """
+    Builds the links of a node from columns of link names, CIDs (as CID
+    objects, strings or binary CIDs) and optional `t_size`s, checking them as
+    :func:`prepare` does without building a dict per link. The links are
+    returned sorted by name bytes; with `presorted` the order is checked
+    instead, raising TypeError if they are not.
+    """
+    if len(names) != len(cids) or (sizes is not None and len(sizes) != len(cids)):
+        raise ValueError("links_from_columns: columns must have the same length")
+    CID = cid_class()  # pylint: disable=invalid-name
+    decode_cid = cid_decoder()
+    links = []
+    for name, cid, size in zip(names, cids, repeat(None) if sizes is None else sizes):
+        if not isinstance(cid, CID):
+            if not isinstance(cid, (str, *byteslike)):
+                raise Exception("Invalid DAG-PB form (hash is not a CID)")
+            cid = decode_cid(cid)
+        link = PBLink(cid)
+        if name is not None:
+            if not isinstance(name, str):
+                raise TypeError("Invalid DAG-PB form (name is not a string)")
+            link.name = name
+        if size is not None:
+            if not isinstance(size, int):
+                raise TypeError("Invalid DAG-PB form (t_size not an integer)")
+            if size < 0:
+                raise TypeError("Invalid DAG-PB form (t_size cannot be negative)")
+            link.t_size = size
+        links.append(link)
+
+    if not presorted:
+        links.sort(key=_name_key)
+        return links
+    previous = b""
+    for link in links:
+        key = _name_key(link)
+        if key < previous:
+            raise TypeError("Invalid DAG-PB form (links must be sorted by name bytes)")
+        previous = key
+    return links
+
+
 def has_only_attrs(node: Any, attrs: list[str]) -> bool:
     for attr in vars(node).keys():
         found = False
@@ -38,10 +203,19 @@ def has_only_attrs(node: Any, attrs: list[str]) -> bool:
     return True
 
 
-def as_link(link: Union[CID, str, dict]) -> PBLink:  # type: ignore[type-arg]
+def as_link(link: Union["CID", str, dict]) -> PBLink:  # type: ignore[type-arg]
     """
     Converts a CID, a string encoded CID, or a PBLink-like dict to a PBLink
     """
+    return _as_link(link)
+
+
+def _as_link(
+    link: Union["CID", str, dict], decode_cid: Optional[Callable[[Any], "CID"]] = None  # type: ignore[type-arg]
+) -> PBLink:
+    CID = cid_class()  # pylint: disable=invalid-name
+    if decode_cid is None:
+        decode_cid = CID.decode
     if isinstance(link, CID) or isinstance(link, str):
         link = {"hash": link}
 
@@ -51,7 +225,7 @@ def as_link(link: Union[CID, str, dict]) -> PBLink:  # type: ignore[type-arg]
     hash = link.get("hash", None)
     if hash is not None:
         if isinstance(hash, str) or isinstance(hash, byteslike):
-            hash = CID.decode(hash)
+            hash = decode_cid(hash)
     if not isinstance(hash, CID):
         raise Exception("Invalid DAG-PB form (hash is not a CID)")
 
@@ -80,6 +254,21 @@ def prepare(node: Union[BytesLike, str, dict]) -> PBNode:  # type: ignore[type-a
     """
     Converts bytes, a string, or a PBNode-like dict to a PBNode
     """
+    return _prepare(node)
+
+
+def prepare_many(nodes: Iterable[Union[BytesLike, str, dict]]) -> list[PBNode]:  # type: ignore[type-arg]
+    """
+    `[prepare(node) for node in nodes]`, with link hashes given as binary CIDs
+    converted through one :func:`cid_decoder` for the whole batch.
+    """
+    decode_cid = cid_decoder()
+    return [_prepare(node, decode_cid) for node in nodes]
+
+
+def _prepare(
+    node: Union[BytesLike, str, dict], decode_cid: Optional[Callable[[Any], "CID"]] = None  # type: ignore[type-arg]
+) -> PBNode:
     if isinstance(node, byteslike) or isinstance(node, str):
         node = {"data": node}
 
@@ -104,8 +293,8 @@ def prepare(node: Union[BytesLike, str, dict]) -> PBNode:  # type: ignore[type-a
                 if isinstance(l, PBLink):
                     pbn.links.append(l)
                 else:
-                    pbn.links.append(as_link(l))
-            pbn.links.sort(key=cmp_to_key(link_comparator))
+                    pbn.links.append(_as_link(l, decode_cid))
+            pbn.links.sort(key=_name_key)
         else:
             raise TypeError("Invalid DAG-PB form (links are not a list)")
 
@@ -116,12 +305,20 @@ def validate(node: PBNode) -> None:
     if not has_only_attrs(node, pb_node_properties):
         raise TypeError("Invalid DAG-PB form (extraneous properties)")
 
+    if node.partial:
+        raise TypeError("Invalid DAG-PB form (node was only partially decoded)")
+
     if (node.data is not None) and (not isinstance(node.data, byteslike)):
         raise TypeError("Invalid DAG-PB form (data must be bytes)")
 
     if not isinstance(node.links, list):
         raise TypeError("Invalid DAG-PB form (links must be a list)")
 
+    if len(node.links) == 0:
+        return
+
+    CID = cid_class()  # pylint: disable=invalid-name
+    comparator = _comparator()
     for i in range(0, len(node.links)):
         link = node.links[i]
 
@@ -140,15 +337,15 @@ def validate(node: PBNode) -> None:
             if link.t_size < 0:
                 raise TypeError("Invalid DAG-PB form (link t_size cannot be negative)")
 
-        if i > 0 and link_comparator(link, node.links[i - 1]) == -1:
+        if i > 0 and comparator(link, node.links[i - 1]) == -1:
             raise TypeError("Invalid DAG-PB form (links must be sorted by name bytes)")
 
 
-def create_node(data: Optional[BytesLike], links: list[PBLink] = []) -> PBNode:
-    return prepare({"data": data, "links": links})
+def create_node(data: Optional[BytesLike], links: Optional[list[PBLink]] = None) -> PBNode:
+    return prepare({"data": data, "links": [] if links is None else links})
 
 
 def create_link(
-    hash: CID, name: Optional[str] = None, size: Optional[int] = None
+    hash: "CID", name: Optional[str] = None, size: Optional[int] = None
 ) -> PBLink:
     return as_link({"hash": hash, "name": name, "t_size": size})
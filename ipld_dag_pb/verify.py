@@ -0,0 +1,330 @@
+"""
+Decodes blocks received from untrusted sources while checking them against
+the CIDs they were requested by.
+
+:func:`decode_verified` hashes the block in cache-sized chunks, parsing it
+straight after the first chunk, while the links (which precede the Data in
+canonical blocks) are still in cache. The parser does not read the Data
+payload, which is returned as a view, so every byte of the block is brought
+in from memory once rather than once for hashing and again for decoding. A
+node is only returned once the whole block has been hashed and matched.
+
+Common hash functions are computed with :mod:`hashlib`, which releases the GIL
+while hashing large buffers, so :func:`decode_verified_many` verifies batches
+on a thread pool in parallel.
+
+:func:`verify_car` checks a whole CAR file: every block against its CID,
+every DAG-PB block for well-formedness, and that every linked block is in the
+file. Its sections are split into ranges that are checked in parallel, each
+worker mapping the file itself, and a CARv2 index of the blocks is built on
+the way, which :func:`write_carv2` can attach to the file.
+"""
+
+import hashlib
+import mmap
+import os
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import repeat
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Callable, Final, Iterable, Iterator, NamedTuple, Optional
+from ._convert import from_raw
+from .car import (
+    carv2_header_size,
+    carv2_pragma,
+    cid_codec,
+    cid_multihash,
+    dag_pb_code,
+    data_bounds,
+    encode_carv2_header,
+    encode_index_sorted,
+    first_section,
+    iter_section_bounds,
+)
+from .decode import DecodeLimits, _is_binary_cid, decode_node, decode_varint
+from .node import BytesLike, PBNode
+
+if TYPE_CHECKING:
+    from multiformats import CID
+
+chunk_size: Final = 256 * 1024
+""" Bytes hashed per step, sized to stay within a typical L2 cache. """
+
+hashers: Final[dict[int, Callable[..., Any]]] = {
+    0x11: hashlib.sha1,
+    0x12: hashlib.sha256,
+    0x13: hashlib.sha512,
+    0x14: hashlib.sha3_512,
+    0x15: hashlib.sha3_384,
+    0x16: hashlib.sha3_256,
+    0x17: hashlib.sha3_224,
+    0x20: hashlib.sha384,
+    0xB220: partial(hashlib.blake2b, digest_size=32),
+    0xB240: hashlib.blake2b,
+    0xB260: hashlib.blake2s,
+}
+""" hashlib constructors by multihash code; other hash functions go through multiformats. """
+
+range_size: Final = 16 * 2**20
+""" Bytes of CAR sections :func:`verify_car` hands to a worker at a time. """
+
+
+def _mismatch(cid: "CID") -> ValueError:
+    return ValueError(f"decode_verified: block does not match CID {cid}")
+
+
+def decode_verified(
+    buf: BytesLike,
+    cid: "CID",
+    copy: bool = False,
+    limits: Optional[DecodeLimits] = None,
+) -> PBNode:
+    """
+    Decodes the DAG-PB block `buf` as :func:`ipld_dag_pb.decode` does, after
+    checking that it hashes to `cid`. Raises ValueError if it does not, even if
+    the block is also malformed.
+    """
+    if cid.codec.code != dag_pb_code:
+        raise ValueError(f"decode_verified: CID {cid} is not for a DAG-PB block")
+    if limits is not None:
+        limits.check_block_size(len(buf))
+    # slices of a memoryview share its memory, slices of bytes are copies
+    parsed = bytes(buf) if copy else memoryview(buf)
+    view = memoryview(parsed)
+    expected = cid.digest
+    code, index = decode_varint(expected, 0)
+    size, index = decode_varint(expected, index)
+    digest = expected[index:]
+
+    new_hasher = hashers.get(code)
+    hasher = new_hasher() if new_hasher is not None else None
+    head = min(len(view), chunk_size)
+    if hasher is not None:
+        hasher.update(view[:head])
+    pbn = None
+    error = None
+    try:
+        pbn = decode_node(parsed, keep_records=True, limits=limits)
+    except Exception as e:  # pylint: disable=broad-except
+        error = e
+    if hasher is not None:
+        for start in range(head, len(view), chunk_size):
+            hasher.update(view[start : start + chunk_size])
+        actual = hasher.digest()[:size]
+    else:
+        from multiformats import multihash  # pylint: disable=import-outside-toplevel
+
+        actual = multihash.digest(view, code, size=size)[index:]
+    if actual != digest:
+        raise _mismatch(cid) from error
+    if pbn is None:
+        assert error is not None
+        raise error
+    return from_raw(pbn)
+
+
+def decode_verified_many(
+    blocks: Iterable[tuple[BytesLike, "CID"]],
+    workers: Optional[int] = None,
+    copy: bool = False,
+    limits: Optional[DecodeLimits] = None,
+) -> list[PBNode]:
+    """
+    :func:`decode_verified` for a batch of `(block, cid)` pairs on a pool of
+    `workers` threads, returning the nodes in order. The first failure is
+    raised.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda item: decode_verified(item[0], item[1], copy, limits), blocks))
+
+
+class CarProblem(NamedTuple):
+    """
+    A block of a CAR file that failed verification. `offset` is the position
+    of its section in the file and `cid` its binary CID.
+    """
+
+    offset: int
+    cid: bytes
+    message: str
+
+
+class CarReport(NamedTuple):
+    """
+    The result of :func:`verify_car`. `dangling` holds the binary CIDs linked
+    from DAG-PB blocks whose blocks are not in the file (by multihash, so a
+    CIDv0 link is satisfied by a CIDv1 block), `size` the total size of the
+    blocks, and `carv2_index` a CARv2
+    IndexSorted index of its blocks.
+    """
+
+    blocks: int
+    size: int
+    problems: list[CarProblem]
+    dangling: list[bytes]
+    carv2_index: bytes
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems and not self.dangling
+
+
+class _Checked(NamedTuple):
+    blocks: int
+    size: int
+    problems: list[CarProblem]
+    entries: list[tuple[bytes, int]]
+    present: list[bytes]
+    links: list[bytes]
+
+
+def _check_block(cid: bytes, block: memoryview, links: list[bytes]) -> bytes:
+    """
+    Checks `block` against `cid`, appending the binary CIDs it links to, and
+    returns the digest of its multihash.
+    """
+    mh = cid_multihash(cid)
+    hash_code, index = decode_varint(mh, 0)
+    size, index = decode_varint(mh, index)
+    digest = bytes(mh[index:])
+    new_hasher = hashers.get(hash_code)
+    if new_hasher is not None:
+        matches = new_hasher(block).digest()[:size] == digest
+    else:
+        from multiformats import multihash  # pylint: disable=import-outside-toplevel
+
+        # multiformats keeps the frames of the exceptions it raises, and
+        # handles internally, in reference cycles: hash a copy, and release
+        # the view of the map so that it can still be closed
+        copy = bytes(block)
+        block.release()
+        block = memoryview(copy)
+        matches = multihash.digest(copy, hash_code, size=size) == bytes(mh)
+    if not matches:
+        raise ValueError("verify_car: block does not match its CID")
+    if cid_codec(cid) == dag_pb_code:
+        # one parse: decode_node() rejects what decode() would, short of the
+        # checks on link hashes that decode() does when building CIDs
+        for link in decode_node(block, fields="links").links:
+            if not hasattr(link, "hash"):
+                raise TypeError("Invalid Hash field found in link, expected CID")
+            if not _is_binary_cid(link.hash, 0, len(link.hash)):
+                raise ValueError("protobuf: (PBLink) Hash is not a binary CID")
+            links.append(bytes(link.hash))
+    return digest
+
+
+def _check_sections(view: memoryview, payload: int, offset: int, end: int) -> _Checked:
+    result = _Checked(0, 0, [], [], [], [])
+    blocks = size = 0
+    for section, cid_start, block_start, section_end in iter_section_bounds(view, offset, end):
+        cid = bytes(view[cid_start:block_start])
+        blocks += 1
+        size += section_end - block_start
+        try:
+            digest = _check_block(cid, view[block_start:section_end], result.links)
+        except Exception as e:  # pylint: disable=broad-except
+            result.problems.append(CarProblem(section, cid, str(e)))
+            # the frames of the traceback hold views of the map
+            traceback.clear_frames(e.__traceback__)
+        else:
+            result.entries.append((digest, section - payload))
+            result.present.append(bytes(cid_multihash(cid)))
+    return result._replace(blocks=blocks, size=size)
+
+
+def _check_range(path: str, payload: int, offset: int, end: int) -> _Checked:
+    """
+    Checks the sections between `offset` and `end` of the CAR file at `path`,
+    whose CARv1 payload starts at `payload`.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+            return _check_sections(view, payload, offset, end)
+
+
+def _car_ranges(path: str, size: int) -> Iterator[tuple[int, int, int]]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise EOFError("car: empty file " + path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                start, end = data_bounds(view)
+                range_start = first_section(view, start)
+                for _, _, _, section_end in iter_section_bounds(view, range_start, end):
+                    if section_end - range_start >= size:
+                        yield (start, range_start, section_end)
+                        range_start = section_end
+                if range_start < end:
+                    yield (start, range_start, end)
+            finally:
+                view.release()
+
+
+def verify_car(
+    path: str,
+    jobs: int = 1,
+    threads: bool = False,
+    size: int = range_size,
+) -> CarReport:
+    """
+    Verifies the CAR file (version 1 or 2) at `path`: that each block matches
+    its CID, that each DAG-PB block is well-formed (as
+    :func:`ipld_dag_pb.decode` would accept it) and that every link of a
+    DAG-PB block leads to a block in the file. Ranges of about `size` bytes of
+    sections are checked on a pool of `jobs` worker processes, or threads if
+    `threads` is set; hashing releases the GIL, so threads avoid pickling the
+    results back but only scale while hashing dominates.
+
+    Malformed sections, which make the rest of the file unreadable, raise the
+    errors :func:`ipld_dag_pb.car.read_car` would.
+    """
+    started = monotonic()
+    ranges = list(_car_ranges(path, size))
+    if jobs <= 1 or len(ranges) <= 1:
+        results = [_check_range(path, *r) for r in ranges]
+    else:
+        pool: Executor = (ThreadPoolExecutor if threads else ProcessPoolExecutor)(jobs)
+        with pool:
+            results = list(pool.map(_check_range, repeat(path), *zip(*ranges)))
+
+    present = {mh for result in results for mh in result.present}
+    dangling: dict[bytes, None] = {}
+    for result in results:
+        for link in result.links:
+            mh = cid_multihash(link)
+            # identity multihashes hold the block themselves
+            if mh[0] != 0 and bytes(mh) not in present:
+                dangling[link] = None
+    return CarReport(
+        sum(result.blocks for result in results),
+        sum(result.size for result in results),
+        [problem for result in results for problem in result.problems],
+        list(dangling),
+        encode_index_sorted(entry for result in results for entry in result.entries),
+        monotonic() - started,
+    )
+
+
+def write_carv2(path: str, out_path: str, index: bytes) -> None:
+    """
+    Writes the CARv1 payload of the CAR file at `path` to `out_path` as a
+    CARv2 file with `index`, e.g. a :attr:`CarReport.carv2_index`.
+    """
+    data_offset = len(carv2_pragma) + carv2_header_size
+    with open(path, "rb") as f, open(out_path, "wb") as out:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+            start, end = data_bounds(view)
+        out.write(encode_carv2_header(data_offset, end - start, data_offset + end - start))
+        f.seek(start)
+        remaining = end - start
+        while remaining:
+            chunk = f.read(min(remaining, range_size))
+            if not chunk:
+                raise EOFError("car: unexpected end of file " + path)
+            out.write(chunk)
+            remaining -= len(chunk)
+        out.write(index)
@@ -0,0 +1,13 @@
+import pytest
+
+from ipld_dag_pb import backend
+
+
+@pytest.fixture(params=["python", "native"])
+def codec_backend(request, monkeypatch):
+    """Runs a test against both the pure-Python and compiled codecs."""
+    if request.param == "python":
+        monkeypatch.setattr(backend, "speedups", None)
+    elif backend.speedups is None:
+        pytest.skip("compiled accelerator is not built")
+    return request.param
@@ -0,0 +1,70 @@
+import io
+
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb import code, encode, prepare
+from ipld_dag_pb.arena import BlockArena
+from ipld_dag_pb.car import encode_header, read_car
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+nodes = [
+    prepare(b""),
+    prepare(b"some data"),
+    prepare({"data": bytes(5000), "links": [{"hash": a_cid, "name": "a", "t_size": 1}]}),
+] + [prepare(bytes([i]) * i) for i in range(50)]
+
+
+def test_blocks():
+    arena = BlockArena(capacity=0)
+    for i, node in enumerate(nodes):
+        assert arena.append(node) == i
+    assert len(arena) == len(nodes)
+    assert bytes(arena.view()) == b"".join(bytes(encode(n)) for n in nodes)
+    assert arena.size == len(arena.view())
+    for i, node in enumerate(nodes):
+        assert bytes(arena.block(i)) == bytes(encode(node))
+    with pytest.raises(ValueError, match="CAR mode"):
+        arena.cid(0)
+
+
+def test_car_sections():
+    arena = BlockArena(car=True)
+    for node in nodes:
+        arena.append(node)
+    out = io.BytesIO()
+    out.write(encode_header([arena.cid(0)]))
+    assert arena.write_to(out) == arena.size
+
+    sections = list(read_car(out.getvalue()))
+    assert len(sections) == len(nodes)
+    for i, (section, node) in enumerate(zip(sections, nodes)):
+        block = bytes(encode(node))
+        assert bytes(section.block) == block
+        assert bytes(section.cid) == bytes(arena.cid(i))
+        cid = CID.decode(bytes(section.cid))
+        assert cid.version == 1 and cid.codec.code == code
+        assert cid.digest == multihash.digest(block, "sha2-256")
+
+
+def test_views_survive_growth_and_clear():
+    arena = BlockArena(capacity=0)
+    arena.append(nodes[1])
+    first = arena.block(0)
+    arena.append(nodes[2])  # grows past the minimum capacity
+    assert bytes(first) == bytes(encode(nodes[1]))
+    arena.clear()
+    assert len(arena) == 0 and arena.size == 0
+    arena.append(nodes[0])
+    assert bytes(arena.view()) == bytes(encode(nodes[0]))
+
+
+def test_invalid_node():
+    arena = BlockArena()
+    bad = prepare(b"")
+    bad.data = "not bytes"  # type: ignore[assignment]
+    with pytest.raises(TypeError, match="data must be bytes"):
+        arena.append(bad)
+    assert len(arena) == 0 and arena.size == 0
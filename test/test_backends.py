@@ -0,0 +1,214 @@
+import random
+
+import pytest
+
+from ipld_dag_pb import backend
+from ipld_dag_pb.decode import (
+    DecodeLimits,
+    _decode_link,
+    _decode_node,
+    _decode_node_partial,
+    _validate_bytes,
+)
+from ipld_dag_pb.encode import _encode_into, _encode_node
+from ipld_dag_pb.node import PBLink, RawPBLink, RawPBNode
+from ipld_dag_pb.util import _link_comparator
+
+speedups = backend.speedups
+pytestmark = pytest.mark.skipif(
+    speedups is None, reason="compiled accelerator is not built"
+)
+
+# vectors from test_compat.py, test_pb.py and test_basics.py
+vectors = [
+    "",
+    "0a00",
+    "0a050001020304",
+    "1200",
+    "12000a050001020304",
+    "12020a00",
+    "120b0a09015500050001020304",
+    "12021200",
+    "120d0a090155000500010203041200",
+    "120b1209736f6d65206e616d65",
+    "12160a090155000500010203041209736f6d65206e616d65",
+    "12021800",
+    "120d0a090155000500010203041800",
+    "120318f207",
+    "12140a0901550005000102030418ffffffffffffff0f",
+    "12140a09015500050001020304188080808080808010",
+    "0a040802180612240a221220cf92fdefcdc34cac009c8b05eb662be0618db9de55ecd42785e9ec"
+    "6712f8df6512240a221220cf92fdefcdc34cac009c8b05eb662be0618db9de55ecd42785e9ec67"
+    "12f8df65",
+    "12390a221220b4397c02da5513563d33eef894bf68f2ccdf1bdfc14a976956ab3d1c72f735a012"
+    "0e617564696f5f6f6e6c792e6d346118cda88f0b12310a221220025c13fcd1a885df444f64a4a8"
+    "2a26aea867b1148c68cb671e83589f971149321208636861742e74787418e40712340a2212205d"
+    "44a305b9b328ab80451d0daa72a12a7bf2763c5f8bbe327597a31ee40d1e48120c706c61796261"
+    "636b2e6d3375187412360a2212202539ed6e85f2a6f9097db9d76cffd49bf3042eb2e3e8e9af4a"
+    "3ce842d49dea22120a7a6f6f6d5f302e6d70341897fb8592010a020801",
+]
+
+
+def outcome(fn, *args):
+    try:
+        return ("ok", describe(fn(*args)))
+    except Exception as e:  # pylint: disable=broad-except
+        return (type(e), str(e))
+
+
+def describe(value):
+    if isinstance(value, RawPBNode):
+        return (
+            describe(getattr(value, "data", None)),
+            [describe(l) for l in value.links],
+        )
+    if isinstance(value, RawPBLink):
+        return {k: describe(v) for k, v in sorted(vars(value).items())}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return (type(value), bytes(value))
+    return value
+
+
+def mutations(rnd: random.Random, buf: bytes):
+    yield buf
+    for _ in range(40):
+        b = bytearray(buf)
+        op = rnd.randrange(4)
+        if op == 0 and b:
+            b[rnd.randrange(len(b))] = rnd.randrange(256)
+        elif op == 1 and b:
+            del b[rnd.randrange(len(b)):]
+        elif op == 2:
+            i = rnd.randrange(len(b) + 1)
+            b[i:i] = bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 4)))
+        else:
+            b = bytearray(rnd.randbytes(rnd.randrange(24)))
+        yield bytes(b)
+
+
+def test_decode_matches_python():
+    rnd = random.Random(1234)
+    for vector in vectors:
+        for buf in mutations(rnd, bytes.fromhex(vector)):
+            for form in (buf, bytearray(buf), memoryview(buf)):
+                for keep_records in (False, True):
+                    assert outcome(speedups.decode_node, form, keep_records) == outcome(
+                        _decode_node, form, keep_records
+                    ), buf.hex()
+            assert outcome(speedups.decode_link, buf) == outcome(_decode_link, buf)
+
+
+def test_decode_limits_match_python():
+    rnd = random.Random(2468)
+    for vector in vectors:
+        for buf in mutations(rnd, bytes.fromhex(vector)):
+            bounds = [rnd.choice([None, 0, 1, 2, 9, 10]) for _ in range(3)]
+            args = (buf, False, *(-1 if b is None else b for b in bounds))
+            limits = DecodeLimits(None, *bounds)
+            assert outcome(speedups.decode_node, *args) == outcome(
+                _decode_node, buf, False, limits
+            ), buf.hex()
+
+
+def test_partial_decode_matches_python():
+    rnd = random.Random(4321)
+    for vector in vectors:
+        for buf in mutations(rnd, bytes.fromhex(vector)):
+            bounds = [rnd.choice([None, 0, 1, 9]) for _ in range(3)]
+            want_data = rnd.random() < 0.5
+            link_slice = slice(*(rnd.choice([None, -2, -1, 0, 1, 2]) for _ in range(3)))
+            keep_records = rnd.random() < 0.5
+            args = (buf, keep_records, *(-1 if b is None else b for b in bounds))
+            assert outcome(speedups.decode_node, *args, want_data, link_slice) == outcome(
+                _decode_node_partial, buf, keep_records, DecodeLimits(None, *bounds), want_data, link_slice
+            ), buf.hex()
+
+
+def test_validate_bytes_matches_python():
+    rnd = random.Random(1357)
+    for vector in vectors:
+        for buf in mutations(rnd, bytes.fromhex(vector)):
+            for canonical in (False, True):
+                for form in (buf, bytearray(buf), memoryview(buf)):
+                    assert outcome(speedups.validate_bytes, form, canonical) == outcome(
+                        _validate_bytes, form, canonical
+                    ), buf.hex()
+
+
+def test_decode_large_varints():
+    for suffix in ["ffffffffffffffffff01", "ffffffffffffffffff7f", "ffffffffffffffffffff01"]:
+        for prefix in ["120b18", "1a", "12020a", ""]:
+            buf = bytes.fromhex(prefix + suffix)
+            assert outcome(speedups.decode_node, buf) == outcome(_decode_node, buf)
+
+
+def test_decode_falls_back_for_other_buffers():
+    buf = memoryview(bytes.fromhex("0a050001020304")).cast("b")
+    assert speedups.decode_node(buf) is NotImplemented
+    assert speedups.decode_node([10, 0]) is NotImplemented
+
+
+def random_link(rnd: random.Random) -> RawPBLink:
+    link = RawPBLink()
+    if rnd.random() < 0.8:
+        link.hash = rnd.choice([bytes, bytearray, memoryview])(
+            rnd.randbytes(rnd.randrange(40))
+        )
+    if rnd.random() < 0.6:
+        link.name = rnd.choice(["", "a", "some name", "é中", "x" * 200, "\ud800"])
+    if rnd.random() < 0.6:
+        link.t_size = rnd.choice(
+            [0, 1, 127, 128, 2**31, 2**32, 2**53 - 1, 2**53, 2**64 - 1, -1, -300, True]
+        )
+    if rnd.random() < 0.1:
+        link.record = rnd.randbytes(rnd.randrange(10))
+    return link
+
+
+def test_encode_matches_python():
+    rnd = random.Random(5678)
+    for _ in range(2000):
+        node = RawPBNode()
+        if rnd.random() < 0.7:
+            node.data = rnd.choice([bytes, bytearray, memoryview])(
+                rnd.randbytes(rnd.randrange(300))
+            )
+        node.links = [random_link(rnd) for _ in range(rnd.randrange(5))]
+
+        def encode(fn):
+            result = fn(node)
+            return _encode_node(node) if result is NotImplemented else result
+
+        assert outcome(encode, speedups.encode_node) == outcome(_encode_node, node)
+
+
+def test_encode_into_matches_python():
+    rnd = random.Random(4321)
+    for _ in range(500):
+        node = RawPBNode()
+        if rnd.random() < 0.7:
+            node.data = rnd.randbytes(rnd.randrange(100))
+        node.links = [random_link(rnd) for _ in range(rnd.randrange(4))]
+        size = rnd.randrange(200)
+        offset = rnd.choice([0, 0, 3, -1])
+        target = rnd.choice([bytearray, bytes])
+
+        def encode_into(fn):
+            buf = target(size)
+            n = fn(node, buf, offset)
+            if n is NotImplemented:
+                n = _encode_into(node, buf, offset)
+            return (n, bytes(buf))
+
+        assert outcome(encode_into, speedups.encode_into) == outcome(
+            encode_into, _encode_into
+        )
+
+
+def test_link_comparator_matches_python():
+    rnd = random.Random(91011)
+    names = [None, "", "a", "aa", "ab", "b", "é", "ÿ", "\U0001f600", "A"]
+    for _ in range(500):
+        a = PBLink(None, rnd.choice(names), rnd.choice([None, 1]))
+        b = PBLink(None, rnd.choice(names), rnd.choice([None, 1]))
+        assert speedups.link_comparator(a, b) == _link_comparator(a, b)
@@ -1,3 +1,6 @@
+import gc
+import tracemalloc
+
 import pytest
 from multiformats import CID, multihash
 from ipld_dag_pb import decode, encode, prepare, PBNode, code
@@ -544,3 +547,119 @@ def test_bad_forms():
     # Link is not a dict
     with pytest.raises(Exception):
         encode(prepare({"links": ["not a dict"]}))
+
+
+class TestReencodeDecodedLinks:
+    block = bytes.fromhex(
+        "12390a221220b4397c02da5513563d33eef894bf68f2ccdf1bdfc14a976956ab3d1c72f735a012"
+        "0e617564696f5f6f6e6c792e6d346118cda88f0b12310a221220025c13fcd1a885df444f64a4a8"
+        "2a26aea867b1148c68cb671e83589f971149321208636861742e74787418e40712340a2212205d"
+        "44a305b9b328ab80451d0daa72a12a7bf2763c5f8bbe327597a31ee40d1e48120c706c61796261"
+        "636b2e6d3375187412360a2212202539ed6e85f2a6f9097db9d76cffd49bf3042eb2e3e8e9af4a"
+        "3ce842d49dea22120a7a6f6f6d5f302e6d70341897fb8592010a020801"
+    )
+
+    def fresh(self, node: PBNode) -> PBNode:
+        return prepare({
+            "data": node.data,
+            "links": [
+                {"hash": l.hash, "name": l.name, "t_size": l.t_size}
+                for l in node.links
+            ],
+        })
+
+    def test_unchanged_node_round_trips(self):
+        assert bytes(encode(decode(self.block))) == self.block
+
+    def test_changed_links_are_reserialized(self):
+        a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+        node = decode(self.block)
+        node.links[1].t_size = 1000
+        assert bytes(encode(node)) == bytes(encode(self.fresh(node)))
+
+        node = decode(self.block)
+        node.links[2].name = "playback.m3u8"
+        assert bytes(encode(node)) == bytes(encode(self.fresh(node)))
+
+        node = decode(self.block)
+        node.links[3].hash = a_cid
+        assert bytes(encode(node)) == bytes(encode(self.fresh(node)))
+
+        node = decode(self.block)
+        node.links.insert(1, create_link(a_cid, "b", 1))
+        assert bytes(encode(node)) == bytes(encode(self.fresh(node)))
+
+    def test_decoded_links_validate_and_compare(self):
+        node = decode(self.block)
+        assert node == self.fresh(node)
+        encode(self.fresh(node))  # passes validate()
+
+    @pytest.mark.usefixtures("codec_backend")
+    @pytest.mark.parametrize(
+        "block",
+        [
+            "120e0a09015500050001020304188000",  # non-minimal Tsize
+            "120e0a89000155000500010203041800",  # non-minimal Hash length
+            "120e8a00090155000500010203041800",  # non-minimal Hash key
+        ],
+    )
+    def test_non_canonical_links_are_reserialized(self, block):
+        assert bytes(encode(decode(bytes.fromhex(block)))).hex() == (
+            "120d0a090155000500010203041800"
+        )
+
+
+@pytest.mark.usefixtures("codec_backend")
+class TestZeroCopyDecode:
+    payload = bytes(range(256)) * 4096  # 1 MiB
+    block = bytes(encode(prepare({
+        "data": payload,
+        "links": [CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")],
+    })))
+
+    def peak_allocation(self, fn) -> int:
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            result = fn()
+            peak = tracemalloc.get_traced_memory()[1] - base
+        finally:
+            tracemalloc.stop()
+        del result
+        return peak
+
+    def test_data_is_a_view(self):
+        node = decode(self.block)
+        assert isinstance(node.data, memoryview)
+        assert node.data.obj is self.block
+        assert node.data == self.payload
+
+    def test_no_payload_sized_allocations(self):
+        decode(self.block)  # warm up caches
+        assert self.peak_allocation(lambda: decode(self.block)) < 64 * 1024
+        assert self.peak_allocation(lambda: decode(self.block, copy=True)) >= len(self.payload)
+
+    def test_buffer_released_with_node(self):
+        buf = bytearray(self.block)
+        decode(self.block)  # the first CID with a prefix goes through multiformats
+        gc.collect()
+        enabled = gc.isenabled()
+        gc.disable()  # the buffer must be released without a collection
+        try:
+            node = decode(buf)
+            assert node.links[0].hash == CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+            del node
+            buf.append(0)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def test_copy(self):
+        buf = bytearray(self.block)
+        node = decode(buf, copy=True)
+        assert isinstance(node.data, bytes)
+        buf[-1] ^= 0xFF
+        assert node.data == self.payload
+        assert bytes(encode(node)) == self.block
@@ -0,0 +1,101 @@
+import io
+import os
+
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb.blockstore import MemoryBlockstore
+from ipld_dag_pb.bloom import BloomFilter, FilteredBlockstore, ScalableBloomFilter
+from ipld_dag_pb.pack import PackBlockstore
+
+
+def keys(start, stop):
+    return [i.to_bytes(8, "big") for i in range(start, stop)]
+
+
+def fp_rate(f, n=20000):
+    return sum(key in f for key in keys(10**9, 10**9 + n)) / n
+
+
+def test_bloom_filter():
+    f = BloomFilter(5000, 0.01)
+    for key in keys(0, 5000):
+        f.add(key)
+    assert all(key in f for key in keys(0, 5000))
+    assert 0.003 < fp_rate(f) < 0.02
+    assert f.false_positive_rate == pytest.approx(0.01, rel=0.2)
+    with pytest.raises(ValueError):
+        BloomFilter(0, 0.01)
+
+
+def test_scalable_bloom_filter():
+    f = ScalableBloomFilter(initial_capacity=1000, error_rate=0.01)
+    f.update(keys(0, 30000))
+    assert len(f.filters) == 5
+    assert all(key in f for key in keys(0, 30000))
+    assert fp_rate(f) < 0.01
+    assert f.false_positive_rate < 0.01
+
+    out = io.BytesIO()
+    f.dump(out)
+    assert len(out.getvalue()) > f.size
+    loaded = ScalableBloomFilter.load(io.BytesIO(out.getvalue()))
+    assert len(loaded) == len(f) and loaded.size == f.size
+    assert all(key in loaded for key in keys(0, 30000))
+    with pytest.raises(EOFError):
+        ScalableBloomFilter.load(io.BytesIO(out.getvalue()[:-1]))
+
+
+def blocks(start, stop):
+    out = []
+    for i in range(start, stop):
+        block = i.to_bytes(4, "big") * 8
+        out.append((CID("base32", 1, "raw", multihash.digest(block, "sha2-256")), block))
+    return out
+
+
+def test_filtered_blockstore():
+    inner = MemoryBlockstore()
+    inner.put_many(blocks(0, 100))
+    store = FilteredBlockstore.rebuild(inner)
+    store.put_many(blocks(100, 200))
+    for cid, block in blocks(0, 200):
+        assert store.has(cid) and store.get(cid) == block
+    store.lookups = 0
+    for cid, _ in blocks(200, 1200):
+        assert not store.has(cid)
+        with pytest.raises(KeyError):
+            store.get(cid)
+    assert store.lookups < 10
+    # keyed by multihash, like PackBlockstore
+    cid, block = blocks(0, 1)[0]
+    assert CID("base32", 1, "dag-pb", cid.digest).digest in store.filter
+
+
+def test_persistence(tmp_path):
+    path = str(tmp_path / "bloom")
+    store = FilteredBlockstore.open(PackBlockstore(str(tmp_path / "blocks")), path)
+    store.put_many(blocks(0, 100))
+    store.close()
+    assert os.path.exists(path)
+
+    store = FilteredBlockstore.open(PackBlockstore(str(tmp_path / "blocks")), path)
+    assert not os.path.exists(path)  # until closed again
+    assert len(store.filter) == 100
+    store.put_many(blocks(100, 200))
+    store.store.flush()
+    # stopped without closing: the filter is rebuilt from the store
+    store = FilteredBlockstore.open(PackBlockstore(str(tmp_path / "blocks")), path)
+    assert len(store.filter) == 200
+    for cid, block in blocks(0, 200):
+        assert bytes(store.get(cid)) == block
+
+    # a filter saved while the store stays in use is invalidated by the next put
+    store.save()
+    assert os.path.exists(path)
+    store.put_many(blocks(200, 300))
+    assert not os.path.exists(path)
+    store.store.flush()
+    store = FilteredBlockstore.open(PackBlockstore(str(tmp_path / "blocks")), path)
+    assert len(store.filter) == 300
+    store.close()
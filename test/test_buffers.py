@@ -0,0 +1,79 @@
+import pytest
+from multiformats import CID
+
+from ipld_dag_pb import decode, encode, encode_into, prepare
+from ipld_dag_pb.buffers import BufferPool
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+node = prepare({"data": b"some data", "links": [{"hash": a_cid, "name": "a", "t_size": 3}]})
+
+
+def test_encode_into():
+    expected = bytes(encode(node))
+    buf = bytearray(b"\xff" * (len(expected) + 10))
+    assert encode_into(node, buf, 4) == len(expected)
+    assert buf[:4] == b"\xff" * 4
+    assert buf[4 : 4 + len(expected)] == expected
+    assert buf[4 + len(expected) :] == b"\xff" * 6
+    assert decode(memoryview(buf)[4 : 4 + len(expected)]) == node
+
+
+def test_encode_into_errors():
+    size = len(encode(node))
+    with pytest.raises(ValueError, match="needs " + str(size) + " bytes at offset 1"):
+        encode_into(node, bytearray(size), 1)
+    with pytest.raises(ValueError, match="offset cannot be negative"):
+        encode_into(node, bytearray(size), -1)
+    with pytest.raises(TypeError, match="read-only"):
+        encode_into(node, bytes(size))
+    with pytest.raises(TypeError, match="extraneous properties"):
+        bad = prepare(b"")
+        bad.extra = 1  # type: ignore[attr-defined]
+        encode_into(bad, bytearray(10))
+
+
+def test_size_classes():
+    pool = BufferPool(min_size=256)
+    assert [pool.size_class(n) for n in (0, 1, 256, 257, 4096, 4097)] == [
+        256, 256, 256, 512, 4096, 8192
+    ]
+    with pytest.raises(ValueError):
+        BufferPool(min_size=100)
+
+
+def test_reuse():
+    pool = BufferPool()
+    buf = pool.acquire(300)
+    assert len(buf) == 512
+    pool.release(buf)
+    assert pool.retained == 512
+    assert pool.acquire(400) is buf
+    assert pool.retained == 0
+    assert pool.acquire(400) is not buf
+
+
+def test_bounds():
+    pool = BufferPool(per_class=2, max_bytes=4096)
+    bufs = [pool.acquire(1000) for _ in range(3)]
+    for buf in bufs:
+        pool.release(buf)
+    assert pool.retained == 2048
+    pool.release(pool.acquire(4000))
+    assert pool.retained == 2048  # would exceed max_bytes
+    pool.release(bytearray(1000))  # not a size class
+    assert pool.retained == 2048
+    pool.clear()
+    assert pool.retained == 0
+
+
+def test_encoded():
+    pool = BufferPool()
+    with pool.encoded(node) as block:
+        assert bytes(block) == bytes(encode(node))
+        first = block.obj
+    with pool.encoded(prepare(b"other")) as block:
+        assert bytes(block) == bytes(encode(prepare(b"other")))
+        assert block.obj is first
+    assert pool.retained == 256
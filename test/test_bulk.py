@@ -0,0 +1,152 @@
+import random
+from array import array
+
+import pytest
+from multiformats import CID
+
+from ipld_dag_pb import encode, prepare
+from ipld_dag_pb.arena import BlockArena
+from ipld_dag_pb import bulk
+from ipld_dag_pb.bulk import scan_car, scan_links
+from ipld_dag_pb.car import encode_header
+from ipld_dag_pb.decode import decode_node
+
+from .test_backends import mutations, vectors
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+
+def corpus():
+    rnd = random.Random(37)
+    blocks = []
+    for vector in vectors:
+        blocks.extend(mutations(rnd, bytes.fromhex(vector)))
+    # multi-byte keys are valid but not handled by the lock-step scanner
+    blocks.append(bytes.fromhex("9201020a00" + "8a0100"))
+    return blocks
+
+
+def concat(blocks):
+    offsets = []
+    offset = 0
+    for block in blocks:
+        offsets.append(offset)
+        offset += len(block)
+    return b"".join(blocks), offsets, [len(b) for b in blocks]
+
+
+def expected_links(block):
+    """ The fields of a block's links from decode_node, or None if invalid. """
+    try:
+        node = decode_node(block)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    links = []
+    for link in node.links:
+        if getattr(link, "t_size", 0) >= 2**64:
+            return None
+        links.append((
+            bytes(getattr(link, "hash", b"")),
+            link.name.encode("utf-8") if hasattr(link, "name") else None,
+            getattr(link, "t_size", 0),
+            hasattr(link, "t_size"),
+        ))
+    return links
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_scan_matches_decode(vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+    blocks = [b for b in corpus() if not _bad_utf8(b)]
+    buf, offsets, lengths = concat(blocks)
+    cols = scan_links(buf, offsets, lengths, vectorized=vectorized)
+
+    i = 0
+    for block_index, block in enumerate(blocks):
+        expected = expected_links(block)
+        assert bool(cols.valid[block_index]) == (expected is not None), block.hex()
+        expected = expected or []
+        assert cols.link_count[block_index] == len(expected)
+        for hash_, name, t_size, has_t_size in expected:
+            assert cols.link_block[i] == block_index
+            h, n = cols.hash_offset[i], cols.name_offset[i]
+            assert (buf[h : h + cols.hash_length[i]] if h >= 0 else b"") == hash_
+            assert (buf[n : n + cols.name_length[i]] if n >= 0 else None) == name
+            assert cols.t_size[i] == t_size
+            assert bool(cols.has_t_size[i]) == has_t_size
+            i += 1
+    assert len(cols) == i
+
+
+def _bad_utf8(block):
+    try:
+        decode_node(block)
+    except UnicodeDecodeError:
+        return True
+    except Exception:  # pylint: disable=broad-except
+        pass
+    return False
+
+
+def test_scanners_agree():
+    numpy = pytest.importorskip("numpy")
+    buf, offsets, lengths = concat(corpus())
+    vectorized = scan_links(buf, offsets, lengths, vectorized=True)
+    python = scan_links(buf, offsets, lengths, vectorized=False)
+    for name in vars(python):
+        assert numpy.array_equal(
+            numpy.asarray(getattr(vectorized, name)),
+            numpy.asarray(getattr(python, name)).astype(getattr(vectorized, name).dtype),
+        ), name
+
+
+def test_scan_car():
+    arena = BlockArena(car=True)
+    leaf = prepare(b"leaf")
+    arena.append(leaf)
+    root = prepare({
+        "data": b"\x08\x01",
+        "links": [
+            {"hash": a_cid, "name": "a", "t_size": 10},
+            {"hash": CID.decode(bytes(arena.cid(0))), "name": "b", "t_size": 4},
+        ],
+    })
+    arena.append(root)
+    buf = encode_header([arena.cid(1)]) + bytes(arena.view())
+
+    for vectorized in ([False, True] if _has_numpy() else [False]):
+        cols = scan_car(buf, vectorized=vectorized)
+        assert list(cols.link_count) == [0, 2]
+        assert list(cols.t_size) == [10, 4]
+        assert sum(cols.t_size) == 14
+        h = int(cols.hash_offset[1])
+        assert buf[h : h + cols.hash_length[1]] == bytes(arena.cid(0))
+        assert bytes(encode(root)) == buf[cols.block_offset[1] : cols.block_offset[1] + cols.block_length[1]]
+
+
+def _has_numpy():
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        return False
+    return True
+
+
+def test_without_numpy(monkeypatch):
+    monkeypatch.setattr(bulk, "numpy", None)
+    cols = scan_links(b"\x0a\x00\x12\x00", [0, 2], [2, 2])
+    assert isinstance(cols.valid, array)
+    assert list(cols.link_count) == [0, 1]
+    with pytest.raises(ImportError):
+        scan_links(b"", [], [], vectorized=True)
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_errors(vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+    with pytest.raises(ValueError, match="differ in length"):
+        scan_links(b"", [0], [], vectorized=vectorized)
+    with pytest.raises(ValueError, match="past the end"):
+        scan_links(b"\x0a\x00", [0], [3], vectorized=vectorized)
@@ -0,0 +1,156 @@
+import io
+import json
+
+from multiformats import CID, multihash
+
+from ipld_dag_pb import encode, prepare
+from ipld_dag_pb.cli import canonical_problem, canonicalize, main, run
+from ipld_dag_pb.encode import encode_node
+from ipld_dag_pb.node import RawPBLink, RawPBNode
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+canonical = bytes(encode(prepare({
+    "data": b"\x08\x01",
+    "links": [{"hash": a_cid, "name": n, "t_size": 1} for n in ("b", "a")],
+})))
+
+data_before_links = bytes.fromhex(
+    "0a040802180612240a221220cf92fdefcdc34cac009c8b05eb662be0618db9de55ecd42785e9ec"
+    "6712f8df6512240a221220cf92fdefcdc34cac009c8b05eb662be0618db9de55ecd42785e9ec67"
+    "12f8df65"
+)
+
+# [DAG-CBOR {"roots": [], "version": 1}]
+car_header = bytes.fromhex("a265726f6f7473806776657273696f6e01")
+
+
+def unsorted_links() -> bytes:
+    node = RawPBNode()
+    node.links = []
+    for name in ("b", "a"):
+        link = RawPBLink()
+        link.hash = bytes(a_cid)
+        link.name = name
+        node.links.append(link)
+    return bytes(encode_node(node))
+
+
+def car(blocks: list[tuple[CID, bytes]]) -> bytes:
+    out = bytearray([len(car_header)]) + car_header
+    for cid, block in blocks:
+        section = bytes(cid) + block
+        out += bytes([len(section)]) + section
+    return bytes(out)
+
+
+def cid_of(block: bytes, codec: str = "dag-pb") -> CID:
+    return CID("base32", 1, codec, multihash.digest(block, "sha2-256"))
+
+
+def test_canonical_problem():
+    assert canonical_problem(canonical) is None
+    assert canonical_problem(unsorted_links()) == (
+        "protobuf: (PBNode) links are not sorted by name bytes"
+    )
+    assert canonical_problem(data_before_links) == "protobuf: (PBNode) data appears before links"
+    # non-minimal varint for the Data length
+    assert canonical_problem(bytes.fromhex("0a8000")) == "protobuf: non-minimal varint"
+    assert canonical_problem(bytes.fromhex("0a05")).startswith("invalid: ")
+
+
+def test_canonicalize():
+    assert bytes(canonicalize(canonical)) == canonical
+    assert canonical_problem(canonicalize(unsorted_links())) is None
+    assert canonical_problem(canonicalize(data_before_links)) is None
+
+
+def test_validate_files_and_car(tmp_path):
+    (tmp_path / "blocks").mkdir()
+    (tmp_path / "blocks" / "good").write_bytes(canonical)
+    (tmp_path / "blocks" / "unsorted").write_bytes(unsorted_links())
+    raw = b"raw leaf"
+    (tmp_path / "x.car").write_bytes(car([
+        (cid_of(canonical), canonical),
+        (cid_of(raw, "raw"), raw),
+        (cid_of(data_before_links), data_before_links),
+    ]))
+
+    for jobs in (1, 2):
+        out = io.StringIO()
+        progress = run("validate", [str(tmp_path)], jobs=jobs, out=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [r["valid"] for r in records] == [True, False, True, False]
+        assert records[0]["cid"] == str(cid_of(canonical))  # x.car comes first
+        assert "cid" not in records[2]
+        assert progress.blocks == 4
+        assert progress.skipped == 1
+        assert progress.failed == 2
+        assert progress.bytes == 2 * len(canonical) + len(unsorted_links()) + len(data_before_links)
+
+
+def test_main_dump_and_canonicalize(tmp_path, capsys):
+    path = tmp_path / "block"
+    path.write_bytes(canonical)
+    assert main(["dump", "-q", "-j", "1", str(path)]) == 0
+    record = json.loads(capsys.readouterr().out)
+    assert record["node"] == {
+        "Data": {"/": {"bytes": "CAE"}},
+        "Links": [
+            {"Hash": {"/": str(a_cid)}, "Name": "a", "Tsize": 1},
+            {"Hash": {"/": str(a_cid)}, "Name": "b", "Tsize": 1},
+        ],
+    }
+
+    path.write_bytes(unsorted_links())
+    assert main(["validate", "-q", "-j", "1", str(path)]) == 1
+    capsys.readouterr()
+
+    out = tmp_path / "out"
+    assert main(["canonicalize", "-q", "-j", "1", "-o", str(out), str(path)]) == 0
+    record = json.loads(capsys.readouterr().out)
+    assert record["changed"]
+    assert canonical_problem((out / record["canonical_cid"]).read_bytes()) is None
+
+
+def test_unknown_multihash_in_car(tmp_path):
+    # dag-pb CID with the unknown multihash code 0xf0
+    unknown = bytes.fromhex("0170f00104") + b"abcd"
+    (tmp_path / "x.car").write_bytes(car([(unknown, canonical), (cid_of(canonical), canonical)]))
+    for command in ("dump", "validate"):
+        out = io.StringIO()
+        progress = run(command, [str(tmp_path)], jobs=1, out=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [r["cid"] for r in records] == [unknown.hex(), str(cid_of(canonical))]
+        assert records[0]["error"].startswith("invalid CID: ")
+        assert "error" not in records[1]
+        assert progress.blocks == 2
+        assert progress.failed == 1
+    assert not records[0]["valid"]
+
+
+def test_main_verify_car(tmp_path, capsys):
+    raw = b"raw leaf"
+    path = tmp_path / "x.car"
+    path.write_bytes(car([(cid_of(canonical), canonical), (cid_of(raw, "raw"), raw)]))
+    out = tmp_path / "out"
+    assert main(["verify-car", "-q", "-j", "1", "-o", str(out), str(path)]) == 1
+    record = json.loads(capsys.readouterr().out)
+    assert record["blocks"] == 2
+    assert record["bytes"] == len(canonical) + len(raw)
+    assert record["problems"] == []
+    assert record["dangling"] == [str(a_cid)]
+    assert (out / "x.car").read_bytes().startswith(bytes.fromhex("0aa16776657273696f6e02"))
+
+    # CIDs with codes multiformats does not know are written in hex
+    unknown = b"\x01\xff\x7f" + cid_of(raw).digest
+    node = RawPBNode()
+    link = RawPBLink()
+    link.hash = unknown
+    node.links = [link]
+    root = bytes(encode_node(node))
+    path.write_bytes(car([(cid_of(root), root), (unknown, raw + b"!")]))
+    assert main(["verify-car", "-q", "-j", "1", str(path)]) == 1
+    record = json.loads(capsys.readouterr().out)
+    assert [p["cid"] for p in record["problems"]] == [unknown.hex()]
+    assert record["dangling"] == [unknown.hex()]
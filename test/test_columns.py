@@ -0,0 +1,63 @@
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb import PBLink, encode, prepare
+from ipld_dag_pb.util import cid_decoder, links_from_columns, prepare_many
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+v0 = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+cids = [CID("base32", 1, "raw", multihash.digest(bytes([i]), "sha2-256")) for i in range(6)] + [v0]
+names = ["b", "a", None, "é", "a", "ab", "aa"]
+sizes = [1, 2, None, 4, 5, 6, 7]
+
+
+def dicts():
+    return [{"hash": c, "name": n, "t_size": s} for c, n, s in zip(cids, names, sizes)]
+
+
+def test_links_from_columns():
+    expected = prepare({"links": dicts()}).links
+    assert links_from_columns(names, cids, sizes) == expected
+    assert links_from_columns(names, [bytes(c) for c in cids], sizes) == expected
+    assert links_from_columns(names, [str(c) for c in cids], sizes) == expected
+    # stable, like prepare()
+    assert [l.t_size for l in links_from_columns(names, cids, sizes) if l.name == "a"] == [2, 5]
+    assert [l.t_size for l in links_from_columns(names, cids)] == [None] * 7
+
+    ordered = [l.name for l in expected]
+    assert links_from_columns(ordered, [l.hash for l in expected], presorted=True) == [
+        PBLink(l.hash, l.name) for l in expected
+    ]
+    with pytest.raises(TypeError, match="sorted"):
+        links_from_columns(names, cids, presorted=True)
+    with pytest.raises(ValueError, match="same length"):
+        links_from_columns(names, cids[1:])
+    with pytest.raises(TypeError, match="name is not a string"):
+        links_from_columns([b"a"], cids[:1])
+    with pytest.raises(TypeError, match="t_size cannot be negative"):
+        links_from_columns(["a"], cids[:1], [-1])
+    with pytest.raises(Exception, match="hash is not a CID"):
+        links_from_columns(["a"], [None])
+
+
+def test_cid_decoder():
+    decode_cid = cid_decoder()
+    for cid in cids * 2:
+        assert decode_cid(bytes(cid)) == cid
+        assert decode_cid(memoryview(bytes(cid))).base == CID.decode(bytes(cid)).base
+    assert decode_cid(str(v0)) == v0
+    for bad in [bytes(cids[0])[:-1], b"\x02" + bytes(cids[0])[1:], b"", b"\x01\x55\x12\x80\x00"]:
+        with pytest.raises((ValueError, KeyError)):
+            decode_cid(bad)
+    with pytest.raises(KeyError):
+        decode_cid(b"\x01\xff\xff\x03\x12\x00")  # unknown codec
+
+
+def test_prepare_many():
+    forms = [{"data": b"x", "links": dicts()}, b"data", {"links": [{"hash": bytes(c)} for c in cids]}]
+    nodes = prepare_many(forms)
+    assert nodes == [prepare(form) for form in forms]
+    assert [bytes(encode(n)) for n in nodes] == [bytes(encode(prepare(f))) for f in forms]
+    with pytest.raises(TypeError):
+        prepare_many([{"links": "x"}])
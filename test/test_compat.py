@@ -11,6 +11,8 @@ from ipld_dag_pb.node import PBNode, RawPBLink, RawPBNode
 from ipld_dag_pb.util import as_link
 
 
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
 # tests mirrored in https://github.com/ipld/js-dag-pb/blob/master/test/test-compat.spec.js
 
 # Hash is raw+identity 0x0001020304 CID(bafkqabiaaebagba)
@@ -0,0 +1,118 @@
+from multiformats import CID, multihash
+
+from ipld_dag_pb import code, decode, encode, prepare
+from ipld_dag_pb.diff import Change, DagDiff
+
+
+class Store(dict):
+    def put(self, node):
+        block = bytes(encode(prepare(node)))
+        cid = CID("base32", 1, code, multihash.digest(block, "sha2-256"))
+        self[cid] = block
+        return cid
+
+    def raw(self, data):
+        cid = CID("base32", 1, "raw", multihash.digest(data, "sha2-256"))
+        self[cid] = data
+        return cid
+
+    def directory(self, entries):
+        return self.put({"links": [{"hash": h, "name": n, "t_size": 1} for n, h in entries.items()]})
+
+    def reachable(self, root):
+        seen = set()
+        stack = [root]
+        while stack:
+            cid = stack.pop()
+            if cid in seen:
+                continue
+            seen.add(cid)
+            if cid.codec.code == code:
+                stack.extend(link.hash for link in decode(self[cid]).links)
+        return seen
+
+
+def tree(store, width, depth, prefix="", overrides=None):
+    overrides = overrides or {}
+    entries = {}
+    for i in range(width):
+        name = f"{prefix}{i:02}"
+        if name in overrides:
+            entries[name] = overrides[name]
+        elif depth == 0:
+            entries[name] = store.raw(name.encode())
+        else:
+            entries[name] = tree(store, width, depth - 1, name + "-", overrides)
+    return store.directory(entries)
+
+
+def run(store, old, new):
+    fetches = []
+
+    def get(cid):
+        fetches.append(cid)
+        return store[cid]
+
+    diff = DagDiff(get, old, new, workers=4)
+    return list(diff), diff, fetches
+
+
+def test_identical():
+    store = Store()
+    root = tree(store, 4, 2)
+    changes, diff, fetches = run(store, root, root)
+    assert changes == [] and diff.missing == set() and fetches == []
+
+
+def test_deep_change_is_proportional():
+    store = Store()
+    old = tree(store, 5, 3)
+    leaf = store.raw(b"changed")
+    new = tree(store, 5, 3, overrides={"03-04-00-02": leaf})
+
+    changes, diff, fetches = run(store, old, new)
+    assert [(c.kind, c.path) for c in changes] == [
+        ("changed", "03"),
+        ("changed", "03/03-04"),
+        ("changed", "03/03-04/03-04-00"),
+        ("changed", "03/03-04/03-04-00/03-04-00-02"),
+    ]
+    assert changes[-1].new == leaf
+    # both versions of the root and the three directories above the leaf
+    assert len(fetches) == diff.fetched == 8
+    assert diff.missing == store.reachable(new) - store.reachable(old)
+
+
+def test_added_removed_and_moved():
+    store = Store()
+    docs = tree(store, 3, 1, "docs-")
+    src = tree(store, 3, 1, "src-")
+    readme = store.raw(b"readme")
+    old = store.directory({"README": readme, "docs": docs, "src": src})
+    lib = tree(store, 2, 1, "lib-")
+    new = store.directory({"README": readme, "lib": lib, "source": src})
+
+    changes, diff, fetches = run(store, old, new)
+    assert changes == [
+        Change("removed", "docs", docs, None),
+        Change("added", "lib", None, lib),
+        Change("added", "source", None, src),
+        Change("removed", "src", src, None),
+    ]
+    # the renamed directory is already held by the old DAG and is not walked
+    assert diff.missing == {new, lib} | store.reachable(lib)
+    assert diff.missing == store.reachable(new) - store.reachable(old)
+    assert src not in fetches and docs not in fetches
+
+
+def test_unnamed_links_pair_by_position():
+    store = Store()
+    chunks = [store.raw(bytes([i]) * 10) for i in range(4)]
+    old = store.put({"links": [{"hash": c, "name": "", "t_size": 10} for c in chunks]})
+    edited = chunks[:2] + [store.raw(b"new chunk")] + chunks[3:]
+    new = store.put({"links": [{"hash": c, "name": "", "t_size": 10} for c in edited]})
+
+    changes, diff, fetches = run(store, old, new)
+    assert changes == [Change("changed", "", chunks[2], edited[2])]
+    assert diff.missing == {new, edited[2]}
+    assert len(fetches) == 2
@@ -2,7 +2,9 @@ import pytest
 from ipld_dag_pb.node import PBNode, RawPBLink, RawPBNode
 from ipld_dag_pb.util import as_link
 from ipld_dag_pb.encode import encode_node
-from ipld_dag_pb.decode import decode_node
+from ipld_dag_pb.decode import DecodeLimits, decode_node
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
 
 a_cid_bytes = bytearray([1, 85, 0, 5, 0, 1, 2, 3, 4])
 
@@ -79,3 +81,39 @@ def test_encode_awkward_tsize_negative_large():
 
         encoded = encode_node(pbn)
         assert decode_node(encoded) == pbn
+
+
+def test_encode_splices_link_records():
+    expected = "12140a0901550005000102030418feffffffffffff0f"
+    decoded = decode_node(bytes.fromhex(expected), keep_records=True)
+    assert bytes(decoded.links[0].record).hex() == expected[4:]
+    assert not hasattr(decode_node(bytes.fromhex(expected)).links[0], "record")
+
+    # the record wins over the individual fields
+    decoded.links[0].t_size = 1
+    assert encode_node(decoded).hex() == expected
+
+
+def test_decode_limits():
+    node = bytes.fromhex(
+        "12160a090155000500010203041209736f6d65206e616d65"  # hash, name "some name"
+        "120b0a09015500050001020304"
+        "0a050001020304"
+    )
+    assert decode_node(node, limits=DecodeLimits(len(node), 2, 9, 9)) == decode_node(node)
+
+    with pytest.raises(ValueError, match="block size 44 exceeds limit of 43 bytes"):
+        decode_node(node, limits=DecodeLimits(max_block_size=43))
+    with pytest.raises(ValueError, match=r"\(PBNode\) more than 1 links"):
+        decode_node(node, limits=DecodeLimits(max_links=1))
+    with pytest.raises(ValueError, match=r"\(PBLink\) Name length 9 exceeds limit of 8 bytes"):
+        decode_node(node, limits=DecodeLimits(max_name_length=8))
+    with pytest.raises(ValueError, match=r"\(PBLink\) Hash length 9 exceeds limit of 0 bytes"):
+        decode_node(node, limits=DecodeLimits(max_hash_length=0))
+    with pytest.raises(ValueError, match="cannot be negative"):
+        DecodeLimits(max_links=-1)
+
+    # the length is checked before the truncated hash would be
+    with pytest.raises(ValueError, match="Hash length 1000 exceeds limit"):
+        truncated = bytes.fromhex("12040ae80700")
+        decode_node(truncated, limits=DecodeLimits(max_hash_length=10))
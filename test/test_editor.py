@@ -0,0 +1,115 @@
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb import code, decode, encode, prepare
+from ipld_dag_pb.blockstore import MemoryBlockstore
+from ipld_dag_pb.editor import DagEditor
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+
+def raw(store, data):
+    cid = CID("base32", 1, "raw", multihash.digest(data, "sha2-256"))
+    store.put(cid, data)
+    return cid
+
+
+def build(store, tree):
+    """Stores a nested dict of name -> bytes or dict, bottom-up, the slow way."""
+    links = []
+    for name, value in tree.items():
+        if isinstance(value, dict):
+            cid, size = build(store, value)
+        else:
+            cid, size = raw(store, value), len(value)
+        links.append({"hash": cid, "name": name, "t_size": size})
+    block = bytes(encode(prepare({"links": links})))
+    cid = CID("base32", 1, code, multihash.digest(block, "sha2-256"))
+    store.put(cid, block)
+    return cid, len(block) + sum(link["t_size"] for link in links)
+
+
+def listing(store, cid, path=""):
+    if cid.codec.code != code:
+        return {path: bytes(store.get(cid))}
+    out = {}
+    for link in decode(store.get(cid)).links:
+        out.update(listing(store, link.hash, f"{path}/{link.name}" if path else link.name))
+    return out
+
+
+def test_edits_match_rebuild():
+    store = MemoryBlockstore()
+    root, _ = build(store, {
+        "docs": {"a.md": b"a", "b.md": b"b", "old": {"x": b"x"}},
+        "src": {"lib": {"m.py": b"m"}, "main.py": b"main"},
+        "tmp": b"tmp",
+    })
+    before = len(store)
+
+    editor = DagEditor(store, root)
+    editor.put("src/lib/n.py", raw(store, b"n"), 1)
+    editor.put("src/lib/m.py", raw(store, b"m2"), 2)
+    editor.move("docs/old", "archive/2024/old")
+    editor.remove("tmp")
+    editor.put("docs/c.md", raw(store, b"c"), 1)
+    new_root = editor.commit()
+
+    expected, _ = build(MemoryBlockstore(), {
+        "archive": {"2024": {"old": {"x": b"x"}}},
+        "docs": {"a.md": b"a", "b.md": b"b", "c.md": b"c"},
+        "src": {"lib": {"m.py": b"m2", "n.py": b"n"}, "main.py": b"main"},
+    })
+    assert new_root == expected
+    assert editor.root == new_root
+    # root, src, src/lib, docs, archive, archive/2024 encoded once each, plus 3 raw leaves
+    assert len(store) == before + 6 + 3
+    assert listing(store, root)["tmp"] == b"tmp"  # the old DAG is untouched
+
+
+def test_t_size_is_cumulative():
+    store = MemoryBlockstore()
+    editor = DagEditor(store)
+    editor.put("a/b/c", raw(store, b"12345"), 5)
+    root = editor.commit()
+    a = decode(store.get(root)).links[0]
+    b = decode(store.get(a.hash)).links[0]
+    assert b.t_size == len(store.get(b.hash)) + 5
+    assert a.t_size == len(store.get(a.hash)) + b.t_size
+
+
+def test_batched_writes_and_discard():
+    store = MemoryBlockstore()
+    root, _ = build(store, {"a": {"b": b"b"}})
+    batches = []
+    put_many = store.put_many
+    store.put_many = lambda blocks: (batches.append(len(blocks)), put_many(blocks))
+
+    editor = DagEditor(store, root)
+    editor.put("a/c", raw(store, b"c"))
+    editor.discard()
+    assert editor.commit() == root
+    editor.remove("a/b")
+    editor.put("d", raw(store, b"d"))
+    new_root = editor.commit()
+    assert batches == [2]
+    assert listing(store, new_root) == {"d": b"d"}  # "a" is now empty
+    assert [link.name for link in decode(store.get(new_root)).links] == ["a", "d"]
+
+
+def test_errors():
+    store = MemoryBlockstore()
+    root, _ = build(store, {"a": {"b": b"b"}, "f": b"f"})
+    editor = DagEditor(store, root)
+    with pytest.raises(KeyError):
+        editor.remove("a/missing")
+    with pytest.raises(KeyError):
+        editor.move("missing", "x")
+    with pytest.raises(ValueError, match="not a DAG-PB node"):
+        editor.put("f/g", raw(store, b"g"))
+    with pytest.raises(ValueError, match="into itself"):
+        editor.move("a", "a/b/c")
+    with pytest.raises(ValueError, match="invalid path"):
+        editor.put("a//b", root)
+    # nothing above changed the DAG
+    assert editor.commit() == root
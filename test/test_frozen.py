@@ -0,0 +1,65 @@
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb import PBLink, PBNode, code, decode, encode, prepare
+from ipld_dag_pb.frozen import FrozenPBLink, FrozenPBNode
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+
+def test_frozen_node():
+    links = [FrozenPBLink(a_cid, "a", 10), FrozenPBLink(a_cid, "b")]
+    node = FrozenPBNode(bytearray(b"\x08\x01"), links)
+    expected = prepare({"data": b"\x08\x01", "links": [l._asdict() for l in links]})
+    assert node.encoded == bytes(encode(expected))
+    assert node.size == len(node.encoded)
+    assert node.cid == CID("base32", 1, code, multihash.digest(node.encoded, "sha2-256"))
+    assert node.cid is node.cid
+    assert node.data == b"\x08\x01" and node.links == tuple(links)
+    assert node.thaw() == expected
+    assert FrozenPBNode.from_node(expected) == node
+
+    thawed = node.thaw()
+    thawed.links.append(thawed.links[0])
+    assert node.links == tuple(links)  # unaffected
+    with pytest.raises(AttributeError):
+        node.data = b""  # pylint: disable=attribute-defined-outside-init
+
+    with pytest.raises(TypeError, match="sorted"):
+        FrozenPBNode(None, links[::-1])
+    assert FrozenPBNode(hashfn="sha2-512").cid.hashfun.name == "sha2-512"
+
+
+def test_from_bytes():
+    node = FrozenPBNode(b"data", [FrozenPBLink(a_cid, "x", 1)])
+    loaded = FrozenPBNode.from_bytes(memoryview(node.encoded))
+    assert loaded._links is None  # not decoded yet
+    assert loaded == node and hash(loaded) == hash(node)
+    assert loaded.links == node.links and loaded.data == b"data"
+    assert decode(loaded.encoded) == node.thaw()
+
+    with_cid = FrozenPBNode.from_bytes(node.encoded, cid=node.cid)
+    assert with_cid._cid is node.cid
+    with pytest.raises(ValueError, match="not for a DAG-PB block"):
+        FrozenPBNode.from_bytes(node.encoded, cid=CID("base32", 1, "raw", node.cid.digest))
+    with pytest.raises(EOFError):
+        FrozenPBNode.from_bytes(node.encoded[:-1])
+
+
+def test_equality_and_hashing():
+    a = FrozenPBNode(b"x")
+    b = FrozenPBNode(b"x")
+    c = FrozenPBNode(b"y")
+    assert a == b and a != c and len({a, b, c}) == 2
+    assert a.cid == b.cid
+    assert a == b  # by CID
+    assert FrozenPBNode(b"x", hashfn="sha2-512") == a  # same encoding
+    assert a != PBNode(b"x")
+
+
+def test_pbnode_default_links():
+    first = PBNode()
+    first.links.append(PBLink(a_cid))
+    assert PBNode().links == []
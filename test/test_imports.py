@@ -0,0 +1,47 @@
+import subprocess
+import sys
+from pathlib import Path
+
+root = Path(__file__).parent.parent
+
+
+def run(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=root, capture_output=True, text=True, check=True
+    )
+
+
+def import_times(code: str) -> dict[str, int]:
+    """
+    Cumulative import time in microseconds per module, from `python -X importtime`.
+    """
+    times = {}
+    for line in run("-X", "importtime", "-c", code).stderr.splitlines():
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+def test_import_does_not_load_multiformats():
+    modules = ["ipld_dag_pb", "ipld_dag_pb.arena", "ipld_dag_pb.cli", "ipld_dag_pb.editor", "ipld_dag_pb.frozen"]
+    times = import_times("import " + ", ".join(modules))
+    assert "ipld_dag_pb" in times
+    assert not [m for m in times if m.startswith("multiformats")]
+
+
+def test_raw_apis_work_without_multiformats():
+    run("-c", """
+import sys
+from ipld_dag_pb import decode, decode_node, encode, encode_node, prepare, validate_bytes
+from ipld_dag_pb.car import read_car
+
+block = encode(prepare(b"some data"))
+assert bytes(decode_node(block).data) == b"some data"
+validate_bytes(block)
+assert "multiformats" not in sys.modules
+
+# CIDs are loaded on first use
+assert decode(bytes.fromhex("120b0a09015500050001020304")).links[0].hash.version == 1
+assert "multiformats" in sys.modules
+""")
@@ -0,0 +1,87 @@
+import pytest
+from multiformats import CID
+
+from ipld_dag_pb import decode, encode, metrics, prepare
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+
+@pytest.fixture
+def enabled():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+def test_disabled_by_default():
+    metrics.reset()
+    decode(encode(prepare(b"hello")))
+    assert metrics.stats()["encode"]["nodes"] == 0
+    assert metrics.stats()["decode"]["nodes"] == 0
+
+
+def test_counters(enabled):
+    node = prepare({"data": b"some data", "links": [a_cid, {"hash": a_cid, "name": "a"}]})
+    buf = encode(node)
+    decode(buf)
+    decode(buf)
+
+    s = metrics.stats()
+    assert s["encode"]["nodes"] == 1
+    assert s["encode"]["bytes"] == len(buf)
+    assert s["encode"]["links"] == 2
+    assert s["encode"]["data_bytes"] == 11
+    assert s["encode"]["links_bytes"] == len(buf) - 11
+    assert s["encode"]["latency"]["count"] == 1
+    assert s["decode"]["nodes"] == 2
+    assert s["decode"]["bytes"] == 2 * len(buf)
+    assert sum(s["decode"]["latency"]["counts"]) == 2
+
+
+def test_errors(enabled):
+    with pytest.raises(Exception):
+        decode(bytes.fromhex("0a0500010203040a050001020304"))
+    assert metrics.stats()["decode"]["errors"] == 1
+    assert metrics.stats()["decode"]["nodes"] == 0
+
+
+def test_hooks(enabled):
+    events = []
+    metrics.add_hook(events.append)
+    try:
+        decode(encode(prepare(b"hello")))
+    finally:
+        metrics.remove_hook(events.append)
+    decode(encode(prepare(b"hello")))
+
+    assert [e.op for e in events] == ["encode", "decode"]
+    assert events[1].size == 7
+    assert events[1].data_size == 7
+    assert events[1].links_size == 0
+    assert events[1].links == 0
+    assert events[1].duration > 0
+
+
+def test_partial_decode_sizes(enabled):
+    buf = encode(prepare({"data": b"some data", "links": [a_cid, {"hash": a_cid, "name": "a"}]}))
+    events = []
+    metrics.add_hook(events.append)
+    try:
+        node = decode(buf, fields="links")
+        assert node.data is None and node.partial
+        assert bytes(decode(buf, fields="data").data) == b"some data"
+        decode(buf, link_slice=slice(1, 2))
+    finally:
+        metrics.remove_hook(events.append)
+    assert [(e.data_size, e.links_size) for e in events] == [(11, len(buf) - 11)] * 3
+
+
+def test_histogram():
+    h = metrics.Histogram((10, 100))
+    for v in (1, 10, 11, 100, 1000):
+        h.observe(v)
+    assert h.counts == [2, 2, 1]
+    assert h.count == 5
+    assert h.sum == 1122
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb import code, decode, encode, prepare
+from ipld_dag_pb.pack import PackBlockstore
+
+
+def block(i):
+    buf = bytes(encode(prepare({"data": f"block {i}".encode() * (i % 7 + 1)})))
+    return CID("base32", 1, code, multihash.digest(buf, "sha2-256")), buf
+
+
+blocks = [block(i) for i in range(300)]
+
+
+def files(path, prefix):
+    return sorted(name for name in os.listdir(path) if name.startswith(prefix))
+
+
+def test_put_get(tmp_path):
+    with PackBlockstore(str(tmp_path)) as store:
+        store.put_many(blocks)
+        store.put_many(blocks[:10])  # already stored
+        for cid, buf in blocks:
+            view = store.get(cid)
+            assert isinstance(view, memoryview) and bytes(view) == buf
+            assert bytes(decode(view).data) == bytes(decode(buf).data)
+        assert store.has(blocks[0][0])
+        missing = block(1000)[0]
+        assert not store.has(missing)
+        with pytest.raises(KeyError):
+            store.get(missing)
+        # keyed by multihash: the same bytes under another codec are found
+        raw = CID("base32", 1, "raw", blocks[0][0].digest)
+        assert bytes(store.get(raw)) == blocks[0][1]
+    assert files(tmp_path, "segment-") == ["segment-000001.pack"]
+    size = os.path.getsize(tmp_path / "segment-000001.pack")
+
+    with PackBlockstore(str(tmp_path)) as store:
+        for cid, buf in blocks:
+            assert bytes(store.get(cid)) == buf
+    assert os.path.getsize(tmp_path / "segment-000001.pack") == size
+
+
+def test_segments_and_runs(tmp_path):
+    store = PackBlockstore(str(tmp_path), segment_size=4096, max_runs=3)
+    for i in range(0, len(blocks), 30):
+        store.put_many(blocks[i : i + 30])
+        store.flush()
+    assert len(files(tmp_path, "segment-")) > 5
+    assert len(files(tmp_path, "index-")) <= 3
+    for cid, buf in blocks:
+        assert bytes(store.get(cid)) == buf
+    store.close()
+
+
+def test_recovery(tmp_path):
+    store = PackBlockstore(str(tmp_path))
+    store.put_many(blocks[:100])
+    store.flush()
+    store.put_many(blocks[100:200])
+    store.delete(blocks[0][0])
+    # crash: the last 100 blocks and the deletion were never flushed, and a
+    # section was only partly written
+    segment = tmp_path / "segment-000001.pack"
+    size = os.path.getsize(segment)
+    with open(segment, "ab") as f:
+        f.write(b"\x80\x02" + bytes(10))
+
+    recovered = PackBlockstore(str(tmp_path))
+    assert os.path.getsize(segment) == size
+    for cid, buf in blocks[:200]:
+        assert bytes(recovered.get(cid)) == buf
+    recovered.put_many(blocks[200:])
+    recovered.close()
+    with PackBlockstore(str(tmp_path)) as store:
+        for cid, buf in blocks:
+            assert bytes(store.get(cid)) == buf
+
+
+def test_truncated_run(tmp_path):
+    with PackBlockstore(str(tmp_path)) as store:
+        store.put_many(blocks[:10])
+    (run,) = files(tmp_path, "index-")
+    with open(tmp_path / run, "r+b") as f:
+        f.truncate(os.path.getsize(tmp_path / run) - 1)
+    with pytest.raises(ValueError, match="is truncated"):
+        PackBlockstore(str(tmp_path))
+
+
+def test_delete_and_compact(tmp_path):
+    store = PackBlockstore(str(tmp_path), segment_size=4096)
+    store.put_many(blocks)
+    kept = {cid for cid, _ in blocks[::10]}
+    survivor = store.get(blocks[1][0])  # a view into a segment about to go
+    for cid, _ in blocks:
+        if cid not in kept:
+            store.delete(cid)
+    store.flush()
+    before = len(files(tmp_path, "segment-"))
+
+    thread = store.compact_in_background()
+    for _ in range(20):  # reads proceed while it runs
+        for cid, buf in blocks[::10]:
+            assert bytes(store.get(cid)) == buf
+    thread.join()
+    assert len(files(tmp_path, "segment-")) < before
+    assert store.compact() == 0
+    assert bytes(survivor) == blocks[1][1]
+    for cid, buf in blocks:
+        if cid in kept:
+            assert bytes(store.get(cid)) == buf
+        else:
+            assert not store.has(cid)
+    store.close()
+
+    with PackBlockstore(str(tmp_path)) as store:
+        for cid, buf in blocks:
+            assert store.has(cid) == (cid in kept)
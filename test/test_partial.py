@@ -0,0 +1,114 @@
+import random
+
+import pytest
+from multiformats import CID
+
+from ipld_dag_pb import decode, encode, encode_into, prepare, validate_bytes
+from ipld_dag_pb.decode import DecodeLimits
+
+from .test_backends import mutations, vectors
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+slices = [slice(None), slice(0, 0), slice(2, 5), slice(-3, None), slice(None, None, -2), slice(7, 100)]
+
+
+def outcome(fn, *args, **kwargs):
+    try:
+        return ("ok", fn(*args, **kwargs))
+    except Exception as e:  # pylint: disable=broad-except
+        return (type(e), str(e))
+
+
+def directory(n):
+    links = [{"hash": a_cid, "name": f"file-{i:04}", "t_size": i} for i in range(n)]
+    return bytes(encode(prepare({"data": b"\x08\x01", "links": links})))
+
+
+def test_partial_decode():
+    buf = directory(10)
+    node = decode(buf)
+
+    data_only = decode(buf, fields="data")
+    assert bytes(data_only.data) == b"\x08\x01" and data_only.links == []
+    links_only = decode(buf, fields="links")
+    assert links_only.data is None and links_only.links == node.links
+    for s in slices:
+        assert decode(buf, link_slice=s).links == node.links[s]
+        assert decode(buf, copy=True, fields="links", link_slice=s).links == node.links[s]
+    assert decode(buf, link_slice=slice(2, 5)).data == node.data
+
+    with pytest.raises(ValueError, match="fields must be"):
+        decode(buf, fields="name")
+    with pytest.raises(ValueError, match="cannot be used with fields='data'"):
+        decode(buf, fields="data", link_slice=slice(0, 1))
+    with pytest.raises(TypeError, match="must be a slice"):
+        decode(buf, link_slice=3)
+    with pytest.raises(ValueError, match="step cannot be zero"):
+        decode(buf, link_slice=slice(None, None, 0))
+    with pytest.raises(ValueError, match="more than 9 links"):
+        decode(buf, fields="data", limits=DecodeLimits(max_links=9))
+
+
+def test_partial_nodes_are_not_encoded():
+    buf = directory(3)
+    assert not decode(buf).partial
+    for kwargs in ({"fields": "data"}, {"fields": "links"}, {"link_slice": slice(1, 2)}):
+        node = decode(buf, **kwargs)
+        assert node.partial
+        with pytest.raises(TypeError, match="only partially decoded"):
+            encode(node)
+        with pytest.raises(TypeError, match="only partially decoded"):
+            encode_into(node, bytearray(len(buf)))
+
+
+def test_skipped_links_are_checked():
+    buf = directory(3)
+    # the hash of the first link is not a CID
+    bad = buf[:4] + b"\x13" + buf[5:]
+    with pytest.raises(ValueError, match="not a binary CID"):
+        decode(bad, fields="data")
+    with pytest.raises(ValueError, match="not a binary CID"):
+        decode(bad, link_slice=slice(1, None))
+    with pytest.raises(ValueError) as e:
+        decode(bad, link_slice=slice(0, 1))  # decoded, so CID.decode() raises
+    assert str(e.value) == outcome(decode, bad)[1]
+    with pytest.raises(EOFError):
+        decode(buf[:-1], link_slice=slice(0, 1))
+
+
+def test_skipped_links_are_limited():
+    links = [{"hash": a_cid, "name": name} for name in ["a-long-name", "b", "c"]]
+    buf = bytes(encode(prepare({"links": links})))
+    names = DecodeLimits(max_name_length=10)
+    expected = outcome(decode, buf, limits=names)
+    assert expected[0] is ValueError and "Name length 11 exceeds" in expected[1]
+    assert outcome(decode, buf, limits=names, link_slice=slice(1, 2)) == expected
+    assert outcome(decode, buf, limits=names, fields="data") == expected
+    hashes = DecodeLimits(max_hash_length=33)
+    expected = outcome(decode, buf, limits=hashes)
+    assert expected[0] is ValueError and "Hash length 34 exceeds" in expected[1]
+    assert outcome(decode, buf, limits=hashes, link_slice=slice(0, 0)) == expected
+
+
+def test_matches_decode():
+    rnd = random.Random(44)
+    for vector in vectors:
+        for buf in mutations(rnd, bytes.fromhex(vector)):
+            expected = outcome(decode, buf)
+            s = rnd.choice(slices)
+            for kwargs in ({"fields": "data"}, {"fields": "links"}, {"link_slice": s}):
+                actual = outcome(decode, buf, **kwargs)
+                if expected[0] == "ok":
+                    node = expected[1]
+                    assert actual[0] == "ok", buf.hex()
+                    if "fields" not in kwargs:
+                        assert actual[1].links == node.links[s], buf.hex()
+                    elif kwargs["fields"] == "links":
+                        assert actual[1].links == node.links, buf.hex()
+                    else:
+                        assert actual[1].data == node.data, buf.hex()
+                elif actual[0] == "ok":
+                    # only CID.decode() looks up the codes of link CIDs
+                    assert outcome(validate_bytes, buf, False)[0] == "ok", buf.hex()
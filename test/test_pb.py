@@ -4,6 +4,9 @@ import pytest
 from ipld_dag_pb.decode import decode_node
 
 
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+
 class TestPBNode():
     def test_bad_wire_type(self):
         block = bytearray.fromhex("0a050001020304")  # hex string in python should be of even length
@@ -0,0 +1,41 @@
+import io
+
+from ipld_dag_pb import backend
+from ipld_dag_pb.profile import main, phase_names, phase_of, profile
+
+
+def test_phase_of():
+    assert phase_of(("a", "ipld_dag_pb.decode.decode_bytes")) == "copy"
+    assert phase_of((
+        "ipld_dag_pb.decode.decode_bytes", "ipld_dag_pb.decode.decode_varint"
+    )) == "varint"
+    assert phase_of(("ipld_dag_pb.util.has_only_attrs", "builtins.vars")) == "has_only_attrs"
+    assert phase_of(("ipld_dag_pb._decode", "multiformats.cid.CID.decode", "x")) == "cid"
+    assert phase_of(("ipld_dag_pb.encode.encode_link",)) == "other"
+
+
+def test_profile_attributes_phases():
+    speedups = backend.speedups
+    profiler = profile(["file", "directory"], iterations=1)
+    assert backend.speedups is speedups
+
+    totals = profiler.breakdown()
+    assert set(totals) == set(phase_names)
+    for phase in ("varint", "copy", "has_only_attrs", "link_comparator", "cid"):
+        assert totals[phase] > 0, phase
+
+    out = io.StringIO()
+    profiler.write_collapsed(out)
+    lines = out.getvalue().splitlines()
+    assert lines
+    for line in lines:
+        stack, weight = line.rsplit(" ", 1)
+        assert stack and int(weight) > 0
+    assert any("ipld_dag_pb.decode.decode_varint" in line for line in lines)
+
+
+def test_main(tmp_path, capsys):
+    flamegraph = tmp_path / "out.folded"
+    assert main(["--workload", "leaves", "--iterations", "1", "--flamegraph", str(flamegraph)]) == 0
+    assert "varint" in capsys.readouterr().out
+    assert flamegraph.read_text()
@@ -0,0 +1,188 @@
+import io
+import os
+
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb import code, encode, prepare
+from ipld_dag_pb.blockstore import MemoryBlockstore
+from ipld_dag_pb.pack import PackBlockstore
+from ipld_dag_pb.refcount import RefCountedBlockstore
+from ipld_dag_pb.unixfs import build_file
+
+
+def node(links, data=b""):
+    buf = bytes(encode(prepare({"data": data, "links": [{"hash": l, "name": str(i)} for i, l in enumerate(links)]})))
+    return CID("base32", 1, code, multihash.digest(buf, "sha2-256")), buf
+
+
+def raw(content):
+    return CID("base32", 1, "raw", multihash.digest(content, "sha2-256")), content
+
+
+def import_file(store, content):
+    root = build_file(io.BytesIO(content), store.put, chunk_size=100, fanout=4)
+    store.pin(root)
+    return root
+
+
+def test_collect_versions(tmp_path):
+    memory = MemoryBlockstore()
+    store = RefCountedBlockstore(memory, str(tmp_path / "refs"))
+    old = bytes(range(256)) * 20
+    new = old[:2000] + b"changed" + old[2007:]
+    v1 = import_file(store, old)
+    assert store.collect() == 0
+    blocks_v1 = set(memory.blocks)
+    v2 = import_file(store, new)
+    blocks_v2 = set(memory.blocks) - blocks_v1
+    assert store.collect() == 0
+    separately = MemoryBlockstore()
+    build_file(io.BytesIO(new), separately.put, chunk_size=100, fanout=4)
+    shared = blocks_v1 & set(separately.blocks)
+
+    store.unpin(v1)
+    assert store.collect() == len(blocks_v1 - shared) > 0
+    assert not store.has(v1) and store.has(v2)
+    assert set(memory.blocks) == shared | blocks_v2
+    assert store.collect() == 0
+
+    store.unpin(v2)
+    store.collect()
+    assert len(memory) == 0
+    store.close()
+
+
+def test_counts(tmp_path):
+    store = RefCountedBlockstore(MemoryBlockstore(), str(tmp_path))
+    a = raw(b"a")
+    b = node([a[0]])
+    c = node([a[0], b[0]])
+    store.put_many([c, b])  # parents before children are counted too
+    assert store.references(a[0]) == 2
+    assert store.references(b[0]) == 1
+    assert store.references(c[0]) == 0
+    store.put(*c)  # already stored, not counted again
+    assert store.references(b[0]) == 1
+    # a CIDv0 link counts for the block with the same multihash
+    store.put_many([node([CID("base58btc", 0, code, b[0].digest)])])
+    assert store.references(b[0]) == 2
+
+    store.pin(c[0])
+    assert store.pinned(c[0])
+    with pytest.raises(KeyError):
+        store.unpin(b[0])
+    with pytest.raises(KeyError):
+        store.delete(raw(b"missing")[0])
+    store.delete(c[0])
+    assert store.references(a[0]) == 1 and store.references(b[0]) == 1
+    malformed = CID("base32", 1, code, multihash.digest(b"\x12", "sha2-256"))
+    with pytest.raises(EOFError):
+        store.put(malformed, b"\x12")
+    assert not store.has(malformed)
+    store.close()
+
+
+def v0(cid):
+    return CID("base58btc", 0, code, cid.digest)
+
+
+def test_cid_versions(tmp_path):
+    memory = MemoryBlockstore()
+    store = RefCountedBlockstore(memory, str(tmp_path))
+    # stored under CIDv1, linked to and pinned by CIDv0, and the reverse
+    a = node([], b"a")
+    b = node([], b"b")
+    root = node([v0(a[0])])
+    store.put_many([a, (v0(b[0]), b[1]), root])
+    store.pin(v0(root[0]))
+    store.pin(b[0])
+    store.put(v0(a[0]), a[1])  # already stored under its CIDv1
+    assert len(memory) == 3
+    assert store.references(a[0]) == 1
+    assert store.has(v0(a[0])) and store.get(v0(a[0])) == a[1]
+    assert store.collect() == 0
+
+    store.unpin(root[0])
+    store.unpin(v0(b[0]))
+    assert store.collect() == 3
+    assert len(memory) == 0
+    store.close()
+
+
+class FailingBlockstore(MemoryBlockstore):
+    fail = False
+
+    def delete(self, cid):
+        if self.fail:
+            raise OSError("delete failed")
+        super().delete(cid)
+
+
+def test_collect_failure(tmp_path):
+    memory = FailingBlockstore()
+    store = RefCountedBlockstore(memory, str(tmp_path))
+    leaf = raw(b"leaf")
+    root, kept = node([leaf[0]]), node([leaf[0]], b"kept")
+    store.put_many([leaf, root, kept])
+    store.pin(kept[0])
+    memory.fail = True
+    with pytest.raises(OSError):
+        store.collect()
+    memory.fail = False
+    assert store.collect() == 1
+    assert not store.has(root[0]) and store.references(leaf[0]) == 1
+
+    # a crash: the delete logged by the failed collection is not applied twice
+    store = RefCountedBlockstore(memory, str(tmp_path))
+    assert store.references(leaf[0]) == 1
+    assert store.collect() == 0
+    store.close()
+
+
+def test_persistence_and_recovery(tmp_path):
+    path = str(tmp_path / "refs")
+    memory = MemoryBlockstore()
+    a, b = raw(b"a"), raw(b"b")
+    parent = node([a[0], b[0]])
+    with RefCountedBlockstore(memory, path) as store:
+        store.put_many([a, b, parent])
+        store.pin(parent[0])
+    assert sorted(os.listdir(path)) == ["journal-000001", "refcounts"]
+
+    store = RefCountedBlockstore(memory, path)
+    assert store.references(a[0]) == 1 and store.pinned(parent[0])
+    lost = node([a[0]], b"lost")
+    store.put(*lost)
+    kept = node([b[0]], b"kept")
+    store.put(*kept)
+    store.unpin(parent[0])
+    store.delete(parent[0])
+    # a crash: the store lost one put and did not persist the delete, and the
+    # last record was cut short
+    del memory.blocks[lost[0]]
+    memory.put(*parent)
+    journal = os.path.join(path, "journal-000001")
+    with open(journal, "ab") as f:
+        f.write(b"\x00\x00\x00\x10partial")
+
+    store = RefCountedBlockstore(memory, path)
+    assert not memory.has(parent[0])  # the delete was redone
+    assert store.references(a[0]) == 0  # the lost put was dropped
+    assert store.references(b[0]) == 1
+    assert store.collect() == 3  # a, kept and then b
+    assert len(memory) == 0
+    store.close()
+    assert sorted(os.listdir(path)) == ["journal-000003", "refcounts"]
+
+
+def test_pack_store(tmp_path):
+    store = RefCountedBlockstore(PackBlockstore(str(tmp_path / "blocks")), str(tmp_path / "refs"))
+    root = import_file(store, os.urandom(5000))
+    store.close()
+    store = RefCountedBlockstore(PackBlockstore(str(tmp_path / "blocks")), str(tmp_path / "refs"))
+    assert store.has(root) and store.collect() == 0
+    store.unpin(root)
+    assert store.collect() > 50
+    assert not store.has(root)
+    store.close()
@@ -0,0 +1,61 @@
+import pickle
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+from multiformats import CID
+
+from ipld_dag_pb import decode, encode, prepare
+from ipld_dag_pb.shared import SharedBlocks, map_blocks, map_nodes
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+
+def blocks(n):
+    return [
+        bytes(encode(prepare({"data": bytes([i]) * i, "links": [a_cid] * (i % 4)})))
+        for i in range(n)
+    ]
+
+
+def link_names(node):
+    return [str(link.hash) for link in node.links]
+
+
+def test_shared_blocks():
+    expected = blocks(20)
+    with SharedBlocks.create(expected) as shared:
+        assert len(shared) == 20
+        assert [bytes(shared[i]) for i in range(20)] == expected
+        assert bytes(shared[-1]) == expected[-1]
+        with pytest.raises(IndexError):
+            shared[20]  # pylint: disable=pointless-statement
+
+        attached = pickle.loads(pickle.dumps(shared))
+        assert attached.name == shared.name
+        node = decode(attached[3])
+        assert bytes(node.data) == b"\x03\x03\x03" and len(node.links) == 3
+        del node
+        attached.close()
+        assert bytes(shared[5]) == expected[5]  # still there
+    with pytest.raises(FileNotFoundError):
+        SharedBlocks.attach(shared.name)
+
+    with SharedBlocks.create([]) as empty:
+        assert len(empty) == 0
+
+    other = SharedMemory(create=True, size=64)
+    try:
+        with pytest.raises(ValueError, match="does not hold shared blocks"):
+            SharedBlocks.attach(other.name)
+    finally:
+        other.close()
+        other.unlink()
+
+
+def test_map():
+    expected = blocks(50)
+    assert map_blocks(len, expected, processes=2) == [len(b) for b in expected]
+    assert map_nodes(link_names, expected, processes=2, chunksize=7) == [
+        link_names(decode(b)) for b in expected
+    ]
+    assert map_nodes(link_names, [], processes=2) == []
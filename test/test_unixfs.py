@@ -0,0 +1,167 @@
+import io
+import random
+
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb import PBLink, PBNode, code, encode
+from ipld_dag_pb.blockstore import MemoryBlockstore
+from ipld_dag_pb.unixfs import (
+    UnixFSFile,
+    build_file,
+    build_file_parallel,
+    decode_data,
+    encode_data,
+    index_node,
+    type_directory,
+    type_file,
+)
+
+
+def put(store, block, codec=code):
+    cid = CID("base32", 1, codec, multihash.digest(block, "sha2-256"))
+    store.put(cid, block)
+    return cid
+
+
+def leaf(store, content, inline):
+    if inline:
+        return put(store, bytes(encode(PBNode(encode_data(type_file, content, len(content)))))), len(content)
+    return put(store, content, "raw"), len(content)
+
+
+def file_node(store, data, children):
+    sizes = [size for _, size in children]
+    unixfs = encode_data(type_file, data or None, len(data) + sum(sizes), sizes)
+    node = PBNode(unixfs, [PBLink(cid, "", size) for cid, size in children])
+    return put(store, bytes(encode(node))), len(data) + sum(sizes)
+
+
+def build(store, content, rng, fanout, chunk):
+    """Builds an unbalanced file tree, returning the root and its size."""
+    if len(content) <= chunk:
+        return leaf(store, content, rng.random() < 0.5)
+    inline = content[: rng.randrange(0, 3)] if rng.random() < 0.3 else b""
+    rest = content[len(inline):]
+    step = -(-len(rest) // fanout)
+    children = [build(store, rest[i:i + step], rng, fanout, chunk) for i in range(0, len(rest), step)]
+    return file_node(store, inline, children)
+
+
+def test_data_roundtrip():
+    buf = encode_data(type_file, b"abc", 300, [100, 200])
+    assert decode_data(buf) == (type_file, b"abc", 300, [100, 200])
+    packed = bytes([0x08, 0x02, 0x22, 0x03, 0x64, 0xC8, 0x01])
+    assert decode_data(packed).blocksizes == [100, 200]
+
+
+def test_random_ranges():
+    rng = random.Random(7)
+    store = MemoryBlockstore()
+    content = rng.randbytes(50_000)
+    root, size = build(store, content, rng, fanout=5, chunk=700)
+
+    f = UnixFSFile(store.get, root)
+    assert f.size == size == len(content)
+    assert f.read(0, size) == content
+    for _ in range(300):
+        offset = rng.randrange(0, size + 10)
+        length = rng.choice([0, 1, 100, 4096, 20_000])
+        assert f.read(offset, length) == content[offset:offset + length]
+
+
+def test_seek_decodes_one_path():
+    store = MemoryBlockstore()
+    block = bytes(range(256)) * 4
+    raw, _ = leaf(store, block, False)
+    level = [(raw, len(block))] * 10
+    for _ in range(3):
+        node = file_node(store, b"", level)
+        level = [node] * 10
+    root = file_node(store, b"", level)[0]
+
+    f = UnixFSFile(store.get, root, cache_size=0)
+    assert f.size == 10**4 * len(block)
+    offset = 7654 * len(block) + 321
+    assert f.read(offset, 10) == block[321:331]
+    assert f.decoded == 4 + 1  # the four nodes above the leaf, plus .size
+
+
+def test_plain_nodes_index_by_t_size():
+    store = MemoryBlockstore()
+    chunks = [b"a" * 10, b"b" * 20, b"c" * 5]
+    links = [PBLink(leaf(store, c, False)[0], "", len(c)) for c in chunks]
+    root = put(store, bytes(encode(PBNode(None, links))))
+    assert UnixFSFile(store.get, root).read(8, 25) == (b"".join(chunks))[8:33]
+
+
+def test_errors():
+    store = MemoryBlockstore()
+    a, _ = leaf(store, b"a", False)
+    with pytest.raises(ValueError, match="not a file"):
+        index_node(PBNode(encode_data(type_directory), [PBLink(a, "a", 1)]))
+    with pytest.raises(ValueError, match="blocksizes"):
+        index_node(PBNode(encode_data(type_file, None, 1, []), [PBLink(a, "", 1)]))
+    with pytest.raises(ValueError, match="Tsize"):
+        index_node(PBNode(None, [PBLink(a)]))
+
+
+def balanced(content, chunk, fanout):
+    """The balanced layout built level by level, returning the root and blocks in order."""
+    blocks = []
+
+    def add(block, codec):
+        cid = CID("base32", 1, codec, multihash.digest(block, "sha2-256"))
+        blocks.append((cid, block))
+        return cid
+
+    level = [(add(content[i:i + chunk], "raw"), len(content[i:i + chunk]), len(content[i:i + chunk]))
+             for i in range(0, max(len(content), 1), chunk)]
+    while len(level) > 1:
+        parents = []
+        for i in range(0, len(level), fanout):
+            children = level[i:i + fanout]
+            sizes = [size for _, size, _ in children]
+            node = PBNode(encode_data(type_file, None, sum(sizes), sizes),
+                          [PBLink(cid, "", t_size) for cid, _, t_size in children])
+            block = bytes(encode(node))
+            parents.append((add(block, code), sum(sizes), len(block) + sum(t for _, _, t in children)))
+        level = parents
+    return level[0][0], blocks
+
+
+@pytest.mark.parametrize("size", [0, 1, 100, 300, 301, 900, 2700, 2701, 8200, 24_301])
+def test_build_file(tmp_path, size):
+    content = random.Random(size).randbytes(size)
+    expected_root, expected_blocks = balanced(content, 100, 3)
+    built = []
+    root = build_file(io.BytesIO(content), lambda cid, block: built.append((cid, block)), 100, 3)
+    assert root == expected_root
+    # the reference puts blocks level by level, the builder as they are completed
+    assert sorted(built, key=lambda b: bytes(b[0])) == sorted(expected_blocks, key=lambda b: bytes(b[0]))
+
+    store = MemoryBlockstore()
+    store.put_many(built)
+    f = UnixFSFile(store.get, root)
+    assert f.size == size
+    assert f.read(0, size) == content
+
+    path = tmp_path / "content"
+    path.write_bytes(content)
+    for jobs, threads, height in ((2, True, 1), (3, True, 2), (2, False, 1)):
+        parallel = []
+        assert build_file_parallel(
+            str(path), lambda cid, block: parallel.append((cid, block)),
+            jobs=jobs, threads=threads, chunk_size=100, fanout=3, height=height,
+        ) == root
+        assert parallel == built
+        assert build_file_parallel(str(path), None, jobs, threads, 100, 3, height) == root
+
+
+def test_build_file_defaults():
+    content = bytes(range(256)) * 4096  # 4 chunks
+    expected_root, _ = balanced(content, 256 * 1024, 174)
+    assert build_file(io.BytesIO(content)) == expected_root
+    assert build_file(io.BytesIO(b"")) == CID("base32", 1, "raw", multihash.digest(b"", "sha2-256"))
+    with pytest.raises(ValueError, match="fanout"):
+        build_file(io.BytesIO(content), fanout=1)
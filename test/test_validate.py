@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from ipld_dag_pb import decode, validate_bytes
+from ipld_dag_pb.decode import decode_node
+from ipld_dag_pb.encode import encode_node
+
+from .test_backends import mutations, vectors
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+
+def outcome(fn, *args):
+    try:
+        fn(*args)
+        return "ok"
+    except Exception as e:  # pylint: disable=broad-except
+        return (type(e), str(e))
+
+
+def is_canonical(buf: bytes) -> bool:
+    raw = decode_node(buf)
+    names = [l.name.encode("utf-8") if hasattr(l, "name") else b"" for l in raw.links]
+    return (
+        all(names[i - 1] <= names[i] for i in range(1, len(names)))
+        and not (buf[:1] == b"\x0a" and raw.links)
+        and bytes(encode_node(raw)) == buf
+    )
+
+
+def test_matches_decode():
+    rnd = random.Random(35)
+    for vector in vectors:
+        for buf in mutations(rnd, bytes.fromhex(vector)):
+            structural = outcome(validate_bytes, buf, False)
+            expected = outcome(decode, buf)
+            if structural != expected:
+                # CID.decode() also looks up the codes, validate_bytes doesn't
+                assert expected != "ok", buf.hex()
+                assert structural == "ok" or "binary CID" in structural[1], buf.hex()
+            if expected == "ok":
+                canonical = outcome(validate_bytes, buf) == "ok"
+                assert canonical == is_canonical(buf), buf.hex()
+
+
+def link(name: bytes) -> bytes:
+    body = bytes.fromhex("0a221220") + bytes(32) + b"\x12" + bytes([len(name)]) + name
+    return b"\x12" + bytes([len(body)]) + body
+
+
+def test_canonical_errors():
+    sorted_links = link(b"a") + link(b"b")
+    validate_bytes(sorted_links)
+    validate_bytes(sorted_links + bytes.fromhex("0a00"))
+
+    unsorted = link(b"b") + link(b"a")
+    validate_bytes(unsorted, canonical=False)
+    with pytest.raises(ValueError, match="links are not sorted by name bytes"):
+        validate_bytes(unsorted)
+
+    data_first = bytes.fromhex("0a00") + sorted_links
+    validate_bytes(data_first, canonical=False)
+    with pytest.raises(ValueError, match="data appears before links"):
+        validate_bytes(data_first)
+
+    with pytest.raises(ValueError, match="non-minimal varint"):
+        validate_bytes(bytes.fromhex("0a810000"))
+    with pytest.raises(TypeError, match="Invalid Hash field"):
+        validate_bytes(bytes.fromhex("1203120161"))
+    with pytest.raises(ValueError, match="not a binary CID"):
+        validate_bytes(bytes.fromhex("12030a0100"))
+    with pytest.raises(UnicodeDecodeError):
+        validate_bytes(link(b"\xff"))
@@ -0,0 +1,157 @@
+import pytest
+from multiformats import CID, multihash
+
+from ipld_dag_pb import code, decode, encode, prepare
+from ipld_dag_pb.car import encode_header, index_lookup, read_car
+from ipld_dag_pb.decode import DecodeLimits
+from ipld_dag_pb.verify import (
+    chunk_size,
+    decode_verified,
+    decode_verified_many,
+    verify_car,
+    write_carv2,
+)
+
+pytestmark = pytest.mark.usefixtures("codec_backend")
+
+a_cid = CID.decode("QmWDtUQj38YLW8v3q4A6LwPn4vYKEbuKWpgSm6bjKW6Xfe")
+
+
+def block(data, links=0, hashfn="sha2-256", prefix="link-"):
+    links = [{"hash": a_cid, "name": f"{prefix}{i:06}", "t_size": i} for i in range(links)]
+    buf = bytes(encode(prepare({"data": data, "links": links})))
+    return buf, CID("base32", 1, code, multihash.digest(buf, hashfn))
+
+
+@pytest.mark.parametrize("hashfn", ["sha2-256", "sha2-512", "blake2b-256", "identity"])
+def test_hash_functions(hashfn):
+    buf, cid = block(b"some data", links=3, hashfn=hashfn)
+    node = decode_verified(buf, cid)
+    assert node == decode(buf)
+    with pytest.raises(ValueError, match="does not match"):
+        decode_verified(buf[:-1] + b"!", cid)
+
+
+def test_large_blocks():
+    # several hashing chunks, with the links spanning the first
+    buf, cid = block(bytes(range(256)) * 4096, links=2000, prefix="x" * 150)
+    assert len(buf) > 4 * chunk_size
+    node = decode_verified(buf, cid, copy=True)
+    assert node == decode(buf)
+    assert isinstance(node.data, bytes)
+    corrupt = bytearray(buf)
+    corrupt[-1] ^= 1
+    with pytest.raises(ValueError, match="does not match"):
+        decode_verified(corrupt, cid)
+
+
+def test_errors():
+    buf, cid = block(b"data")
+    with pytest.raises(ValueError, match="not for a DAG-PB block"):
+        decode_verified(buf, CID("base32", 1, "raw", cid.digest))
+    with pytest.raises(ValueError, match="block size"):
+        decode_verified(buf, cid, limits=DecodeLimits(max_block_size=2))
+
+    malformed = buf + b"\x12"
+    # a corrupt block is reported as a mismatch, not as malformed
+    with pytest.raises(ValueError, match="does not match"):
+        decode_verified(malformed, cid)
+    malformed_cid = CID("base32", 1, code, multihash.digest(malformed, "sha2-256"))
+    with pytest.raises(EOFError):
+        decode_verified(malformed, malformed_cid)
+
+
+def test_many():
+    blocks = [block(bytes([i]) * (i * 1000), links=i % 3) for i in range(64)]
+    nodes = decode_verified_many(blocks, workers=4)
+    assert nodes == [decode(buf) for buf, _ in blocks]
+    blocks[10] = (blocks[10][0], blocks[11][1])
+    with pytest.raises(ValueError, match="does not match"):
+        decode_verified_many(blocks, workers=4)
+
+
+def section(cid, block):
+    body = bytes(cid) + block
+    assert len(body) < 0x4000
+    return bytes([len(body) & 0x7F | 0x80, len(body) >> 7]) + body
+
+
+def car_file(path, blocks):
+    path.write_bytes(encode_header([bytes(blocks[0][1])]) + b"".join(section(c, b) for b, c in blocks))
+    return str(path)
+
+
+def test_verify_car(tmp_path):
+    raw = b"raw leaf"
+    raw_cid = CID("base32", 1, "raw", multihash.digest(raw, "sha2-256"))
+    leaves = [block(bytes([i]) * 100, hashfn="sha2-512" if i % 2 else "sha2-256") for i in range(20)]
+    links = [{"hash": cid, "name": f"{i:02}"} for i, (_, cid) in enumerate(leaves)]
+    # a CIDv0 link is satisfied by the CIDv1 block with the same multihash
+    links.append({"hash": CID("base58btc", 0, code, leaves[0][1].digest), "name": "v0"})
+    links.append({"hash": raw_cid, "name": "raw"})
+    root = bytes(encode(prepare({"links": links})))
+    blocks = [(root, CID("base32", 1, code, multihash.digest(root, "sha2-256")))]
+    blocks += leaves + [(raw, raw_cid)]
+    path = car_file(tmp_path / "good.car", blocks)
+
+    for jobs, threads in ((1, False), (3, True), (2, False)):
+        report = verify_car(path, jobs=jobs, threads=threads, size=500)
+        assert report.ok, report
+        assert report.blocks == len(blocks)
+        assert report.size == sum(len(b) for b, _ in blocks)
+
+    sections = list(read_car((tmp_path / "good.car").read_bytes()))
+    for sec in sections:
+        digest = multihash.unwrap(CID.decode(bytes(sec.cid)).digest)
+        assert index_lookup(report.carv2_index, digest) == sec.offset  # a CARv1 file is all payload
+    assert index_lookup(report.carv2_index, bytes(32)) is None
+
+    write_carv2(path, str(tmp_path / "good.car2"), report.carv2_index)
+    v2 = (tmp_path / "good.car2").read_bytes()
+    assert [(bytes(s.cid), bytes(s.block)) for s in read_car(v2)] == [
+        (bytes(s.cid), bytes(s.block)) for s in sections
+    ]
+    assert verify_car(str(tmp_path / "good.car2")).carv2_index == report.carv2_index
+
+
+def test_verify_car_problems(tmp_path):
+    leaf, leaf_cid = block(b"leaf")
+    missing = CID("base32", 1, code, multihash.digest(b"missing", "sha2-256"))
+    inline = CID("base32", 1, "raw", multihash.digest(b"inline", "identity"))
+    links = [{"hash": leaf_cid, "name": "a"}, {"hash": missing, "name": "b"}, {"hash": inline, "name": "c"}]
+    root = bytes(encode(prepare({"links": links})))
+    root_cid = CID("base32", 1, code, multihash.digest(root, "sha2-256"))
+    corrupt = leaf[:-1] + b"!"
+    malformed = b"\x12"
+    malformed_cid = CID("base32", 1, code, multihash.digest(malformed, "sha2-256"))
+    not_cid = b"\x12\x04\x0a\x02\x01\x70"  # a link whose Hash is not a CID
+    not_cid_cid = CID("base32", 1, code, multihash.digest(not_cid, "sha2-256"))
+    path = car_file(tmp_path / "bad.car", [
+        (root, root_cid), (corrupt, leaf_cid), (malformed, malformed_cid), (not_cid, not_cid_cid),
+    ])
+
+    for jobs in (1, 2):
+        report = verify_car(path, jobs=jobs, size=1)
+        assert not report.ok
+        assert report.blocks == 4
+        assert [(p.cid, p.message) for p in report.problems] == [
+            (bytes(leaf_cid), "verify_car: block does not match its CID"),
+            (bytes(malformed_cid), "protobuf: unexpected end of data"),
+            (bytes(not_cid_cid), "protobuf: (PBLink) Hash is not a binary CID"),
+        ]
+        # the corrupt leaf is not present either
+        assert report.dangling == [bytes(leaf_cid), bytes(missing)]
+        assert index_lookup(report.carv2_index, multihash.unwrap(root_cid.digest)) is not None
+        assert index_lookup(report.carv2_index, multihash.unwrap(leaf_cid.digest)) is None
+
+    # multihash codes the hashers cannot handle: not a multihash, and
+    # sha2-256-trunc254-padded
+    unsupported = [bytes.fromhex("0170f00104") + b"abcd", bytes.fromhex("0155922020") + bytes(32)]
+    path = car_file(tmp_path / "unsupported.car", [(b"abcd", c) for c in unsupported] + [(leaf, leaf_cid)])
+    report = verify_car(path)
+    assert report.blocks == 3
+    assert [p.cid for p in report.problems] == unsupported
+
+    (tmp_path / "empty.car").write_bytes(b"")
+    with pytest.raises(EOFError):
+        verify_car(str(tmp_path / "empty.car"))